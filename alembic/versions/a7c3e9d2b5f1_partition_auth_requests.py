@@ -0,0 +1,131 @@
+"""partition auth_requests by created_at
+
+Revision ID: a7c3e9d2b5f1
+Revises: 3b7e2c91d4a6
+Create Date: 2026-10-16 23:05:12.472391
+
+Таблица auth_requests становится секционированной по created_at (RANGE,
+секция на месяц: auth_requests_pYYYYMM, плюс секция по умолчанию).
+Существующие строки копируются в новые секции. Ограничения уникальности
+секционированной таблицы обязаны включать ключ секционирования, поэтому
+первичный ключ - (id, created_at), а request_id уникален вместе с created_at.
+Избыточный индекс по id удален. Будущие секции создает
+app.services.partition_service.
+
+На больших таблицах копирование идет долго и под блокировкой - такую
+миграцию стоит выполнять в окно обслуживания.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d2b5f1'
+down_revision: Union[str, None] = '3b7e2c91d4a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Сколько месяцев вперед создать секции сразу
+PREMAKE_MONTHS = 3
+
+
+def month_start(year: int, month: int) -> datetime:
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE auth_requests RENAME TO auth_requests_legacy")
+    op.execute("ALTER SEQUENCE auth_requests_id_seq OWNED BY NONE")
+    op.drop_index('ix_auth_requests_client_id', table_name='auth_requests_legacy')
+    op.drop_index('ix_auth_requests_id', table_name='auth_requests_legacy')
+    op.drop_index('ix_auth_requests_request_id', table_name='auth_requests_legacy')
+    op.drop_index('ix_auth_requests_telegram_id', table_name='auth_requests_legacy')
+    op.execute("ALTER TABLE auth_requests_legacy RENAME CONSTRAINT auth_requests_pkey TO auth_requests_legacy_pkey")
+
+    op.execute("""
+        CREATE TABLE auth_requests (
+            id INTEGER NOT NULL DEFAULT nextval('auth_requests_id_seq'),
+            request_id VARCHAR(100) NOT NULL,
+            client_id VARCHAR(100) NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            operation VARCHAR(255) NOT NULL,
+            amount VARCHAR(50),
+            status VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            approved_at TIMESTAMP WITH TIME ZONE,
+            rejected_at TIMESTAMP WITH TIME ZONE,
+            expired_at TIMESTAMP WITH TIME ZONE,
+            metadata_json TEXT,
+            CONSTRAINT auth_requests_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT uq_auth_requests_request_id_created_at UNIQUE (request_id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE auth_requests_id_seq OWNED BY auth_requests.id")
+    op.create_index('ix_auth_requests_client_id', 'auth_requests', ['client_id'], unique=False)
+    op.create_index('ix_auth_requests_telegram_id', 'auth_requests', ['telegram_id'], unique=False)
+
+    # Секции от самой старой записи до PREMAKE_MONTHS месяцев вперед
+    connection = op.get_bind()
+    oldest = connection.execute(sa.text("SELECT min(created_at) FROM auth_requests_legacy")).scalar()
+    now = datetime.now(timezone.utc)
+    start = oldest.astimezone(timezone.utc) if oldest else now
+    months = (now.year - start.year) * 12 + now.month - start.month + PREMAKE_MONTHS
+    for offset in range(months + 1):
+        lower = month_start(start.year, start.month + offset)
+        upper = month_start(lower.year, lower.month + 1)
+        op.execute(
+            f"CREATE TABLE auth_requests_p{lower:%Y%m} PARTITION OF auth_requests "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+    op.execute("CREATE TABLE auth_requests_default PARTITION OF auth_requests DEFAULT")
+
+    op.execute("""
+        INSERT INTO auth_requests (
+            id, request_id, client_id, telegram_id, operation, amount, status,
+            created_at, approved_at, rejected_at, expired_at, metadata_json
+        )
+        SELECT
+            id, request_id, client_id, telegram_id, operation, amount, status,
+            COALESCE(created_at, now()), approved_at, rejected_at, expired_at, metadata_json
+        FROM auth_requests_legacy
+    """)
+    op.drop_table('auth_requests_legacy')
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE auth_requests RENAME TO auth_requests_partitioned")
+    op.execute("ALTER SEQUENCE auth_requests_id_seq OWNED BY NONE")
+    op.drop_index('ix_auth_requests_client_id', table_name='auth_requests_partitioned')
+    op.drop_index('ix_auth_requests_telegram_id', table_name='auth_requests_partitioned')
+    op.execute("ALTER TABLE auth_requests_partitioned RENAME CONSTRAINT auth_requests_pkey TO auth_requests_partitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE auth_requests (
+            id INTEGER NOT NULL DEFAULT nextval('auth_requests_id_seq'),
+            request_id VARCHAR(100) NOT NULL,
+            client_id VARCHAR(100) NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            operation VARCHAR(255) NOT NULL,
+            amount VARCHAR(50),
+            status VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            approved_at TIMESTAMP WITH TIME ZONE,
+            rejected_at TIMESTAMP WITH TIME ZONE,
+            expired_at TIMESTAMP WITH TIME ZONE,
+            metadata_json TEXT,
+            CONSTRAINT auth_requests_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE auth_requests_id_seq OWNED BY auth_requests.id")
+    op.execute("INSERT INTO auth_requests SELECT * FROM auth_requests_partitioned")
+    op.drop_table('auth_requests_partitioned')
+
+    op.create_index(op.f('ix_auth_requests_client_id'), 'auth_requests', ['client_id'], unique=False)
+    op.create_index(op.f('ix_auth_requests_id'), 'auth_requests', ['id'], unique=False)
+    op.create_index(op.f('ix_auth_requests_request_id'), 'auth_requests', ['request_id'], unique=True)
+    op.create_index(op.f('ix_auth_requests_telegram_id'), 'auth_requests', ['telegram_id'], unique=False)
@@ -0,0 +1,34 @@
+"""client and webhook tenants
+
+Revision ID: c6d2a8e4f1b7
+Revises: b4e1f7a9c3d5
+Create Date: 2026-10-17 11:24:09.531872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6d2a8e4f1b7'
+down_revision: Union[str, None] = 'b4e1f7a9c3d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Клиенты, зарегистрированные до разделения по владельцам, принадлежат
+    # владельцу общего ключа; прежние webhook'и остаются общими (tenant NULL)
+    op.add_column('clients', sa.Column('tenant', sa.String(length=100), server_default='default', nullable=False))
+    op.create_index(op.f('ix_clients_tenant'), 'clients', ['tenant'], unique=False)
+    op.add_column('webhooks', sa.Column('tenant', sa.String(length=100), nullable=True))
+    op.create_index(op.f('ix_webhooks_tenant'), 'webhooks', ['tenant'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_webhooks_tenant'), table_name='webhooks')
+    op.drop_column('webhooks', 'tenant')
+    op.drop_index(op.f('ix_clients_tenant'), table_name='clients')
+    op.drop_column('clients', 'tenant')
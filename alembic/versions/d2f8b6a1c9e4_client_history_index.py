@@ -0,0 +1,35 @@
+"""client history index
+
+Revision ID: d2f8b6a1c9e4
+Revises: a7c3e9d2b5f1
+Create Date: 2026-10-16 23:41:07.915238
+
+Составной индекс (client_id, created_at, id) для истории запросов клиента
+с пагинацией по курсору. Одиночный индекс по client_id он заменяет.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f8b6a1c9e4'
+down_revision: Union[str, None] = 'a7c3e9d2b5f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_auth_requests_client_id_created_at',
+        'auth_requests',
+        ['client_id', 'created_at', 'id'],
+        unique=False
+    )
+    op.drop_index('ix_auth_requests_client_id', table_name='auth_requests')
+
+
+def downgrade() -> None:
+    op.create_index('ix_auth_requests_client_id', 'auth_requests', ['client_id'], unique=False)
+    op.drop_index('ix_auth_requests_client_id_created_at', table_name='auth_requests')
@@ -0,0 +1,54 @@
+import time
+from typing import Optional
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.services.admission_service import admission_controller, AdmissionController, AdmissionRejected
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware контроля допуска: запрос к ограничиваемому маршруту
+    сначала получает слот AdmissionController, иначе сразу получает 503
+    с Retry-After - до открытия сессии БД и обращений к Redis.
+    Время ответа (включая потоковую передачу тела) подстраивает лимит.
+    """
+    
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission_controller
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.admission_enabled:
+            await self.app(scope, receive, send)
+            return
+        
+        limiter = self.controller.match(scope['method'], scope['path'])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        
+        try:
+            await self.controller.admit(limiter)
+        except AdmissionRejected:
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(settings.admission_retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+        
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(time.monotonic() - started, status_code >= 500)
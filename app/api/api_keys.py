@@ -0,0 +1,113 @@
+from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel, Field, field_validator
+from loguru import logger
+
+from app.api.dependencies import AdminScopeDep
+from app.services.api_key_service import api_key_service, API_SCOPES
+from app.services.rate_limit_service import RatePolicy
+
+
+router = APIRouter(prefix="/api/v1", tags=["api-keys"])
+
+
+class ApiKeyCreate(BaseModel):
+    """Схема для выпуска API ключа"""
+    tenant: str = Field(..., max_length=100, description="Владелец ключа (интегратор)")
+    name: Optional[str] = Field(None, max_length=100, description="Описание ключа")
+    scopes: List[str] = Field(..., min_length=1, description=f"Права: {', '.join(API_SCOPES)} или *")
+    rate_limit: Optional[str] = Field(
+        None,
+        max_length=50,
+        description="Лимит владельца ключа \"rate/period[:burst]\" вместо RATE_LIMIT_API_KEY"
+    )
+    
+    @field_validator('scopes')
+    @classmethod
+    def check_scopes(cls, scopes: List[str]) -> List[str]:
+        unknown = set(scopes) - set(API_SCOPES) - {"*"}
+        if unknown:
+            raise ValueError(f"Unknown scopes: {', '.join(sorted(unknown))}")
+        return scopes
+    
+    @field_validator('rate_limit')
+    @classmethod
+    def check_rate_limit(cls, rate_limit: Optional[str]) -> Optional[str]:
+        if rate_limit:
+            try:
+                RatePolicy.parse(rate_limit)
+            except ValueError:
+                raise ValueError("rate_limit must look like rate/period[:burst]")
+        return rate_limit
+
+
+class ApiKeyResponse(BaseModel):
+    """Схема ответа с данными ключа"""
+    key_id: str
+    tenant: str
+    name: Optional[str] = None
+    scopes: List[str]
+    rate_limit: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class ApiKeyCreatedResponse(ApiKeyResponse):
+    """Схема ответа при выпуске ключа (с самим ключом)"""
+    api_key: str
+
+
+@router.post(
+    "/api-keys",
+    response_model=ApiKeyCreatedResponse,
+    status_code=status.HTTP_201_CREATED
+)
+async def create_api_key(api_key: ApiKeyCreate, _: AdminScopeDep):
+    """Выпуск API ключа. Ключ возвращается только в этом ответе"""
+    try:
+        return await api_key_service.create_key(
+            tenant=api_key.tenant,
+            scopes=api_key.scopes,
+            name=api_key.name,
+            rate_limit=api_key.rate_limit
+        )
+    except Exception as e:
+        logger.error(f"Error creating API key: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
+@router.get("/api-keys", response_model=List[ApiKeyResponse])
+async def list_api_keys(
+    _: AdminScopeDep,
+    tenant: Optional[str] = Query(None, description="Только ключи владельца")
+):
+    """Список активных ключей (без самих ключей)"""
+    try:
+        return await api_key_service.list_keys(tenant)
+    except Exception as e:
+        logger.error(f"Error listing API keys: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
+@router.delete("/api-keys/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_api_key(key_id: str, _: AdminScopeDep):
+    """Отзыв ключа во всех процессах"""
+    try:
+        revoked = await api_key_service.revoke_key(key_id)
+    except Exception as e:
+        logger.error(f"Error revoking API key: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+    
+    if not revoked:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
@@ -1,11 +1,32 @@
-from typing import Optional
+from typing import Optional, List, Dict, Any, AsyncIterator, Annotated
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, status
+import orjson
+from fastapi import APIRouter, HTTPException, Header, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from loguru import logger
 
-from app.api.dependencies import DatabaseDep, ApiKeyDep
-from app.services.auth_service import auth_service
+from app.api.dependencies import (
+    DatabaseDep,
+    AuthScopeDep,
+    AuthCreateScopeDep,
+    ClientsScopeDep,
+    AdminScopeDep,
+    enforce_rate_limit,
+    request_subjects,
+    require_client_access
+)
+from app.services.auth_service import auth_service, decode_cursor, encode_cursor
+from app.services.client_cache import client_cache
+from app.services.idempotency_service import (
+    idempotency_service,
+    request_fingerprint,
+    IdempotencyKeyReused,
+    IdempotencyInProgress
+)
+from app.services.redis_service import redis_service
+from app.services import metrics
+from app.config import settings
 
 
 router = APIRouter(prefix="/api/v1", tags=["auth"])
@@ -39,9 +60,37 @@ class AuthStatusResponse(BaseModel):
     created_at: str
     approved_at: Optional[str] = None
     rejected_at: Optional[str] = None
+    expired_at: Optional[str] = None
+    delivery_status: Optional[str] = None
     metadata: Optional[dict] = None
 
 
+class AuthRequestBatchCreate(BaseModel):
+    """Схема для пакетного создания запросов на авторизацию"""
+    requests: List[AuthRequestCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.batch_max_size,
+        description="Запросы на авторизацию"
+    )
+
+
+class AuthRequestBatchItem(BaseModel):
+    """Результат создания одного запроса в пакете"""
+    index: int
+    request_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+
+class AuthRequestBatchResponse(BaseModel):
+    """Схема ответа при пакетном создании запросов"""
+    created: int
+    failed: int
+    expires_at: str
+    results: List[AuthRequestBatchItem]
+
+
 class ClientRegister(BaseModel):
     """Схема для регистрации клиента"""
     client_id: str = Field(..., description="ID клиента в системе")
@@ -53,55 +102,172 @@ class ClientRegister(BaseModel):
     email: Optional[str] = Field(None, max_length=100)
 
 
+async def _create_auth_request(request: AuthRequestCreate) -> AuthRequestResponse:
+    """Создание запроса на авторизацию (ошибки - HTTPException)"""
+    try:
+        with metrics.CREATE_TOTAL.time():
+            # Проверяем существование клиента
+            with metrics.CREATE_CLIENT_LOOKUP.time():
+                client = await auth_service.get_client_by_id(request.client_id)
+            if not client:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Client {request.client_id} not found"
+                )
+            
+            # Проверяем соответствие telegram_id
+            if client['telegram_id'] != request.telegram_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Telegram ID does not match client info"
+                )
+            
+            # Создаем запрос на авторизацию
+            request_id = await auth_service.create_auth_request(
+                client_id=request.client_id,
+                telegram_id=request.telegram_id,
+                operation=request.operation,
+                amount=request.amount,
+                metadata=request.metadata
+            )
+            
+            expires_at = datetime.now().timestamp() + settings.auth_request_timeout
+            
+            return AuthRequestResponse(
+                request_id=request_id,
+                status="pending",
+                created_at=datetime.now().isoformat(),
+                expires_at=datetime.fromtimestamp(expires_at).isoformat()
+            )
+            
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error creating auth request: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
 @router.post("/auth/request", response_model=AuthRequestResponse)
 async def create_auth_request(
     request: AuthRequestCreate,
+    response: Response,
     db: DatabaseDep,
-    _: ApiKeyDep
+    api_key: AuthCreateScopeDep,
+    idempotency_key: Annotated[Optional[str], Header(max_length=255)] = None
 ):
-    """Создание запроса на авторизацию"""
+    """
+    Создание запроса на авторизацию.
+    
+    С заголовком Idempotency-Key повтор запроса в течение IDEMPOTENCY_TTL
+    возвращает первый ответ (заголовок Idempotent-Replayed: true), не создавая
+    второй запрос и второе сообщение в Telegram.
+    
+    Лимиты частоты по API ключу, client_id и telegram_id проверяются одним
+    обращением к Redis, при превышении - 429 с Retry-After. Повтор с тем же
+    Idempotency-Key лимиты не расходует: в ответе только их текущее состояние.
+    """
+    await require_client_access(api_key, [request.client_id])
+    subjects = request_subjects(api_key, [request])
+    
+    if not idempotency_key:
+        await enforce_rate_limit(response, subjects)
+        return await _create_auth_request(request)
+    
+    scope = api_key.tenant
+    fingerprint = request_fingerprint(request.model_dump())
     try:
-        # Проверяем существование клиента
-        client = await auth_service.get_client_by_id(request.client_id)
-        if not client:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Client {request.client_id} not found"
-            )
-        
-        # Проверяем соответствие telegram_id
-        if client['telegram_id'] != request.telegram_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Telegram ID does not match client info"
-            )
-        
-        # Создаем запрос на авторизацию
-        request_id = await auth_service.create_auth_request(
-            client_id=request.client_id,
-            telegram_id=request.telegram_id,
-            operation=request.operation,
-            amount=request.amount,
-            metadata=request.metadata
+        replay = await idempotency_service.begin(scope, idempotency_key, fingerprint)
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request body"
         )
-        
-        from app.config import settings
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress"
+        )
+    except Exception as e:
+        logger.error(f"Error checking idempotency key: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+    
+    if replay:
+        # Нулевая стоимость: заголовки RateLimit-* без списания
+        await enforce_rate_limit(response, [(subject[0], subject[1], 0, *subject[3:]) for subject in subjects])
+        return JSONResponse(
+            replay['body'],
+            status_code=replay['status_code'],
+            headers={
+                **{name: value for name, value in response.headers.items() if name.lower().startswith("ratelimit-")},
+                "Idempotent-Replayed": "true"
+            }
+        )
+    
+    try:
+        # Превышение лимита не сохраняется: повтор после Retry-After выполнится
+        await enforce_rate_limit(response, subjects)
+    except BaseException:
+        await idempotency_service.abandon(scope, idempotency_key)
+        raise
+    
+    try:
+        result = await _create_auth_request(request)
+    except HTTPException as e:
+        # Ошибки клиента сохраняем, ошибки сервера - повторяем заново
+        if e.status_code < 500:
+            await idempotency_service.complete(scope, idempotency_key, fingerprint, e.status_code, {"detail": e.detail})
+        else:
+            await idempotency_service.abandon(scope, idempotency_key)
+        raise
+    except BaseException:
+        await idempotency_service.abandon(scope, idempotency_key)
+        raise
+    
+    await idempotency_service.complete(scope, idempotency_key, fingerprint, status.HTTP_200_OK, result.model_dump())
+    return result
+
+
+@router.post("/auth/requests:batch", response_model=AuthRequestBatchResponse)
+async def create_auth_requests_batch(
+    batch: AuthRequestBatchCreate,
+    response: Response,
+    api_key: AuthCreateScopeDep
+):
+    """
+    Пакетное создание запросов на авторизацию.
+    Каждый запрос пакета расходует лимиты своих client_id и telegram_id,
+    превышение любого из них отклоняет пакет целиком (429).
+    """
+    await enforce_rate_limit(response, request_subjects(api_key, batch.requests))
+    await require_client_access(api_key, [request.client_id for request in batch.requests])
+    
+    try:
+        results = await auth_service.create_auth_requests_batch(
+            [request.model_dump() for request in batch.requests]
+        )
+        created = sum(1 for result in results if result['status'] == 'pending')
         expires_at = datetime.now().timestamp() + settings.auth_request_timeout
         
-        return AuthRequestResponse(
-            request_id=request_id,
-            status="pending",
-            created_at=datetime.now().isoformat(),
-            expires_at=datetime.fromtimestamp(expires_at).isoformat()
+        return AuthRequestBatchResponse(
+            created=created,
+            failed=len(results) - created,
+            expires_at=datetime.fromtimestamp(expires_at).isoformat(),
+            results=results
         )
         
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
     except Exception as e:
-        logger.error(f"Error creating auth request: {e}")
+        logger.error(f"Error creating auth requests batch: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error"
@@ -112,7 +278,12 @@ async def create_auth_request(
 async def get_auth_status(
     request_id: str,
     db: DatabaseDep,
-    _: ApiKeyDep
+    api_key: AuthScopeDep,
+    wait: Optional[int] = Query(
+        None,
+        ge=0,
+        description="Ожидать изменения статуса pending не дольше указанного числа секунд"
+    )
 ):
     """Получение статуса запроса на авторизацию"""
     try:
@@ -124,6 +295,15 @@ async def get_auth_status(
                 detail="Auth request not found"
             )
         
+        # Владелец проверяется до ожидания, чтобы не держать соединение для чужого запроса
+        await require_client_access(api_key, [status_info['client_id']])
+        
+        if wait and status_info['status'] == 'pending':
+            status_info = await auth_service.wait_for_request_status(
+                request_id,
+                min(wait, settings.long_poll_max_wait)
+            ) or status_info
+        
         return AuthStatusResponse(**status_info)
         
     except HTTPException:
@@ -140,9 +320,9 @@ async def get_auth_status(
 async def register_client(
     client: ClientRegister,
     db: DatabaseDep,
-    _: ApiKeyDep
+    api_key: ClientsScopeDep
 ):
-    """Регистрация нового клиента"""
+    """Регистрация нового клиента, клиент принадлежит владельцу API ключа"""
     try:
         success = await auth_service.register_client(
             client_id=client.client_id,
@@ -151,7 +331,8 @@ async def register_client(
             last_name=client.last_name,
             username=client.username,
             phone=client.phone,
-            email=client.email
+            email=client.email,
+            tenant=api_key.tenant
         )
         
         if not success:
@@ -176,9 +357,11 @@ async def register_client(
 async def get_client(
     client_id: str,
     db: DatabaseDep,
-    _: ApiKeyDep
+    api_key: ClientsScopeDep
 ):
     """Получение данных клиента"""
+    await require_client_access(api_key, [client_id])
+    
     try:
         client = await auth_service.get_client_by_id(client_id)
         
@@ -200,6 +383,111 @@ async def get_client(
         )
 
 
+async def history_page(
+    first: Optional[Dict[str, Any]],
+    rows: AsyncIterator[Dict[str, Any]],
+    limit: int
+) -> AsyncIterator[bytes]:
+    """
+    Страница истории в JSON по мере чтения строк:
+    {"items": [...], "next_cursor": "..." | null}.
+    rows читается на одну строку больше limit, чтобы узнать, есть ли продолжение.
+    """
+    yield b'{"items":['
+    count = 0
+    last = None
+    row = first
+    while row is not None:
+        if count == limit:
+            break
+        row_id = row.pop('id')
+        yield (b',' if count else b'') + orjson.dumps(row)
+        last = (row['created_at'], row_id)
+        count += 1
+        row = await anext(rows, None)
+    
+    # Дочитываем генератор, чтобы соединение вернулось в пул
+    async for _ in rows:
+        pass
+    
+    next_cursor = encode_cursor(*last) if row is not None and last else None
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b'}'
+
+
+@router.get("/client/{client_id}/requests")
+async def list_client_requests(
+    client_id: str,
+    api_key: ClientsScopeDep,
+    request_status: Optional[List[str]] = Query(None, alias="status", description="Фильтр по статусу (можно несколько)"),
+    created_from: Optional[datetime] = Query(None, description="Созданные не раньше (включительно)"),
+    created_to: Optional[datetime] = Query(None, description="Созданные раньше (не включительно)"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(100, ge=1, le=settings.history_page_max)
+):
+    """История запросов клиента, от новых к старым, с пагинацией по курсору"""
+    await require_client_access(api_key, [client_id])
+    
+    try:
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor"
+                )
+        
+        if not await auth_service.get_client_by_id(client_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Client not found"
+            )
+        
+        rows = auth_service.iter_client_requests(
+            client_id,
+            statuses=request_status,
+            created_from=created_from,
+            created_to=created_to,
+            cursor=cursor,
+            limit=limit + 1
+        )
+        # Первая строка читается до начала ответа, чтобы ошибка БД вернула 500
+        first = await anext(rows, None)
+        
+        return StreamingResponse(history_page(first, rows, limit), media_type="application/json")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing client requests: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
+@router.get("/client-cache/stats")
+async def get_client_cache_stats(_: AdminScopeDep):
+    """Счетчики попаданий и промахов кеша клиентов текущего процесса"""
+    return client_cache.get_stats()
+
+
+@router.get("/storage/memory")
+async def get_storage_memory(
+    _: AdminScopeDep,
+    sample_size: int = Query(1000, ge=1, le=100000)
+):
+    """Память Redis на один запрос авторизации (по выборке ключей)"""
+    try:
+        return await redis_service.get_memory_report(sample_size)
+    except Exception as e:
+        logger.error(f"Error building memory report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
 @router.get("/health")
 async def health_check():
     """Проверка здоровья сервиса"""
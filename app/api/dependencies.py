@@ -1,8 +1,18 @@
-from typing import Annotated
-from fastapi import Depends, HTTPException, status, Header
+from collections import Counter
+from typing import Annotated, Iterable, List, Tuple
+from fastapi import Depends, HTTPException, status, Header, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
+from loguru import logger
 from app.database.database import get_db
-from app.config import settings
+from app.services.api_key_service import api_key_service, ApiKeyInfo
+from app.services.auth_service import auth_service
+from app.services.rate_limit_service import (
+    rate_limiter,
+    rate_limit_headers,
+    RateLimitExceeded,
+    RateLimitCostExceeded
+)
+from app.services import metrics
 
 
 async def get_database() -> AsyncSession:
@@ -11,15 +21,110 @@ async def get_database() -> AsyncSession:
         yield db
 
 
-async def verify_api_key(x_api_key: Annotated[str, Header()]):
-    """Проверка API ключа"""
-    if x_api_key != settings.api_secret_key:
+async def verify_api_key(request: Request, x_api_key: Annotated[str, Header()]) -> ApiKeyInfo:
+    """
+    Проверка API ключа. Владелец ключа сохраняется в request.state.api_key
+    для метрик и лимитов.
+    """
+    try:
+        api_key = await api_key_service.verify(x_api_key)
+    except Exception as e:
+        logger.error(f"Error verifying API key: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+    
+    if api_key is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
-    return True
+    
+    request.state.api_key = api_key
+    metrics.API_REQUESTS_BY_TENANT.labels(api_key.tenant).inc()
+    return api_key
+
+
+async def enforce_rate_limit(response: Response, subjects: List[Tuple]):
+    """
+    Списание запроса по лимитам субъектов (dimension, identifier, cost[, policy]),
+    при превышении - 429, при стоимости больше burst лимита - 422
+    """
+    try:
+        result = await rate_limiter.check(subjects)
+    except RateLimitCostExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded for {e.result['dimension']}",
+            headers=rate_limit_headers(e.result)
+        )
+    response.headers.update(rate_limit_headers(result))
+
+
+async def require_client_access(api_key: ApiKeyInfo, client_ids: Iterable[str]):
+    """
+    Проверка, что клиенты зарегистрированы ключом того же владельца, иначе - 403.
+    Неизвестный клиент тоже 403, чтобы по ответу нельзя было узнать чужие client_id.
+    """
+    if api_key.allows('admin'):
+        return
+    
+    for client_id in dict.fromkeys(client_ids):
+        try:
+            tenant = await auth_service.get_client_tenant(client_id)
+        except Exception as e:
+            logger.error(f"Error checking client owner: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Internal server error"
+            )
+        
+        if tenant is None or not api_key.owns(tenant):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Client {client_id} does not belong to this API key"
+            )
+
+
+def request_subjects(api_key: ApiKeyInfo, requests: List) -> List[Tuple]:
+    """Субъекты лимитов для запросов на авторизацию: владелец ключа, клиенты и пользователи Telegram"""
+    clients = Counter(request.client_id for request in requests)
+    users = Counter(request.telegram_id for request in requests)
+    return (
+        [('api_key', api_key.tenant, len(requests), api_key.rate_limit)]
+        + [('client', client_id, count) for client_id, count in clients.items()]
+        + [('telegram', telegram_id, count) for telegram_id, count in users.items()]
+    )
+
+
+def require_scope(scope: str, rate_limit: bool = True):
+    """Зависимость: ключ с правом scope и (по умолчанию) списание лимита владельца ключа"""
+    
+    async def dependency(response: Response, api_key: Annotated[ApiKeyInfo, Depends(verify_api_key)]) -> ApiKeyInfo:
+        if not api_key.allows(scope):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"API key has no '{scope}' scope"
+            )
+        if rate_limit:
+            await enforce_rate_limit(response, [('api_key', api_key.tenant, 1, api_key.rate_limit)])
+        return api_key
+    
+    return dependency
 
 
 DatabaseDep = Annotated[AsyncSession, Depends(get_database)]
-ApiKeyDep = Annotated[bool, Depends(verify_api_key)]
+AuthScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('auth'))]
+# Без списания лимита: обработчик сам проверяет лимиты вместе с client_id и telegram_id
+AuthCreateScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('auth', rate_limit=False))]
+ClientsScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('clients'))]
+EventsScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('events'))]
+WebhooksScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('webhooks'))]
+StatsScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('stats'))]
+AdminScopeDep = Annotated[ApiKeyInfo, Depends(require_scope('admin'))]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from typing import Optional, List, Annotated
+from fastapi import APIRouter, HTTPException, Header, Query, status
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from app.api.dependencies import EventsScopeDep, require_client_access
+from app.config import settings
+from app.services.events_service import (
+    events_service,
+    EventSubscription,
+    EVENT_TYPES,
+    event_id_key
+)
+from app.services.redis_service import redis_service
+
+
+router = APIRouter(prefix="/api/v1", tags=["events"])
+
+# Размер пачки при чтении журнала событий
+REPLAY_BATCH_SIZE = 1000
+
+
+def format_sse(event: dict) -> str:
+    """Форматирование события в формате Server-Sent Events"""
+    event_type = EVENT_TYPES.get(event.get('status'), event.get('status'))
+    data = json.dumps(event, default=str)
+    return f"id: {event['id']}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+async def event_stream(client_ids: List[str], last_event_id: Optional[str]):
+    """Генератор потока событий: дочитывание журнала и живые события"""
+    subscription: EventSubscription = events_service.open_stream(client_ids)
+    last_key = event_id_key(last_event_id) if last_event_id else None
+    try:
+        yield f"retry: {settings.sse_heartbeat_interval * 1000}\n\n"
+        
+        # Возобновление: отдаем события, пропущенные после Last-Event-ID
+        while last_event_id:
+            events = await redis_service.get_events_since(last_event_id, REPLAY_BATCH_SIZE)
+            for event in events:
+                last_event_id = event['id']
+                if event.get('client_id') in subscription.client_ids:
+                    yield format_sse(event)
+            if events:
+                last_key = event_id_key(last_event_id)
+            if len(events) < REPLAY_BATCH_SIZE:
+                break
+        
+        # Живые события из общей подписки процесса
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(),
+                    settings.sse_heartbeat_interval
+                )
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            
+            if last_key and event_id_key(event['id']) <= last_key:
+                continue
+            yield format_sse(event)
+        
+        # Отстающий клиент отключается и возобновляет поток через Last-Event-ID
+        yield ": buffer overflow, reconnect with Last-Event-ID\n\n"
+        
+    finally:
+        events_service.close_stream(subscription)
+
+
+@router.get("/events/stream")
+async def stream_events(
+    api_key: EventsScopeDep,
+    client_id: Annotated[List[str], Query(description="ID клиентов, по которым нужны события")],
+    last_event_id: Annotated[Optional[str], Header()] = None
+):
+    """Поток событий изменения статуса запросов (Server-Sent Events)"""
+    await require_client_access(api_key, client_id)
+    
+    if last_event_id:
+        try:
+            event_id_key(last_event_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Last-Event-ID"
+            )
+    
+    logger.info(f"Event stream opened for clients {client_id}")
+    return StreamingResponse(
+        event_stream(client_id, last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -0,0 +1,48 @@
+from typing import Optional, List, Literal
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Query, status
+from loguru import logger
+
+from app.api.dependencies import StatsScopeDep, require_client_access
+from app.services.rollup_service import rollup_service
+
+
+router = APIRouter(prefix="/api/v1", tags=["stats"])
+
+
+@router.get("/stats")
+async def get_decision_stats(
+    api_key: StatsScopeDep,
+    client_id: Optional[List[str]] = Query(None, description="ID клиентов (по умолчанию все клиенты владельца ключа)"),
+    since: Optional[datetime] = Query(None, description="Начало интервала (по умолчанию сутки назад)"),
+    until: Optional[datetime] = Query(None, description="Конец интервала (по умолчанию сейчас)"),
+    granularity: Literal['hour', 'day', 'total'] = Query('day')
+):
+    """
+    Доли подтвержденных, отклоненных и истекших запросов, суммы и перцентили
+    времени до решения по клиентам. Строится по почасовым итогам, точность
+    границ интервала - час.
+    """
+    if client_id:
+        await require_client_access(api_key, client_id)
+    # Без client_id - клиенты владельца ключа, ключу с правом admin - все клиенты
+    tenant = None if client_id or api_key.allows('admin') else api_key.tenant
+    
+    try:
+        until = until or datetime.now(timezone.utc)
+        since = since or until - timedelta(days=1)
+        
+        items = await rollup_service.get_stats(since, until, client_id, granularity, tenant=tenant)
+        return {
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'granularity': granularity,
+            'items': items
+        }
+    
+    except Exception as e:
+        logger.error(f"Error getting decision stats: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
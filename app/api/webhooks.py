@@ -0,0 +1,94 @@
+from typing import Optional, List
+from fastapi import APIRouter, HTTPException, status
+from pydantic import BaseModel, Field, AnyHttpUrl
+from loguru import logger
+
+from app.api.dependencies import WebhooksScopeDep, require_client_access
+from app.services.api_key_service import ApiKeyInfo
+from app.services.webhook_service import webhook_service
+
+
+router = APIRouter(prefix="/api/v1", tags=["webhooks"])
+
+
+class WebhookCreate(BaseModel):
+    """Схема для регистрации webhook'а"""
+    url: AnyHttpUrl = Field(..., description="URL для уведомлений о решениях")
+    client_id: Optional[str] = Field(None, description="ID клиента (по умолчанию - все клиенты)")
+
+
+class WebhookResponse(BaseModel):
+    """Схема ответа с данными webhook'а"""
+    id: int
+    url: str
+    client_id: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class WebhookCreatedResponse(WebhookResponse):
+    """Схема ответа при регистрации webhook'а (с секретом подписи)"""
+    secret: str
+
+
+def _webhook_tenant(api_key: ApiKeyInfo) -> Optional[str]:
+    """Владелец webhook'ов ключа: None для ключа с правом admin (все владельцы)"""
+    return None if api_key.allows('admin') else api_key.tenant
+
+
+@router.post(
+    "/webhooks",
+    response_model=WebhookCreatedResponse,
+    status_code=status.HTTP_201_CREATED
+)
+async def register_webhook(webhook: WebhookCreate, api_key: WebhooksScopeDep):
+    """
+    Регистрация URL для уведомлений о решениях. Без client_id webhook получает
+    события всех клиентов владельца ключа (ключу с правом admin - всех клиентов).
+    """
+    if webhook.client_id:
+        await require_client_access(api_key, [webhook.client_id])
+    
+    try:
+        return await webhook_service.register_webhook(
+            str(webhook.url),
+            webhook.client_id,
+            tenant=_webhook_tenant(api_key)
+        )
+    except Exception as e:
+        logger.error(f"Error registering webhook: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
+@router.get("/webhooks", response_model=List[WebhookResponse])
+async def list_webhooks(api_key: WebhooksScopeDep):
+    """Список зарегистрированных webhook'ов владельца ключа"""
+    try:
+        return await webhook_service.list_webhooks(_webhook_tenant(api_key))
+    except Exception as e:
+        logger.error(f"Error listing webhooks: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
+@router.delete("/webhooks/{webhook_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_webhook(webhook_id: int, api_key: WebhooksScopeDep):
+    """Отключение webhook'а владельца ключа"""
+    try:
+        deleted = await webhook_service.delete_webhook(webhook_id, _webhook_tenant(api_key))
+    except Exception as e:
+        logger.error(f"Error deleting webhook: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+    
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Webhook not found"
+        )
@@ -1,49 +1,81 @@
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.redis import RedisStorage
 from loguru import logger
 from app.config import settings
 from app.services.redis_service import redis_service
+from app.services.redis_backend import create_client
 
 
 # Создаем экземпляр бота
+# (через локальный Bot API сервер, если он задан в настройках)
 bot = Bot(
     token=settings.bot_token,
+    session=AiohttpSession(
+        api=TelegramAPIServer.from_base(settings.telegram_api_server)
+    ) if settings.telegram_api_server else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
 # Создаем диспетчер с Redis хранилищем для FSM
-storage = RedisStorage.from_url(settings.redis_url)
+# (тот же вид развертывания Redis, что и у redis_service)
+storage = RedisStorage(redis=create_client())
 dp = Dispatcher(storage=storage)
 
 
 async def setup_bot():
-    """Настройка бота"""
+    """Настройка бота (в каждом процессе)"""
     try:
         # Подключаемся к Redis
         await redis_service.connect()
         
-        # Устанавливаем webhook
+        logger.info("Bot setup completed successfully")
+        
+    except Exception as e:
+        logger.error(f"Error setting up bot: {e}")
+        raise
+
+
+async def register_webhook():
+    """
+    Установка webhook. Выполняется одним процессом на все развертывание,
+    роутеры к этому моменту должны быть подключены к диспетчеру.
+    """
+    try:
         await bot.set_webhook(
             url=settings.full_webhook_url,
             allowed_updates=dp.resolve_used_update_types(),
-            drop_pending_updates=True
+            drop_pending_updates=settings.webhook_drop_pending_updates
         )
         
         logger.info(f"Webhook set to {settings.full_webhook_url}")
-        logger.info("Bot setup completed successfully")
         
     except Exception as e:
-        logger.error(f"Error setting up bot: {e}")
+        logger.error(f"Error setting webhook: {e}")
         raise
 
 
+async def warm_up_bot_session():
+    """
+    Открытие соединения с Bot API заранее (DNS, TLS), чтобы первая отправка
+    не платила за подключение. Ошибка не мешает запуску.
+    """
+    try:
+        await bot.get_me()
+    except Exception as e:
+        logger.warning(f"Bot API warm-up failed: {e}")
+
+
 async def shutdown_bot():
     """Завершение работы бота"""
     try:
-        # Удаляем webhook
-        await bot.delete_webhook(drop_pending_updates=True)
+        # Удаляем webhook (только если так настроено: при нескольких процессах
+        # и узлах остальные продолжают принимать обновления)
+        if settings.webhook_delete_on_shutdown:
+            await bot.delete_webhook(drop_pending_updates=True)
         
         # Отключаемся от Redis
         await redis_service.disconnect()
@@ -1,4 +1,5 @@
 import hashlib
+import time
 from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, Update
@@ -9,6 +10,7 @@ from loguru import logger
 from app.bot.keyboards import get_auth_keyboard, get_auth_result_keyboard
 from app.services.redis_service import redis_service
 from app.services.auth_service import auth_service
+from app.services import metrics
 from app.database.database import get_db
 
 
@@ -78,6 +80,8 @@ async def cmd_support(message: Message):
 @router.callback_query(F.data.startswith("auth_"))
 async def handle_auth_callback(callback: CallbackQuery):
     """Обработчик кнопок авторизации"""
+    started = time.perf_counter()
+    action = "invalid"
     try:
         # Парсим callback_data
         action, request_id = callback.data.split(":", 1)
@@ -85,10 +89,21 @@ async def handle_auth_callback(callback: CallbackQuery):
         
         logger.info(f"Auth callback: {action} for request {request_id} from user {user_id}")
         
-        # Получаем данные запроса из Redis
-        request_info = await redis_service.get_auth_request(request_id)
+        # Атомарно переводим запрос в конечный статус
+        if action == "auth_approve":
+            transition = await auth_service.approve_request(request_id, user_id)
+            result_text = "✅ <b>Операция подтверждена</b>\\n\\nВаше разрешение получено и передано в систему."
+            callback_text = "✅ Операция подтверждена"
+            
+        elif action == "auth_reject":
+            transition = await auth_service.reject_request(request_id, user_id)
+            result_text = "❌ <b>Операция отклонена</b>\\n\\nВаш отказ получен и передан в систему."
+            callback_text = "❌ Операция отклонена"
+        else:
+            await callback.answer("❌ Неизвестное действие", show_alert=True)
+            return
         
-        if not request_info:
+        if transition['result'] == 'not_found':
             await callback.answer(
                 "❌ Запрос не найден или уже обработан", 
                 show_alert=True
@@ -96,35 +111,21 @@ async def handle_auth_callback(callback: CallbackQuery):
             return
         
         # Проверяем, что пользователь имеет право отвечать на этот запрос
-        if request_info.get('telegram_id') != user_id:
+        if transition['result'] == 'forbidden':
             await callback.answer(
                 "❌ У вас нет прав на выполнение этой операции", 
                 show_alert=True
             )
             return
         
-        # Проверяем, что запрос еще не обработан
-        if request_info.get('status') != 'pending':
+        # Запрос уже обработан (в том числе параллельным нажатием)
+        if transition['result'] == 'conflict':
             await callback.answer(
-                f"❌ Запрос уже обработан со статусом: {request_info.get('status')}", 
+                f"❌ Запрос уже обработан со статусом: {transition['old_status']}", 
                 show_alert=True
             )
             return
         
-        # Обрабатываем ответ
-        if action == "auth_approve":
-            await auth_service.approve_request(request_id, user_id)
-            result_text = "✅ <b>Операция подтверждена</b>\\n\\nВаше разрешение получено и передано в систему."
-            callback_text = "✅ Операция подтверждена"
-            
-        elif action == "auth_reject":
-            await auth_service.reject_request(request_id, user_id)
-            result_text = "❌ <b>Операция отклонена</b>\\n\\nВаш отказ получен и передан в систему."
-            callback_text = "❌ Операция отклонена"
-        else:
-            await callback.answer("❌ Неизвестное действие", show_alert=True)
-            return
-        
         # Отправляем подтверждение
         await callback.answer(callback_text, show_alert=True)
         
@@ -143,6 +144,8 @@ async def handle_auth_callback(callback: CallbackQuery):
             "❌ Произошла ошибка при обработке запроса", 
             show_alert=True
         )
+    finally:
+        metrics.AUTH_CALLBACK_SECONDS.labels(action).observe(time.perf_counter() - started)
 
 
 @router.callback_query(F.data == "main_menu")
@@ -159,7 +162,7 @@ async def send_auth_request_to_user(
     operation: str,
     amount: str = None,
     client_id: str = None
-):
+) -> Message:
     """Отправка запроса на авторизацию пользователю"""
     try:
         from app.bot.bot import bot
@@ -183,13 +186,14 @@ async def send_auth_request_to_user(
 """
         
         # Отправляем сообщение с кнопками
-        await bot.send_message(
+        sent_message = await bot.send_message(
             chat_id=telegram_id,
             text=message_text,
             reply_markup=get_auth_keyboard(request_id)
         )
         
         logger.info(f"Auth request sent to user {telegram_id}")
+        return sent_message
         
     except Exception as e:
         logger.error(f"Error sending auth request to user: {e}")
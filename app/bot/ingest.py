@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List
+from aiogram.types import Update
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services import metrics
+
+
+# Сколько последних замеров хранить для расчета перцентилей
+LATENCY_WINDOW = 1000
+
+
+class UpdateQueueFull(Exception):
+    """Очередь обновлений заполнена, обновление нужно доставить повторно"""
+
+
+class UpdateIngestor:
+    """
+    Асинхронный прием обновлений Telegram.
+    
+    Webhook отвечает сразу после постановки обновления в ограниченную очередь,
+    а обработку выполняют несколько фоновых обработчиков. Повторные доставки
+    отбрасываются по update_id (отметка в Redis с коротким TTL). Если очередь
+    заполнена, отметка снимается и webhook отвечает 503 - Telegram доставит
+    обновление повторно.
+    """
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {
+            'received': 0,
+            'duplicates': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0
+        }
+    
+    async def start(self, workers: int = settings.update_workers):
+        """Запуск обработчиков очереди обновлений"""
+        if self._workers:
+            return
+        
+        self._queue = asyncio.Queue(maxsize=settings.update_queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        logger.info(f"Update ingestion started with {workers} workers")
+    
+    async def stop(self):
+        """Обработка оставшихся обновлений и остановка обработчиков"""
+        if not self._workers:
+            return
+        
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} unprocessed updates on shutdown")
+        
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Update ingestion stopped")
+    
+    async def submit(self, update: Update) -> bool:
+        """
+        Прием обновления. Возвращает False для повторной доставки,
+        UpdateQueueFull - если очередь заполнена.
+        """
+        self.stats['received'] += 1
+        if not await redis_service.claim_update(update.update_id):
+            self.stats['duplicates'] += 1
+            metrics.TELEGRAM_UPDATES_TOTAL.labels("duplicate").inc()
+            return False
+        
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            metrics.TELEGRAM_UPDATES_TOTAL.labels("rejected").inc()
+            await redis_service.release_update(update.update_id)
+            raise UpdateQueueFull()
+        metrics.TELEGRAM_UPDATES_TOTAL.labels("accepted").inc()
+        metrics.TELEGRAM_UPDATE_QUEUE_DEPTH.inc()
+        return True
+    
+    async def _worker(self):
+        from app.bot.bot import bot, dp
+        
+        while True:
+            received_at, update = await self._queue.get()
+            metrics.TELEGRAM_UPDATE_QUEUE_DEPTH.dec()
+            metrics.TELEGRAM_UPDATE_QUEUE_SECONDS.observe(time.monotonic() - received_at)
+            try:
+                with metrics.TELEGRAM_UPDATE_SECONDS.time():
+                    await dp.feed_update(bot, update)
+                self.stats['processed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                self._latencies.append(time.monotonic() - received_at)
+                self._queue.task_done()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Глубина очереди и время обработки (от приема до завершения)"""
+        latencies = sorted(self._latencies)
+        
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4)
+        
+        return {
+            **self.stats,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'queue_size': settings.update_queue_size,
+            'latency_p50_seconds': percentile(0.5),
+            'latency_p95_seconds': percentile(0.95),
+            'latency_max_seconds': round(latencies[-1], 4) if latencies else None
+        }
+
+
+# Глобальный экземпляр
+update_ingestor = UpdateIngestor()
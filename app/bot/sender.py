@@ -0,0 +1,272 @@
+import asyncio
+import json
+import random
+import time
+from typing import Optional, Dict, Any, List
+from aiogram.exceptions import TelegramRetryAfter
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services.redis_backend import hash_tag
+from app.services import metrics
+
+
+# Префикс ключей отправки. Скрипты работают с очередями, bucket и паузами
+# чатов вместе, поэтому в Redis Cluster у всех ключей общий хеш-тег
+SEND_KEY_PREFIX = hash_tag("telegram_send", "telegram_send")
+
+# Очереди отправки (ZSET задание -> время, когда его можно отправлять)
+SEND_QUEUE_HIGH_KEY = f"{SEND_KEY_PREFIX}:high"
+SEND_QUEUE_NORMAL_KEY = f"{SEND_KEY_PREFIX}:normal"
+
+# Общий на все процессы token bucket лимита Bot API
+SEND_BUCKET_KEY = f"{SEND_KEY_PREFIX}:bucket"
+
+
+# Захват одного готового задания: сначала из приоритетной очереди.
+# Задание остается в очереди с арендой до ARGV[2] на случай падения процесса.
+# KEYS - очереди в порядке приоритета; ARGV: now, lease_until
+CLAIM_SEND_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    local jobs = redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[1], 'LIMIT', 0, 1)
+    if #jobs > 0 then
+        redis.call('ZADD', key, ARGV[2], jobs[1])
+        return {key, jobs[1]}
+    end
+end
+return false
+"""
+
+
+# Получение разрешения на отправку: общий token bucket + пауза между
+# сообщениями в один чат. Время берется с сервера Redis, чтобы все процессы
+# считали одинаково.
+# KEYS[1] - bucket (HASH), KEYS[2] - время следующей отправки в чат
+# ARGV: сообщений в секунду, размер bucket, интервал для чата (мс)
+# Возвращает {'ok' | 'chat' | 'global', ожидание в мс}
+ACQUIRE_SEND_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local chat_next = tonumber(redis.call('GET', KEYS[2]) or '0')
+if chat_next > now then
+    return {'chat', chat_next - now}
+end
+
+local paused_until = tonumber(redis.call('HGET', KEYS[1], 'paused_until') or '0')
+if paused_until > now then
+    return {'global', paused_until - now}
+end
+
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at') or now)
+tokens = math.min(burst, tokens + (now - updated_at) * rate / 1000)
+
+if tokens < 1 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+    return {'global', math.ceil((1 - tokens) * 1000 / rate)}
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], 60000)
+redis.call('SET', KEYS[2], now + tonumber(ARGV[3]), 'PX', ARGV[3])
+return {'ok', 0}
+"""
+
+
+# Пауза всех отправок после ответа 429 от Bot API.
+# KEYS[1] - bucket; ARGV[1] - длительность паузы (мс)
+PAUSE_SEND_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local paused_until = now + tonumber(ARGV[1])
+if paused_until > tonumber(redis.call('HGET', KEYS[1], 'paused_until') or '0') then
+    redis.call('HSET', KEYS[1], 'paused_until', paused_until)
+    redis.call('PEXPIRE', KEYS[1], math.max(60000, tonumber(ARGV[1])))
+end
+return paused_until
+"""
+
+
+class TelegramSender:
+    """
+    Планировщик отправки запросов на авторизацию в Telegram.
+    
+    Очередь хранится в Redis и общая для всех процессов, поэтому отправки
+    переживают перезапуск. Частота ограничивается общим token bucket
+    (telegram_rate_limit сообщений в секунду) и паузой между сообщениями
+    в один чат, ответ RetryAfter приостанавливает отправку во всех процессах.
+    Статус доставки (queued, sent, failed, skipped) записывается в запрос:
+    skipped - запрос истек или обработан до отправки, сообщение не нужно.
+    """
+    
+    def __init__(self):
+        self._workers: List[asyncio.Task] = []
+        self._claim_script = None
+        self._acquire_script = None
+        self._pause_script = None
+    
+    async def start(self, workers: int = settings.telegram_sender_workers):
+        """Запуск обработчиков очереди отправки"""
+        if self._workers:
+            return
+        
+        self._claim_script = redis_service.redis.register_script(CLAIM_SEND_SCRIPT)
+        self._acquire_script = redis_service.redis.register_script(ACQUIRE_SEND_SCRIPT)
+        self._pause_script = redis_service.redis.register_script(PAUSE_SEND_SCRIPT)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        logger.info(f"Telegram sender started with {workers} workers")
+    
+    async def stop(self):
+        """Остановка обработчиков очереди отправки"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+    
+    async def enqueue(self, priority: bool = False, **message: Any):
+        """Постановка запроса на авторизацию в очередь отправки"""
+        await self.enqueue_many([message], priority=priority)
+    
+    async def enqueue_many(self, messages: List[Dict[str, Any]], priority: bool = False):
+        """Постановка пачки сообщений в очередь отправки одним запросом"""
+        key = SEND_QUEUE_HIGH_KEY if priority else SEND_QUEUE_NORMAL_KEY
+        now = time.time()
+        await redis_service.redis.zadd(
+            key,
+            {json.dumps(dict(message, attempt=0), default=str): now for message in messages}
+        )
+    
+    async def _claim(self) -> Optional[tuple]:
+        """Захват следующего готового задания"""
+        now = time.time()
+        return await self._claim_script(
+            keys=[SEND_QUEUE_HIGH_KEY, SEND_QUEUE_NORMAL_KEY],
+            args=[now, now + settings.telegram_send_lease_seconds]
+        )
+    
+    async def _acquire(self, chat_id: int) -> Optional[tuple]:
+        """
+        Запрос разрешения на отправку. Возвращает None, если можно отправлять,
+        или ('chat' | 'global', задержка в секундах): ждать может только чат
+        или все отправки (общий лимит исчерпан, пауза после 429).
+        """
+        verdict, wait_ms = await self._acquire_script(
+            keys=[SEND_BUCKET_KEY, f"{SEND_KEY_PREFIX}:chat:{chat_id}"],
+            args=[
+                settings.telegram_rate_limit,
+                settings.telegram_rate_burst,
+                int(settings.telegram_chat_interval * 1000)
+            ]
+        )
+        if verdict == 'ok':
+            return None
+        return verdict, wait_ms / 1000
+    
+    async def wait_for_slot(self, chat_id: int):
+        """
+        Ожидание слота отправки для прочих вызовов Bot API (например, правки
+        сообщений), чтобы они учитывались в общем лимите.
+        """
+        while True:
+            wait = await self._acquire(chat_id)
+            if wait is None:
+                return
+            await asyncio.sleep(wait[1])
+    
+    async def pause(self, seconds: float):
+        """Приостановка отправки во всех процессах после ответа 429"""
+        await self._pause_script(keys=[SEND_BUCKET_KEY], args=[seconds * 1000])
+    
+    async def _reschedule(self, key: str, raw_job: str, job: Dict[str, Any], delay: float):
+        """Возврат задания в очередь с задержкой"""
+        async with redis_service.pipeline() as pipe:
+            pipe.zrem(key, raw_job)
+            pipe.zadd(key, {json.dumps(job, default=str): time.time() + delay})
+            await pipe.execute()
+    
+    async def _send(self, key: str, raw_job: str) -> float:
+        """
+        Отправка захваченного задания. Задание не ждет разрешения, удерживая
+        аренду: при ожидании оно возвращается в очередь с задержкой, иначе
+        аренда могла бы истечь и задание отправил бы второй обработчик.
+        Возвращает, сколько секунд обработчику не брать новые задания.
+        """
+        from app.bot.handlers import send_auth_request_to_user
+        
+        job = json.loads(raw_job)
+        request_id = job['request_id']
+        
+        # Задание могло ждать в очереди дольше срока запроса
+        status = await redis_service.get_auth_request_status(request_id)
+        if status != 'pending':
+            metrics.TELEGRAM_SEND_TOTAL.labels("skipped").inc()
+            await redis_service.redis.zrem(key, raw_job)
+            await redis_service.update_auth_request_fields(request_id, {'delivery_status': 'skipped'})
+            logger.info(f"Auth request {request_id} is {status or 'gone'}, not sending it")
+            return 0
+        
+        wait = await self._acquire(job['telegram_id'])
+        if wait is not None:
+            scope, delay = wait
+            await self._reschedule(key, raw_job, job, delay)
+            # Общий лимит касается всех заданий: остальные тоже ждали бы
+            return delay if scope == 'global' else 0
+        
+        message = dict(job)
+        del message['attempt']
+        try:
+            with metrics.TELEGRAM_SEND_SECONDS.time():
+                sent = await send_auth_request_to_user(**message)
+        except TelegramRetryAfter as e:
+            metrics.TELEGRAM_SEND_TOTAL.labels("retry_after").inc()
+            logger.warning(f"Telegram rate limit hit, retrying in {e.retry_after}s")
+            await self.pause(e.retry_after)
+            await self._reschedule(key, raw_job, job, e.retry_after)
+            return 0
+        except Exception as e:
+            metrics.TELEGRAM_SEND_TOTAL.labels("error").inc()
+            job['attempt'] += 1
+            if job['attempt'] >= settings.telegram_send_max_attempts:
+                await redis_service.redis.zrem(key, raw_job)
+                await redis_service.update_auth_request_fields(
+                    request_id, {'delivery_status': 'failed', 'delivery_error': str(e)}
+                )
+                logger.error(f"Giving up sending auth request {request_id}: {e}")
+            else:
+                delay = min(2 ** job['attempt'], 60) * random.uniform(0.8, 1.2)
+                await self._reschedule(key, raw_job, job, delay)
+            return 0
+        
+        metrics.TELEGRAM_SEND_TOTAL.labels("sent").inc()
+        await redis_service.redis.zrem(key, raw_job)
+        await redis_service.update_auth_request_fields(
+            request_id,
+            {'delivery_status': 'sent', 'message_id': sent.message_id if sent else None}
+        )
+        return 0
+    
+    async def _worker(self):
+        while True:
+            try:
+                claimed = await self._claim()
+                if not claimed:
+                    await asyncio.sleep(settings.telegram_send_poll_interval)
+                    continue
+                
+                backoff = await self._send(*claimed)
+                if backoff:
+                    await asyncio.sleep(backoff)
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Telegram sender error: {e}")
+                await asyncio.sleep(1)
+
+
+# Глобальный экземпляр
+telegram_sender = TelegramSender()
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from typing import Dict, Any
+from loguru import logger
+from redis.exceptions import LockError
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services import metrics
+
+
+# Разделы потока обновлений: tg_updates:{номер}. Все обновления одного
+# чата попадают в один раздел, а раздел в каждый момент читает один процесс
+UPDATE_STREAM_PREFIX = "tg_updates"
+
+# Группа потребителей разделов (процессы python -m app.bot.worker)
+UPDATE_GROUP = "bot"
+
+# Обновления, обработка которых не удалась за update_max_attempts попыток
+UPDATE_DEAD_KEY = "tg_updates_dead"
+
+# Блокировка единственного процесса, читающего getUpdates
+UPDATE_POLLER_LOCK_KEY = "tg_updates:poller"
+
+
+def partition_key(partition: int) -> str:
+    return f"{UPDATE_STREAM_PREFIX}:{partition}"
+
+
+def chat_key(payload: Dict[str, Any]) -> int:
+    """Чат (или пользователь), к которому относится обновление"""
+    for field, event in payload.items():
+        if field == 'update_id' or not isinstance(event, dict):
+            continue
+        chat = (
+            event.get('chat')
+            or (event.get('message') or {}).get('chat')
+            or event.get('from')
+            or event.get('user')
+            or {}
+        )
+        return int(chat.get('id', 0))
+    return 0
+
+
+class UpdateStream:
+    """
+    Поток обновлений Telegram в Redis.
+    
+    Webhook (или читатель getUpdates) только записывает исходное обновление
+    в раздел потока по чату, разбор и обработку aiogram выполняют отдельные
+    процессы бота (app.bot.worker). Повторные доставки отбрасываются по
+    update_id, как и при обработке в процессе API.
+    """
+    
+    async def publish(self, payload: Dict[str, Any]) -> bool:
+        """Запись обновления в поток. Возвращает False для повторной доставки"""
+        update_id = payload['update_id']
+        if not await redis_service.claim_update(update_id):
+            metrics.TELEGRAM_UPDATES_TOTAL.labels("duplicate").inc()
+            return False
+        
+        try:
+            await redis_service.redis.xadd(
+                partition_key(abs(chat_key(payload)) % settings.update_stream_partitions),
+                {'data': json.dumps(payload, ensure_ascii=False)},
+                maxlen=settings.update_stream_maxlen,
+                approximate=True
+            )
+        except Exception:
+            await redis_service.release_update(update_id)
+            raise
+        
+        metrics.TELEGRAM_UPDATES_TOTAL.labels("accepted").inc()
+        return True
+    
+    async def poll(self):
+        """
+        Чтение обновлений через getUpdates вместо webhook. Читает только
+        процесс, удерживающий блокировку, остальные ждут ее освобождения.
+        """
+        from app.bot.bot import bot, dp
+        
+        allowed_updates = dp.resolve_used_update_types()
+        timeout = settings.telegram_poll_timeout
+        
+        while True:
+            lock = redis_service.redis.lock(UPDATE_POLLER_LOCK_KEY, timeout=timeout + 30)
+            if not await lock.acquire(blocking=False):
+                await asyncio.sleep(5)
+                continue
+            
+            logger.info("Telegram long polling started")
+            try:
+                # getUpdates не работает, пока установлен webhook
+                await bot.delete_webhook(drop_pending_updates=False)
+                offset = None
+                while True:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=timeout,
+                        allowed_updates=allowed_updates,
+                        request_timeout=timeout + 10
+                    )
+                    for update in updates:
+                        await self.publish(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+                        offset = update.update_id + 1
+                    await lock.reacquire()
+            except asyncio.CancelledError:
+                raise
+            except LockError:
+                logger.warning("Telegram long polling lock lost")
+            except Exception as e:
+                logger.error(f"Telegram long polling error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await lock.release()
+                except LockError:
+                    pass
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """Необработанные обновления в потоке и число отложенных в dead-letter"""
+        async with redis_service.redis.pipeline(transaction=False) as pipe:
+            for partition in range(settings.update_stream_partitions):
+                pipe.xlen(partition_key(partition))
+            pipe.xlen(UPDATE_DEAD_KEY)
+            *backlog, dead = await pipe.execute()
+        
+        return {
+            'backlog': sum(backlog),
+            'partitions': settings.update_stream_partitions,
+            'dead_letter': dead
+        }
+
+
+# Глобальный экземпляр
+update_stream = UpdateStream()
@@ -0,0 +1,325 @@
+"""
+Отдельный процесс обработки обновлений Telegram.
+
+Читает разделы потока tg_updates (их заполняет webhook API при
+UPDATE_STREAM=true или читатель getUpdates) и передает обновления
+диспетчеру aiogram с роутером app.bot.handlers. Процессов может быть
+несколько: разделы делятся между живыми процессами поровну, раздел в
+каждый момент читает один процесс, поэтому порядок обновлений одного чата
+сохраняется. Обновления разных чатов обрабатываются параллельно.
+
+Запуск:
+    python -m app.bot.worker [--poll] [--metrics-port 9101]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from aiogram.types import Update
+from loguru import logger
+from redis.exceptions import ResponseError
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services import metrics
+from app.bot.stream import (
+    update_stream,
+    chat_key,
+    partition_key,
+    UPDATE_STREAM_PREFIX,
+    UPDATE_GROUP,
+    UPDATE_DEAD_KEY
+)
+
+
+# Живые процессы бота (ZSET процесс -> время последнего продления)
+UPDATE_WORKERS_KEY = f"{UPDATE_STREAM_PREFIX}:workers"
+
+
+# Продление аренды раздела, если она еще принадлежит процессу
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Освобождение аренды раздела
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(partition: int) -> str:
+    return f"{partition_key(partition)}:owner"
+
+
+class UpdateWorker:
+    """
+    Потребитель разделов потока обновлений.
+    
+    Процесс арендует разделы (ключ с TTL в Redis) и продлевает аренду, пока
+    жив. Упавший процесс перестает продлевать аренду, его разделы забирают
+    остальные вместе с неподтвержденными записями (XAUTOCLAIM). Пачка
+    записей раздела разбивается по чатам: чаты обрабатываются параллельно,
+    обновления одного чата - по порядку. Обновление, которое не удалось
+    обработать за update_max_attempts попыток, уходит в tg_updates_dead.
+    """
+    
+    def __init__(self):
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._owned: Dict[int, asyncio.Task] = {}
+        self._draining: set = set()
+        self._balancer: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._renew_script = None
+        self._release_script = None
+        self.stats = {
+            'processed': 0,
+            'retried': 0,
+            'dead': 0
+        }
+    
+    async def start(self):
+        """Создание групп потребителей и запуск распределения разделов"""
+        if self._balancer:
+            return
+        
+        for partition in range(settings.update_stream_partitions):
+            try:
+                await redis_service.redis.xgroup_create(
+                    partition_key(partition), UPDATE_GROUP, id="0", mkstream=True
+                )
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        
+        self._semaphore = asyncio.Semaphore(settings.update_worker_concurrency)
+        self._renew_script = redis_service.redis.register_script(RENEW_LEASE_SCRIPT)
+        self._release_script = redis_service.redis.register_script(RELEASE_LEASE_SCRIPT)
+        self._balancer = asyncio.create_task(self._balance_loop())
+        logger.info(f"Update worker {self._consumer} started")
+    
+    async def stop(self):
+        """Остановка: текущие пачки дорабатываются, аренды освобождаются"""
+        if not self._balancer:
+            return
+        
+        self._balancer.cancel()
+        await asyncio.gather(self._balancer, return_exceptions=True)
+        self._balancer = None
+        
+        self._draining.update(self._owned)
+        tasks = list(self._owned.values())
+        done, pending = await asyncio.wait(tasks, timeout=10) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        await redis_service.redis.zrem(UPDATE_WORKERS_KEY, self._consumer)
+        logger.info(f"Update worker {self._consumer} stopped")
+    
+    async def _balance_loop(self):
+        """Продление аренд и захват или освобождение разделов по числу живых процессов"""
+        lease_ms = settings.update_partition_lease * 1000
+        
+        while True:
+            try:
+                now = time.time()
+                async with redis_service.redis.pipeline(transaction=False) as pipe:
+                    pipe.zadd(UPDATE_WORKERS_KEY, {self._consumer: now})
+                    pipe.zremrangebyscore(UPDATE_WORKERS_KEY, "-inf", now - settings.update_partition_lease)
+                    pipe.zcard(UPDATE_WORKERS_KEY)
+                    *_, workers = await pipe.execute()
+                target = math.ceil(settings.update_stream_partitions / max(workers, 1))
+                
+                for partition in list(self._owned):
+                    if partition in self._draining:
+                        continue
+                    if not await self._renew_script(keys=[lease_key(partition)], args=[self._consumer, lease_ms]):
+                        # Аренду забрал другой процесс - прекращаем чтение сразу
+                        logger.warning(f"Lost lease on update partition {partition}")
+                        self._owned[partition].cancel()
+                
+                # Лишние разделы отдаем после завершения текущей пачки
+                active = [partition for partition in self._owned if partition not in self._draining]
+                for partition in active[target:]:
+                    self._draining.add(partition)
+                
+                for partition in range(settings.update_stream_partitions):
+                    if len(self._owned) >= target:
+                        break
+                    if partition in self._owned:
+                        continue
+                    if await redis_service.redis.set(lease_key(partition), self._consumer, nx=True, px=lease_ms):
+                        self._owned[partition] = asyncio.create_task(self._consume(partition))
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Update partition balancing error: {e}")
+            
+            await asyncio.sleep(settings.update_partition_lease / 3)
+    
+    async def _consume(self, partition: int):
+        """Чтение раздела, пока процесс им владеет"""
+        stream = partition_key(partition)
+        try:
+            while partition not in self._draining:
+                try:
+                    # Сначала неподтвержденные записи прежнего владельца, по порядку
+                    start_id = "0-0"
+                    while True:
+                        start_id, entries, *_ = await redis_service.redis.xautoclaim(
+                            stream,
+                            UPDATE_GROUP,
+                            self._consumer,
+                            min_idle_time=0,
+                            start_id=start_id,
+                            count=settings.update_worker_batch_size
+                        )
+                        if entries:
+                            await self._process(stream, entries)
+                        if start_id == "0-0":
+                            break
+                    
+                    while partition not in self._draining:
+                        response = await redis_service.redis.xreadgroup(
+                            UPDATE_GROUP,
+                            self._consumer,
+                            {stream: ">"},
+                            count=settings.update_worker_batch_size,
+                            block=1000
+                        )
+                        if response:
+                            await self._process(stream, response[0][1])
+                
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Update partition {partition} error: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            self._owned.pop(partition, None)
+            self._draining.discard(partition)
+            try:
+                await self._release_script(keys=[lease_key(partition)], args=[self._consumer])
+            except Exception as e:
+                logger.warning(f"Error releasing update partition {partition}: {e}")
+    
+    async def _process(self, stream: str, entries: List[tuple]):
+        """Обработка пачки: чаты параллельно, обновления чата по порядку"""
+        chats: Dict[int, List[tuple]] = {}
+        for entry_id, fields in entries:
+            if not fields:
+                continue
+            payload = json.loads(fields['data'])
+            chats.setdefault(chat_key(payload), []).append((entry_id, payload))
+        
+        await asyncio.gather(*[self._process_chat(items) for items in chats.values()])
+        
+        entry_ids = [entry_id for entry_id, _ in entries]
+        async with redis_service.pipeline() as pipe:
+            pipe.xack(stream, UPDATE_GROUP, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+    
+    async def _process_chat(self, items: List[tuple]):
+        async with self._semaphore:
+            for entry_id, payload in items:
+                # id записи потока - время приема обновления в мс
+                metrics.TELEGRAM_UPDATE_QUEUE_SECONDS.observe(
+                    max(0.0, time.time() - int(entry_id.split("-")[0]) / 1000)
+                )
+                await self._dispatch(payload)
+    
+    async def _dispatch(self, payload: Dict[str, Any]):
+        """Передача обновления диспетчеру с повторными попытками и dead-letter"""
+        from app.bot.bot import bot, dp
+        
+        error = None
+        for attempt in range(1, settings.update_max_attempts + 1):
+            try:
+                update = Update.model_validate(payload, context={"bot": bot})
+                with metrics.TELEGRAM_UPDATE_SECONDS.time():
+                    await dp.feed_update(bot, update)
+                self.stats['processed'] += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                logger.warning(f"Error processing update {payload.get('update_id')} (attempt {attempt}): {e}")
+                if attempt < settings.update_max_attempts:
+                    self.stats['retried'] += 1
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        
+        self.stats['dead'] += 1
+        await redis_service.redis.xadd(
+            UPDATE_DEAD_KEY,
+            {
+                'data': json.dumps(payload, ensure_ascii=False),
+                'error': str(error),
+                'consumer': self._consumer,
+                'failed_at': datetime.now().isoformat()
+            },
+            maxlen=settings.update_stream_maxlen,
+            approximate=True
+        )
+        logger.error(f"Update {payload.get('update_id')} moved to {UPDATE_DEAD_KEY}: {error}")
+
+
+# Глобальный экземпляр
+update_worker = UpdateWorker()
+
+
+async def main(args):
+    from prometheus_client import start_http_server
+    from app.bot.bot import dp, setup_bot, shutdown_bot
+    from app.bot.handlers import router as bot_router
+    from app.services.rollup_service import rollup_service
+    
+    await setup_bot()
+    dp.include_router(bot_router)
+    
+    if args.metrics_port and settings.metrics_enabled:
+        start_http_server(args.metrics_port)
+    
+    # Решения по запросам принимаются здесь - итоги для /api/v1/stats
+    if settings.rollups_enabled:
+        await rollup_service.start()
+    
+    await update_worker.start()
+    poller = asyncio.create_task(update_stream.poll()) if args.poll else None
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping update worker...")
+        if poller:
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+        await update_worker.stop()
+        await rollup_service.stop()
+        await shutdown_bot()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--poll", action="store_true", help="читать обновления через getUpdates вместо webhook")
+    parser.add_argument("--metrics-port", type=int, default=None, help="порт метрик Prometheus этого процесса")
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import Field, model_validator
 from typing import Optional
 
 
@@ -16,6 +16,24 @@ class Settings(BaseSettings):
     bot_token: str = Field(env="BOT_TOKEN")
     webhook_url: str = Field(env="WEBHOOK_URL")
     webhook_path: str = Field(default="/webhook/telegram", env="WEBHOOK_PATH")
+    telegram_api_server: Optional[str] = Field(default=None, env="TELEGRAM_API_SERVER")  # свой Bot API сервер
+    webhook_drop_pending_updates: bool = Field(default=False, env="WEBHOOK_DROP_PENDING_UPDATES")
+    webhook_delete_on_shutdown: bool = Field(default=False, env="WEBHOOK_DELETE_ON_SHUTDOWN")
+    
+    # Согласованный запуск нескольких процессов и узлов
+    startup_lock_timeout: int = Field(default=60, env="STARTUP_LOCK_TIMEOUT")  # секунд
+    startup_wait_timeout: int = Field(default=120, env="STARTUP_WAIT_TIMEOUT")  # секунд
+    startup_poll_interval: float = Field(default=0.5, env="STARTUP_POLL_INTERVAL")  # секунд
+    startup_ready_ttl: int = Field(default=3600, env="STARTUP_READY_TTL")  # секунд
+    
+    # Быстрый запуск: DB_SCHEMA_MODE=check сверяет версию схемы с головной
+    # ревизией миграций вместо create_all (create_all - создать таблицы, skip - ничего);
+    # пулы БД и Redis и сессия Bot API прогреваются параллельно
+    db_schema_mode: str = Field(default="create_all", env="DB_SCHEMA_MODE")
+    startup_parallel: bool = Field(default=True, env="STARTUP_PARALLEL")
+    startup_db_warmup: int = Field(default=5, env="STARTUP_DB_WARMUP")  # соединений
+    startup_redis_warmup: int = Field(default=5, env="STARTUP_REDIS_WARMUP")  # соединений
+    startup_warm_bot_session: bool = Field(default=True, env="STARTUP_WARM_BOT_SESSION")
     
     # PostgreSQL настройки
     postgres_host: str = Field(env="POSTGRES_HOST")
@@ -29,16 +47,153 @@ class Settings(BaseSettings):
     redis_port: int = Field(default=6379, env="REDIS_PORT")
     redis_password: Optional[str] = Field(default=None, env="REDIS_PASSWORD")
     redis_db: int = Field(default=0, env="REDIS_DB")
+    redis_max_connections: int = Field(default=20, env="REDIS_MAX_CONNECTIONS")  # на процесс (в кластере - на узел)
+    
+    # Развертывание Redis: standalone (один узел), sentinel (переключение
+    # на реплику через Sentinel), cluster (Redis Cluster)
+    redis_mode: str = Field(default="standalone", env="REDIS_MODE")
+    redis_sentinels: str = Field(default="", env="REDIS_SENTINELS")  # host:port,host:port
+    redis_sentinel_master: str = Field(default="mymaster", env="REDIS_SENTINEL_MASTER")
+    redis_sentinel_password: Optional[str] = Field(default=None, env="REDIS_SENTINEL_PASSWORD")
+    redis_cluster_nodes: str = Field(default="", env="REDIS_CLUSTER_NODES")  # host:port,...; по умолчанию REDIS_HOST:REDIS_PORT
+    redis_cluster_shards: int = Field(default=16, env="REDIS_CLUSTER_SHARDS")  # шардов запросов, журналов и потоков
     
     # Настройки авторизации
-    api_secret_key: str = Field(env="API_SECRET_KEY")
+    api_secret_key: str = Field(env="API_SECRET_KEY")  # общий ключ со всеми правами, см. api_keys
     auth_request_timeout: int = Field(default=300, env="AUTH_REQUEST_TIMEOUT")  # 5 минут
     max_pending_requests: int = Field(default=5, env="MAX_PENDING_REQUESTS")
+    long_poll_max_wait: int = Field(default=60, env="LONG_POLL_MAX_WAIT")  # секунд
+    batch_max_size: int = Field(default=500, env="BATCH_MAX_SIZE")
+    idempotency_ttl: int = Field(default=86400, env="IDEMPOTENCY_TTL")  # секунд хранения ответа
+    idempotency_lock_ttl: int = Field(default=30, env="IDEMPOTENCY_LOCK_TTL")  # секунд, выполнение первого запроса
+    idempotency_wait_timeout: float = Field(default=10.0, env="IDEMPOTENCY_WAIT_TIMEOUT")  # секунд ожидания повтором
+    history_page_max: int = Field(default=10000, env="HISTORY_PAGE_MAX")  # записей на страницу истории
+    history_fetch_size: int = Field(default=1000, env="HISTORY_FETCH_SIZE")  # строк за одно чтение из БД
+    
+    # Настройки отправки сообщений в Telegram
+    telegram_rate_limit: float = Field(default=30.0, env="TELEGRAM_RATE_LIMIT")  # сообщений в секунду
+    telegram_rate_burst: int = Field(default=30, env="TELEGRAM_RATE_BURST")
+    telegram_chat_interval: float = Field(default=1.0, env="TELEGRAM_CHAT_INTERVAL")  # секунд между сообщениями в чат
+    telegram_sender_workers: int = Field(default=4, env="TELEGRAM_SENDER_WORKERS")
+    telegram_send_max_attempts: int = Field(default=5, env="TELEGRAM_SEND_MAX_ATTEMPTS")
+    telegram_send_lease_seconds: int = Field(default=30, env="TELEGRAM_SEND_LEASE_SECONDS")
+    telegram_send_poll_interval: float = Field(default=0.05, env="TELEGRAM_SEND_POLL_INTERVAL")  # секунд
+    
+    # Обработка обновлений Telegram
+    update_async_ingest: bool = Field(default=True, env="UPDATE_ASYNC_INGEST")
+    update_workers: int = Field(default=8, env="UPDATE_WORKERS")
+    update_queue_size: int = Field(default=1000, env="UPDATE_QUEUE_SIZE")
+    update_dedup_ttl: int = Field(default=600, env="UPDATE_DEDUP_TTL")  # секунд
+    
+    # Поток обновлений для отдельных процессов бота (python -m app.bot.worker).
+    # При UPDATE_STREAM=true webhook только записывает обновления в Redis
+    update_stream: bool = Field(default=False, env="UPDATE_STREAM")
+    update_stream_partitions: int = Field(default=16, env="UPDATE_STREAM_PARTITIONS")
+    update_stream_maxlen: int = Field(default=100000, env="UPDATE_STREAM_MAXLEN")
+    update_worker_concurrency: int = Field(default=32, env="UPDATE_WORKER_CONCURRENCY")  # чатов параллельно
+    update_worker_batch_size: int = Field(default=100, env="UPDATE_WORKER_BATCH_SIZE")
+    update_max_attempts: int = Field(default=3, env="UPDATE_MAX_ATTEMPTS")
+    update_partition_lease: int = Field(default=15, env="UPDATE_PARTITION_LEASE")  # секунд
+    telegram_polling: bool = Field(default=False, env="TELEGRAM_POLLING")  # getUpdates вместо webhook
+    telegram_poll_timeout: int = Field(default=30, env="TELEGRAM_POLL_TIMEOUT")  # секунд
+    
+    # Метрики Prometheus (/metrics). При нескольких процессах uvicorn
+    # задайте PROMETHEUS_MULTIPROC_DIR - пустой каталог, общий для процессов
+    metrics_enabled: bool = Field(default=True, env="METRICS_ENABLED")
+    metrics_sample_interval: float = Field(default=5.0, env="METRICS_SAMPLE_INTERVAL")  # секунд
+    
+    # Настройки истечения срока запросов
+    expiry_enabled: bool = Field(default=True, env="EXPIRY_ENABLED")
+    expiry_tick_interval: float = Field(default=0.25, env="EXPIRY_TICK_INTERVAL")  # секунд
+    expiry_batch_size: int = Field(default=500, env="EXPIRY_BATCH_SIZE")
+    expiry_grace_seconds: int = Field(default=300, env="EXPIRY_GRACE_SECONDS")  # сколько хранить запрос в Redis после срока
+    expiry_edit_concurrency: int = Field(default=10, env="EXPIRY_EDIT_CONCURRENCY")
+    
+    # Отложенная запись истории запросов в БД (write-behind)
+    db_write_behind: bool = Field(default=False, env="DB_WRITE_BEHIND")
+    history_flush_batch_size: int = Field(default=500, env="HISTORY_FLUSH_BATCH_SIZE")
+    history_flush_interval: float = Field(default=1.0, env="HISTORY_FLUSH_INTERVAL")  # секунд, максимальная задержка пачки
+    
+    # Секционирование auth_requests по месяцам и архивация старых секций
+    partition_maintenance_enabled: bool = Field(default=True, env="PARTITION_MAINTENANCE_ENABLED")
+    partition_maintenance_interval: int = Field(default=3600, env="PARTITION_MAINTENANCE_INTERVAL")  # секунд
+    partition_premake_months: int = Field(default=3, env="PARTITION_PREMAKE_MONTHS")
+    partition_retention_months: int = Field(default=12, env="PARTITION_RETENTION_MONTHS")  # 0 - хранить все
+    partition_archive_dir: str = Field(default="archive", env="PARTITION_ARCHIVE_DIR")
+    partition_lock_timeout: int = Field(default=1800, env="PARTITION_LOCK_TIMEOUT")  # секунд
+    
+    # Почасовые итоги решений для /api/v1/stats
+    rollups_enabled: bool = Field(default=True, env="ROLLUPS_ENABLED")
+    rollup_flush_interval: float = Field(default=5.0, env="ROLLUP_FLUSH_INTERVAL")  # секунд
+    
+    # Контроль допуска запросов к API: адаптивные лимиты параллельности
+    # по маршрутам (AIMD) и отказ 503 с Retry-After при перегрузке
+    admission_enabled: bool = Field(default=True, env="ADMISSION_ENABLED")
+    admission_initial_limit: int = Field(default=20, env="ADMISSION_INITIAL_LIMIT")
+    admission_min_limit: int = Field(default=2, env="ADMISSION_MIN_LIMIT")
+    admission_max_limit: int = Field(default=200, env="ADMISSION_MAX_LIMIT")
+    admission_latency_target: float = Field(default=0.25, env="ADMISSION_LATENCY_TARGET")  # секунд, для создания запроса
+    admission_backoff: float = Field(default=0.9, env="ADMISSION_BACKOFF")  # множитель уменьшения лимита
+    admission_queue_timeout: float = Field(default=0.05, env="ADMISSION_QUEUE_TIMEOUT")  # секунд, бюджет ожидания слота
+    admission_max_queue: int = Field(default=100, env="ADMISSION_MAX_QUEUE")
+    admission_pool_wait_threshold: float = Field(default=0.1, env="ADMISSION_POOL_WAIT_THRESHOLD")  # секунд полного пула
+    admission_retry_after: int = Field(default=1, env="ADMISSION_RETRY_AFTER")  # секунд
+    
+    # Ограничение частоты запросов (GCRA в Redis), формат "rate/period[:burst]":
+    # rate запросов за period секунд, до burst запросов подряд.
+    # Пакет списывается целиком, поэтому burst владельца ключа не меньше BATCH_MAX_SIZE
+    rate_limit_enabled: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
+    rate_limit_api_key: str = Field(default="200/1:500", env="RATE_LIMIT_API_KEY")
+    rate_limit_client: str = Field(default="30/60:10", env="RATE_LIMIT_CLIENT")
+    rate_limit_telegram: str = Field(default="30/60:10", env="RATE_LIMIT_TELEGRAM")
+    # JSON с лимитами отдельных субъектов: {"client:acme": "100/1:200", "api_key:<tenant>": "..."}
+    rate_limit_overrides: str = Field(default="", env="RATE_LIMIT_OVERRIDES")
+    
+    # Кеш проверенных API ключей (api_keys) в памяти процесса
+    api_key_cache_ttl: int = Field(default=300, env="API_KEY_CACHE_TTL")  # секунд
+    api_key_negative_ttl: int = Field(default=30, env="API_KEY_NEGATIVE_TTL")  # секунд, для отсутствующих ключей
+    api_key_cache_size: int = Field(default=10000, env="API_KEY_CACHE_SIZE")
+    
+    # Настройки кеша клиентов
+    client_cache_size: int = Field(default=10000, env="CLIENT_CACHE_SIZE")
+    client_cache_ttl: int = Field(default=60, env="CLIENT_CACHE_TTL")  # секунд, уровень процесса
+    client_cache_redis_ttl: int = Field(default=600, env="CLIENT_CACHE_REDIS_TTL")  # секунд, уровень Redis
+    
+    # Настройки потока событий (SSE)
+    events_log_maxlen: int = Field(default=100000, env="EVENTS_LOG_MAXLEN")
+    sse_buffer_size: int = Field(default=1000, env="SSE_BUFFER_SIZE")
+    sse_heartbeat_interval: int = Field(default=15, env="SSE_HEARTBEAT_INTERVAL")  # секунд
+    
+    # Настройки доставки webhook'ов
+    webhooks_enabled: bool = Field(default=True, env="WEBHOOKS_ENABLED")
+    webhook_timeout: int = Field(default=10, env="WEBHOOK_TIMEOUT")  # секунд
+    webhook_max_attempts: int = Field(default=8, env="WEBHOOK_MAX_ATTEMPTS")
+    webhook_backoff_base: float = Field(default=1.0, env="WEBHOOK_BACKOFF_BASE")  # секунд
+    webhook_backoff_max: float = Field(default=600.0, env="WEBHOOK_BACKOFF_MAX")  # секунд
+    webhook_max_inflight: int = Field(default=100, env="WEBHOOK_MAX_INFLIGHT")
+    webhook_concurrency_per_host: int = Field(default=10, env="WEBHOOK_CONCURRENCY_PER_HOST")
+    webhook_batch_size: int = Field(default=100, env="WEBHOOK_BATCH_SIZE")
+    webhook_lease_seconds: int = Field(default=60, env="WEBHOOK_LEASE_SECONDS")
+    webhook_poll_interval: float = Field(default=0.2, env="WEBHOOK_POLL_INTERVAL")  # секунд
+    webhook_cache_ttl: int = Field(default=30, env="WEBHOOK_CACHE_TTL")  # секунд
     
     # PgAdmin настройки
     pgadmin_email: Optional[str] = Field(default="admin@admin.com", env="PGADMIN_EMAIL")
     pgadmin_password: Optional[str] = Field(default="admin", env="PGADMIN_PASSWORD")
     
+    @model_validator(mode="after")
+    def check_batch_rate_limit(self) -> "Settings":
+        """Пакет максимального размера должен укладываться в burst лимита владельца ключа"""
+        if self.rate_limit_enabled:
+            quota, _, burst = self.rate_limit_api_key.partition(":")
+            burst = int(burst or quota.partition("/")[0])
+            if self.batch_max_size > burst:
+                raise ValueError(
+                    f"BATCH_MAX_SIZE={self.batch_max_size} exceeds RATE_LIMIT_API_KEY burst {burst}: "
+                    f"full-size batches would always be rate limited"
+                )
+        return self
+    
     @property
     def database_url(self) -> str:
         return (
@@ -1,3 +1,6 @@
+import asyncio
+from typing import Optional
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -37,3 +40,26 @@ async def init_db():
     """Инициализация базы данных"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+
+async def warm_up_db(connections: int) -> Optional[str]:
+    """
+    Открытие connections соединений пула заранее, чтобы первые запросы
+    не ждали подключения. Возвращает версию схемы из alembic_version
+    (None, если миграции не применялись).
+    """
+    results = await asyncio.gather(
+        *[engine.connect().start() for _ in range(max(connections, 1))],
+        return_exceptions=True
+    )
+    conns = [conn for conn in results if not isinstance(conn, BaseException)]
+    try:
+        for error in results:
+            if isinstance(error, BaseException):
+                raise error
+        
+        if (await conns[0].execute(text("SELECT to_regclass('alembic_version')"))).scalar() is None:
+            return None
+        return (await conns[0].execute(text("SELECT version_num FROM alembic_version"))).scalar()
+    finally:
+        await asyncio.gather(*[conn.close() for conn in conns], return_exceptions=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, BigInteger, Numeric, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from app.database.database import Base
 
@@ -15,24 +15,96 @@ class Client(Base):
     username = Column(String(100), nullable=True)
     phone = Column(String(20), nullable=True)
     email = Column(String(100), nullable=True)
+    tenant = Column(String(100), index=True, nullable=False, server_default="default")  # владелец API ключа
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
 class AuthRequest(Base):
-    """Модель запроса на авторизацию"""
+    """
+    Модель запроса на авторизацию.
+    
+    Таблица секционирована по created_at (секция на месяц, см.
+    app.services.partition_service), поэтому ключи включают created_at.
+    """
     __tablename__ = "auth_requests"
+    __table_args__ = (
+        UniqueConstraint('request_id', 'created_at', name='uq_auth_requests_request_id_created_at'),
+        # История клиента с пагинацией по (created_at, id)
+        Index('ix_auth_requests_client_id_created_at', 'client_id', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    request_id = Column(String(100), unique=True, index=True, nullable=False)
-    client_id = Column(String(100), index=True, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    request_id = Column(String(100), nullable=False)
+    client_id = Column(String(100), nullable=False)
     telegram_id = Column(BigInteger, index=True, nullable=False)
     operation = Column(String(255), nullable=False)
     amount = Column(String(50), nullable=True)
     status = Column(String(20), default="pending", nullable=False)  # pending, approved, rejected, expired
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     approved_at = Column(DateTime(timezone=True), nullable=True)
     rejected_at = Column(DateTime(timezone=True), nullable=True)
     expired_at = Column(DateTime(timezone=True), nullable=True)
     metadata_json = Column(Text, nullable=True)  # Дополнительные данные в JSON
+
+
+class Webhook(Base):
+    """Модель подписки интегратора на уведомления о решениях"""
+    __tablename__ = "webhooks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String(500), nullable=False)
+    client_id = Column(String(100), index=True, nullable=True)  # None - события всех клиентов
+    secret = Column(String(100), nullable=False)  # Ключ для HMAC-подписи
+    tenant = Column(String(100), index=True, nullable=True)  # None - события клиентов всех владельцев
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DecisionRollup(Base):
+    """Почасовые итоги по запросам клиента (app.services.rollup_service)"""
+    __tablename__ = "decision_rollups"
+    
+    client_id = Column(String(100), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True, index=True)  # начало часа (UTC)
+    created = Column(BigInteger, default=0, nullable=False)
+    approved = Column(BigInteger, default=0, nullable=False)
+    rejected = Column(BigInteger, default=0, nullable=False)
+    expired = Column(BigInteger, default=0, nullable=False)
+    amount_requested = Column(Numeric, default=0, nullable=False)
+    amount_approved = Column(Numeric, default=0, nullable=False)
+
+
+class DecisionLatencyBin(Base):
+    """
+    Скетч времени до решения: число решений в логарифмической корзине bin.
+    Скетчи любых часов и клиентов объединяются суммированием count по bin.
+    """
+    __tablename__ = "decision_latency_bins"
+    
+    client_id = Column(String(100), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True, index=True)
+    status = Column(String(20), primary_key=True)  # approved, rejected
+    bin = Column(Integer, primary_key=True)
+    count = Column(BigInteger, default=0, nullable=False)
+
+
+class ApiKey(Base):
+    """
+    API ключ интегратора (app.services.api_key_service).
+    Хранится только SHA-256 ключа, сам ключ показывается один раз при выпуске.
+    """
+    __tablename__ = "api_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key_id = Column(String(16), unique=True, index=True, nullable=False)  # открытая часть ключа
+    key_hash = Column(String(64), nullable=False)
+    tenant = Column(String(100), index=True, nullable=False)  # владелец (интегратор)
+    name = Column(String(100), nullable=True)
+    scopes = Column(String(255), nullable=False)  # через пробел, "*" - все
+    rate_limit = Column(String(50), nullable=True)  # "rate/period[:burst]" вместо RATE_LIMIT_API_KEY
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,35 +1,140 @@
+import time
+
+# Начало импорта приложения - для разбивки времени запуска по этапам
+IMPORTS_STARTED = time.perf_counter()
+
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from aiogram.types import Update
 from loguru import logger
 
 from app.config import settings
-from app.database.database import init_db
+from app.database.database import init_db, warm_up_db
 from app.services.redis_service import redis_service
-from app.bot.bot import bot, dp, setup_bot, shutdown_bot
+from app.services.events_service import events_service
+from app.services.webhook_service import webhook_service
+from app.services.history_writer import history_writer
+from app.services.expiry_service import expiry_service
+from app.services.startup_service import startup_coordinator
+from app.services.partition_service import partition_service
+from app.services.rollup_service import rollup_service
+from app.services.admission_service import admission_controller
+from app.services.api_key_service import api_key_service
+from app.services import metrics
+from app.bot.bot import bot, dp, setup_bot, register_webhook, warm_up_bot_session, shutdown_bot
 from app.bot.handlers import router as bot_router
+from app.bot.sender import telegram_sender
+from app.bot.ingest import update_ingestor, UpdateQueueFull
+from app.bot.stream import update_stream
 from app.api.auth import router as auth_router
+from app.api.events import router as events_router
+from app.api.webhooks import router as webhooks_router
+from app.api.stats import router as stats_router
+from app.api.api_keys import router as api_keys_router
+from app.api.admission import AdmissionMiddleware
+
+
+async def setup_shared():
+    """Общая для всех процессов настройка: схема БД, секции и webhook"""
+    if settings.db_schema_mode == "create_all":
+        with startup_coordinator.phase("create_all"):
+            await init_db()
+        logger.info("Database initialized")
+    
+    steps = [partition_service.ensure_partitions()]
+    # При long polling обновления читает процесс бота, webhook не нужен
+    if not settings.telegram_polling:
+        steps.append(register_webhook())
+    await startup_coordinator.gather(*steps)
+
+
+async def warm_up():
+    """Подключение к Redis, прогрев пулов БД и Redis и сессии Bot API (параллельно)"""
+    
+    async def redis():
+        with startup_coordinator.phase("redis"):
+            await setup_bot()
+            await redis_service.warm_up(settings.startup_redis_warmup)
+    
+    async def database():
+        with startup_coordinator.phase("database"):
+            revision = await warm_up_db(settings.startup_db_warmup)
+        if settings.db_schema_mode == "check":
+            with startup_coordinator.phase("schema_check"):
+                await startup_coordinator.check_schema(revision)
+    
+    async def bot_session():
+        with startup_coordinator.phase("bot_session"):
+            await warm_up_bot_session()
+    
+    steps = [redis(), database()]
+    if settings.startup_warm_bot_session:
+        steps.append(bot_session())
+    await startup_coordinator.gather(*steps)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     logger.info("Starting application...")
+    startup_coordinator.record("imports", IMPORTS_STARTED)
     
     try:
-        # Инициализация базы данных
-        await init_db()
-        logger.info("Database initialized")
+        with startup_coordinator.phase("total"):
+            # Redis, пулы соединений, сессия Bot API и проверка версии схемы
+            with startup_coordinator.phase("warm_up"):
+                await warm_up()
+            
+            # Регистрация роутеров бота
+            dp.include_router(bot_router)
+            
+            # Схема БД и webhook - один процесс, остальные ждут готовности
+            with startup_coordinator.phase("shared_setup"):
+                await startup_coordinator.run(
+                    setup_shared,
+                    startup_coordinator.fingerprint(
+                        settings.full_webhook_url,
+                        ",".join(sorted(dp.resolve_used_update_types()))
+                    )
+                )
+            
+            # Фоновые службы независимы и запускаются одновременно
+            services = [
+                # Отправка сообщений в Telegram
+                telegram_sender.start(),
+                # Подписка на события изменения статусов (long-poll)
+                events_service.start()
+            ]
+            # Асинхронная обработка обновлений от Telegram
+            # (при UPDATE_STREAM обновления обрабатывают процессы бота)
+            if settings.update_async_ingest and not settings.update_stream:
+                services.append(update_ingestor.start())
+            # Отложенная запись истории в БД
+            if settings.db_write_behind:
+                services.append(history_writer.start())
+            # Истечение срока запросов
+            if settings.expiry_enabled:
+                services.append(expiry_service.start())
+            # Фоновая доставка webhook'ов
+            if settings.webhooks_enabled:
+                services.append(webhook_service.start())
+            # Запись почасовых итогов решений
+            if settings.rollups_enabled:
+                services.append(rollup_service.start())
+            # Создание будущих секций auth_requests и архивация старых
+            if settings.partition_maintenance_enabled:
+                services.append(partition_service.start())
+            # Замер заполнения пулов соединений для /metrics
+            if settings.metrics_enabled:
+                services.append(metrics.pool_metrics.start())
+            
+            with startup_coordinator.phase("services"):
+                await startup_coordinator.gather(*services)
         
-        # Регистрация роутеров бота
-        dp.include_router(bot_router)
-        
-        # Настройка бота
-        await setup_bot()
-        
-        logger.info("Application started successfully")
+        startup_coordinator.ready = True
+        logger.info(f"Application started successfully, startup timings (ms): {startup_coordinator.timings}")
         
     except Exception as e:
         logger.error(f"Error during startup: {e}")
@@ -39,7 +144,17 @@ async def lifespan(app: FastAPI):
     
     # Завершение работы
     logger.info("Shutting down application...")
+    startup_coordinator.ready = False
     try:
+        await metrics.pool_metrics.stop()
+        await partition_service.stop()
+        await rollup_service.stop()
+        await webhook_service.stop()
+        await expiry_service.stop()
+        await history_writer.stop()
+        await events_service.stop()
+        await update_ingestor.stop()
+        await telegram_sender.stop()
         await shutdown_bot()
         logger.info("Application shutdown completed")
     except Exception as e:
@@ -54,6 +169,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Контроль допуска: отказ при перегрузке до обращения к БД и Redis
+# (CORS добавляется после и оборачивает в том числе ответы 503)
+app.add_middleware(AdmissionMiddleware)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -65,6 +184,10 @@ app.add_middleware(
 
 # Подключение роутеров
 app.include_router(auth_router)
+app.include_router(events_router)
+app.include_router(webhooks_router)
+app.include_router(stats_router)
+app.include_router(api_keys_router)
 
 
 @app.post(settings.webhook_path)
@@ -74,19 +197,49 @@ async def webhook(request: Request):
         # Получаем данные от Telegram
         update_payload = await request.json()
         
+        # Записываем обновление в поток для процессов бота и сразу отвечаем
+        if settings.update_stream:
+            accepted = await update_stream.publish(update_payload)
+            return {"status": "ok" if accepted else "duplicate"}
+        
         # Создаем объект Update
         update = Update.model_validate(update_payload, context={"bot": bot})
         
+        # Передаем обновление в очередь обработки и сразу отвечаем
+        if settings.update_async_ingest:
+            accepted = await update_ingestor.submit(update)
+            return {"status": "ok" if accepted else "duplicate"}
+        
         # Передаем обновление диспетчеру
-        await dp.feed_update(bot, update)
+        if not await redis_service.claim_update(update.update_id):
+            return {"status": "duplicate"}
+        try:
+            with metrics.TELEGRAM_UPDATE_SECONDS.time():
+                await dp.feed_update(bot, update)
+        except Exception:
+            await redis_service.release_update(update.update_id)
+            raise
         
         return {"status": "ok"}
         
+    except UpdateQueueFull:
+        logger.warning("Update queue is full, asking Telegram to redeliver")
+        raise HTTPException(status_code=503, detail="Update queue is full")
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
         raise HTTPException(status_code=500, detail="Webhook processing error")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики для Prometheus"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    
+    content, content_type = metrics.render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -98,6 +251,14 @@ async def root():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Готовность процесса принимать запросы (для балансировщика)"""
+    if not startup_coordinator.ready:
+        raise HTTPException(status_code=503, detail="Not ready")
+    return {"status": "ready"}
+
+
 @app.get("/health")
 async def health():
     """Проверка здоровья сервиса"""
@@ -105,7 +266,7 @@ async def health():
         # Проверяем соединение с Redis
         await redis_service.redis.ping()
         
-        return {
+        result = {
             "status": "healthy",
             "services": {
                 "redis": "connected",
@@ -113,6 +274,23 @@ async def health():
                 "database": "connected"
             }
         }
+        if settings.db_write_behind:
+            result["history_flush"] = await history_writer.get_stats()
+        if settings.expiry_enabled:
+            result["expiry"] = expiry_service.stats
+        if settings.partition_maintenance_enabled:
+            result["partitions"] = partition_service.stats
+        result["startup_ms"] = startup_coordinator.timings
+        result["redis"] = {"mode": settings.redis_mode, "shards": len(redis_service.shards)}
+        result["api_keys"] = api_key_service.get_stats()
+        if settings.admission_enabled:
+            result["admission"] = admission_controller.get_stats()
+        if settings.update_stream:
+            result["updates"] = await update_stream.get_stats()
+        elif settings.update_async_ingest:
+            result["updates"] = update_ingestor.get_stats()
+        
+        return result
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return {
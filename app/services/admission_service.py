@@ -0,0 +1,193 @@
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable
+
+from app.config import settings
+from app.services import metrics
+
+
+# Маршруты под контролем допуска: имя, метод, путь и множитель целевой
+# задержки (admission_latency_target) для тяжелых запросов.
+# Long-poll статуса, SSE и webhook Telegram не ограничиваются: их время
+# ответа определяется ожиданием, а не нагрузкой.
+ADMISSION_ROUTES = (
+    ('auth_request', 'POST', r"^/api/v1/auth/request$", 1),
+    ('auth_batch', 'POST', r"^/api/v1/auth/requests:batch$", 4),
+    ('client_requests', 'GET', r"^/api/v1/client/[^/]+/requests$", 8),
+    ('stats', 'GET', r"^/api/v1/stats$", 4),
+)
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен контролем допуска"""
+    
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит параллельных запросов одного маршрута (AIMD).
+    
+    Запрос сверх лимита ждет в очереди (FIFO) не дольше
+    admission_queue_timeout, при полной очереди отклоняется сразу.
+    Завершение быстрее целевой задержки при загруженном лимите увеличивает
+    лимит на 1/limit (около +1 за "оборот" лимита), медленное или с ошибкой
+    сервера - умножает на admission_backoff, не чаще раза за целевую задержку.
+    """
+    
+    def __init__(self, name: str, latency_target: float):
+        self.name = name
+        self.latency_target = latency_target
+        self.limit = float(settings.admission_initial_limit)
+        self.inflight = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+        self._limit_gauge = metrics.ADMISSION_LIMIT.labels(name)
+        self._inflight_gauge = metrics.ADMISSION_INFLIGHT.labels(name)
+        self._queue_seconds = metrics.ADMISSION_QUEUE_SECONDS.labels(name)
+        self._limit_gauge.set(self.limit)
+    
+    async def acquire(self):
+        """Получение слота; AdmissionRejected - если слот не освободился в бюджет ожидания"""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self._take()
+            self._queue_seconds.observe(0)
+            return
+        if len(self._waiters) >= settings.admission_max_queue:
+            raise AdmissionRejected('queue_full')
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, settings.admission_queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот передан одновременно с отменой - возвращаем его
+                self._put()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected('queue_timeout')
+            raise
+        self._queue_seconds.observe(time.monotonic() - started)
+    
+    def release(self, latency: float, failed: bool = False):
+        """Возврат слота и подстройка лимита по задержке ответа"""
+        now = time.monotonic()
+        if failed or latency > self.latency_target:
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(float(settings.admission_min_limit), self.limit * settings.admission_backoff)
+                self._last_decrease = now
+                self._limit_gauge.set(self.limit)
+        elif self.inflight >= self.limit / 2:
+            # Растем, только когда лимит действительно используется
+            self.limit = min(float(settings.admission_max_limit), self.limit + 1 / self.limit)
+            self._limit_gauge.set(self.limit)
+        self._put()
+    
+    def _take(self):
+        self.inflight += 1
+        self._inflight_gauge.set(self.inflight)
+    
+    def _put(self):
+        self.inflight -= 1
+        # Слоты передаются ожидающим по порядку, пока лимит позволяет
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.inflight += 1
+            waiter.set_result(None)
+        self._inflight_gauge.set(self.inflight)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 2),
+            'inflight': self.inflight,
+            'queued': sum(1 for waiter in self._waiters if not waiter.done())
+        }
+
+
+def pools_saturated() -> bool:
+    """Все соединения пула PostgreSQL или Redis заняты"""
+    from app.database.database import engine
+    from app.services.redis_service import redis_service
+    
+    pool = engine.sync_engine.pool
+    if pool.checkedout() >= pool.size() + pool._max_overflow:
+        return True
+    # В кластере достаточно заполнения пула одного узла
+    return any(in_use >= maximum for in_use, _, maximum in redis_service.pool_usage())
+
+
+class AdmissionController:
+    """
+    Контроль допуска запросов к REST API.
+    
+    Каждому маршруту из ADMISSION_ROUTES соответствует свой адаптивный
+    лимит параллельности. Дополнительно, если пул соединений PostgreSQL
+    или Redis занят целиком дольше admission_pool_wait_threshold, новые
+    запросы отклоняются сразу, не вставая в очередь к пулу: ожидание
+    соединения в этот момент уже не меньше порога. Отклоненный запрос
+    получает 503 с Retry-After и не расходует ни соединения, ни время
+    ответа остальных запросов.
+    """
+    
+    def __init__(self, routes=ADMISSION_ROUTES, saturated: Optional[Callable[[], bool]] = None):
+        self._routes: List[tuple] = [
+            (method, re.compile(pattern), AdaptiveLimiter(name, settings.admission_latency_target * factor))
+            for name, method, pattern, factor in routes
+        ]
+        self._saturated = saturated or pools_saturated
+        self._saturated_since: Optional[float] = None
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0
+        }
+    
+    def match(self, method: str, path: str) -> Optional[AdaptiveLimiter]:
+        """Лимит маршрута или None, если маршрут не ограничивается"""
+        for route_method, pattern, limiter in self._routes:
+            if route_method == method and pattern.match(path):
+                return limiter
+        return None
+    
+    def _pool_wait_exceeded(self) -> bool:
+        try:
+            saturated = self._saturated()
+        except Exception:
+            return False
+        if not saturated:
+            self._saturated_since = None
+            return False
+        now = time.monotonic()
+        if self._saturated_since is None:
+            self._saturated_since = now
+        return now - self._saturated_since >= settings.admission_pool_wait_threshold
+    
+    async def admit(self, limiter: AdaptiveLimiter):
+        """Допуск запроса к маршруту; AdmissionRejected - запрос нужно отклонить"""
+        try:
+            if self._pool_wait_exceeded():
+                raise AdmissionRejected('pool_wait')
+            await limiter.acquire()
+        except AdmissionRejected as e:
+            self.stats['rejected'] += 1
+            metrics.ADMISSION_REJECTED_TOTAL.labels(limiter.name, e.reason).inc()
+            raise
+        self.stats['admitted'] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'routes': {limiter.name: limiter.get_stats() for _, _, limiter in self._routes}
+        }
+
+
+# Глобальный экземпляр
+admission_controller = AdmissionController()
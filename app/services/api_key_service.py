@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, NamedTuple, FrozenSet
+from loguru import logger
+from sqlalchemy import select, update, func
+
+from app.config import settings
+from app.database.database import async_session
+from app.database.models import ApiKey
+from app.services.redis_service import redis_service
+from app.services.events_service import events_service
+
+
+# Оповещение процессов о выпуске и отзыве ключей
+API_KEY_INVALIDATION_CHANNEL = "api_key_invalidate"
+
+# Права ключей; "*" - все права
+API_SCOPES = ('auth', 'clients', 'events', 'webhooks', 'stats', 'admin')
+
+# Формат ключа: tak_<key_id>_<секрет>, key_id - открытая часть для поиска
+API_KEY_PREFIX = "tak"
+API_KEY_FORMAT = re.compile(rf"^{API_KEY_PREFIX}_([0-9a-f]{{16}})_[A-Za-z0-9_\-]{{43}}$")
+
+# Владелец общего ключа settings.api_secret_key
+LEGACY_TENANT = "default"
+
+
+class ApiKeyInfo(NamedTuple):
+    """Проверенный ключ: владелец и права"""
+    key_id: str
+    tenant: str
+    scopes: FrozenSet[str]
+    rate_limit: Optional[str] = None
+    key_hash: str = ""
+    
+    def allows(self, scope: str) -> bool:
+        return "*" in self.scopes or scope in self.scopes
+    
+    def owns(self, tenant: Optional[str]) -> bool:
+        """Доступ к данным владельца tenant: свои данные, ключу с правом admin - любые"""
+        return self.allows('admin') or tenant == self.tenant
+
+
+LEGACY_KEY = ApiKeyInfo(key_id=LEGACY_TENANT, tenant=LEGACY_TENANT, scopes=frozenset({"*"}))
+
+
+def hash_api_key(api_key: str) -> str:
+    """
+    SHA-256 ключа. Ключи случайные (256 бит), поэтому медленный хеш
+    с солью не нужен - подбор по хешу невозможен и без него.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ApiKeyService:
+    """
+    API ключи интеграторов.
+    
+    Ключ ищется по открытой части (key_id) и сверяется по SHA-256 - сам
+    ключ нигде не хранится. Проверенные записи кешируются в памяти процесса
+    на api_key_cache_ttl секунд, отсутствующие key_id - на
+    api_key_negative_ttl, поэтому обычный запрос не обращается к БД.
+    Одновременные промахи по одному key_id загружают запись один раз.
+    Выпуск и отзыв ключа рассылаются процессам через pub/sub и сразу
+    сбрасывают их кеши, TTL ограничивает срок при потере оповещения.
+    Общий ключ settings.api_secret_key продолжает работать с владельцем
+    "default" и всеми правами.
+    """
+    
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self.stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'invalid': 0,
+            'invalidations': 0
+        }
+    
+    async def verify(self, api_key: str) -> Optional[ApiKeyInfo]:
+        """Владелец и права ключа или None, если ключ неизвестен, отозван или неверен"""
+        if settings.api_secret_key and hmac.compare_digest(api_key.encode(), settings.api_secret_key.encode()):
+            return LEGACY_KEY
+        
+        match = API_KEY_FORMAT.match(api_key)
+        if not match:
+            self.stats['invalid'] += 1
+            return None
+        
+        info = await self._lookup(match.group(1))
+        if info is None or not hmac.compare_digest(info.key_hash, hash_api_key(api_key)):
+            self.stats['invalid'] += 1
+            return None
+        return info
+    
+    async def _lookup(self, key_id: str) -> Optional[ApiKeyInfo]:
+        entry = self._entries.get(key_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key_id)
+            self.stats['negative_hits' if entry[1] is None else 'hits'] += 1
+            return entry[1]
+        
+        # Single-flight: остальные ждут уже идущую загрузку
+        loading = self._loading.get(key_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key_id] = future
+        generation = self._generations.get(key_id, 0)
+        try:
+            self.stats['misses'] += 1
+            info = await self._load(key_id)
+            # Не кешируем, если ключ выпущен или отозван во время загрузки
+            if self._generations.get(key_id, 0) == generation:
+                self._store(key_id, info)
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._loading[key_id]
+    
+    def _store(self, key_id: str, info: Optional[ApiKeyInfo]):
+        ttl = settings.api_key_cache_ttl if info is not None else settings.api_key_negative_ttl
+        self._entries[key_id] = (time.monotonic() + ttl, info)
+        self._entries.move_to_end(key_id)
+        while len(self._entries) > settings.api_key_cache_size:
+            self._entries.popitem(last=False)
+    
+    async def _load(self, key_id: str) -> Optional[ApiKeyInfo]:
+        async with async_session() as db:
+            result = await db.execute(
+                select(ApiKey).where(ApiKey.key_id == key_id, ApiKey.is_active.is_(True))
+            )
+            row = result.scalar_one_or_none()
+        if row is None:
+            return None
+        return ApiKeyInfo(
+            key_id=row.key_id,
+            tenant=row.tenant,
+            scopes=frozenset(row.scopes.split()),
+            rate_limit=row.rate_limit,
+            key_hash=row.key_hash
+        )
+    
+    async def create_key(
+        self,
+        tenant: str,
+        scopes: List[str],
+        name: Optional[str] = None,
+        rate_limit: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Выпуск ключа. Сам ключ возвращается только здесь"""
+        key_id = secrets.token_hex(8)
+        api_key = f"{API_KEY_PREFIX}_{key_id}_{secrets.token_urlsafe(32)}"
+        
+        async with async_session() as db:
+            row = ApiKey(
+                key_id=key_id,
+                key_hash=hash_api_key(api_key),
+                tenant=tenant,
+                name=name,
+                scopes=" ".join(sorted(set(scopes))),
+                rate_limit=rate_limit,
+                is_active=True
+            )
+            db.add(row)
+            await db.commit()
+            await db.refresh(row)
+            created_at = row.created_at
+        
+        # key_id мог попасть в отрицательный кеш процессов
+        await self.invalidate(key_id)
+        logger.info(f"API key {key_id} issued for tenant {tenant}")
+        return {
+            'key_id': key_id,
+            'api_key': api_key,
+            'tenant': tenant,
+            'name': name,
+            'scopes': sorted(set(scopes)),
+            'rate_limit': rate_limit,
+            'created_at': created_at.isoformat() if created_at else None
+        }
+    
+    async def list_keys(self, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Активные ключи (без хешей)"""
+        query = select(ApiKey).where(ApiKey.is_active.is_(True)).order_by(ApiKey.id)
+        if tenant:
+            query = query.where(ApiKey.tenant == tenant)
+        async with async_session() as db:
+            result = await db.execute(query)
+            return [
+                {
+                    'key_id': row.key_id,
+                    'tenant': row.tenant,
+                    'name': row.name,
+                    'scopes': row.scopes.split(),
+                    'rate_limit': row.rate_limit,
+                    'created_at': row.created_at.isoformat() if row.created_at else None
+                }
+                for row in result.scalars()
+            ]
+    
+    async def revoke_key(self, key_id: str) -> bool:
+        """Отзыв ключа: запись отключается, кеши всех процессов сбрасываются"""
+        async with async_session() as db:
+            result = await db.execute(
+                update(ApiKey)
+                .where(ApiKey.key_id == key_id, ApiKey.is_active.is_(True))
+                .values(is_active=False, revoked_at=func.now())
+            )
+            await db.commit()
+        
+        await self.invalidate(key_id)
+        if result.rowcount:
+            logger.info(f"API key {key_id} revoked")
+        return result.rowcount > 0
+    
+    def _drop_local(self, key_id: str):
+        self._entries.pop(key_id, None)
+        self._generations[key_id] = self._generations.get(key_id, 0) + 1
+        self.stats['invalidations'] += 1
+    
+    async def invalidate(self, key_id: str):
+        """Сброс ключа в кешах всех процессов"""
+        self._drop_local(key_id)
+        try:
+            await redis_service.redis.publish(API_KEY_INVALIDATION_CHANNEL, json.dumps({'key_id': key_id}))
+        except Exception as e:
+            logger.error(f"Error publishing API key {key_id} invalidation: {e}")
+    
+    def handle_invalidation(self, message: Dict[str, Any]):
+        """Обработчик оповещения о выпуске или отзыве ключа из другого процесса"""
+        key_id = message.get('key_id')
+        if key_id:
+            self._drop_local(key_id)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'size': len(self._entries)
+        }
+
+
+# Глобальный экземпляр
+api_key_service = ApiKeyService()
+events_service.add_handler(API_KEY_INVALIDATION_CHANNEL, api_key_service.handle_invalidation)
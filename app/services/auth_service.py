@@ -1,17 +1,54 @@
+import base64
 import hashlib
-import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, AsyncIterator
+import orjson
 from loguru import logger
 
 from app.services.redis_service import redis_service
+from app.services.events_service import events_service
+from app.services.client_cache import client_cache
+from app.services.rollup_service import rollup_service
+from app.services import metrics
 from app.database.database import async_session
 from app.database.models import AuthRequest, Client
 # from app.bot.handlers import send_auth_request_to_user
-from sqlalchemy import select, update
+from app.bot.sender import telegram_sender
+from app.services.api_key_service import LEGACY_TENANT
+from app.config import settings
+from sqlalchemy import select, update, insert, delete, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+# Поля истории запросов клиента (id нужен только для курсора)
+HISTORY_COLUMNS = (
+    AuthRequest.id,
+    AuthRequest.request_id,
+    AuthRequest.telegram_id,
+    AuthRequest.operation,
+    AuthRequest.amount,
+    AuthRequest.status,
+    AuthRequest.created_at,
+    AuthRequest.approved_at,
+    AuthRequest.rejected_at,
+    AuthRequest.expired_at
+)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Курсор страницы истории: позиция (created_at, id) последней записи"""
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), row_id])).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Разбор курсора. ValueError, если курсор поврежден"""
+    try:
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
 class AuthService:
     """Сервис для работы с авторизацией клиентов"""
     
@@ -24,17 +61,9 @@ class AuthService:
         metadata: Optional[Dict[str, Any]] = None
     ) -> str:
         """Создание запроса на авторизацию"""
-        from app.bot.handlers import send_auth_request_to_user
         try:
-            # Проверяем лимит активных запросов
-            pending_count = await redis_service.get_user_pending_requests_count(telegram_id)
-            from app.config import settings
-            
-            if pending_count >= settings.max_pending_requests:
-                raise ValueError(f"Превышен лимит активных запросов ({settings.max_pending_requests})")
-            
-            # Генерируем уникальный ID запроса
-            request_id = str(uuid.uuid4())
+            # Генерируем уникальный ID запроса (с шардом пользователя, см. new_request_id)
+            request_id = redis_service.new_request_id(telegram_id)
             
             # Данные для сохранения в Redis
             redis_payload = {
@@ -44,35 +73,55 @@ class AuthService:
                 'operation': operation,
                 'amount': amount,
                 'status': 'pending',
+                'delivery_status': 'queued',
                 'created_at': datetime.now().isoformat(),
                 'metadata': metadata or {}
             }
             
-            # Сохраняем в Redis с TTL
-            await redis_service.set_auth_request(request_id, redis_payload)
-            
-            # Сохраняем в базу данных для истории
-            async with async_session() as db:
-                db_request = AuthRequest(
-                    request_id=request_id,
-                    client_id=client_id,
-                    telegram_id=telegram_id,
-                    operation=operation,
-                    amount=amount,
-                    status='pending',
-                    metadata_json=str(metadata) if metadata else None
+            # Атомарно проверяем лимит активных запросов и сохраняем в Redis с TTL
+            with metrics.CREATE_REDIS_RESERVE.time():
+                reserved = await redis_service.reserve_auth_request(
+                    request_id,
+                    telegram_id,
+                    redis_payload,
+                    limit=settings.max_pending_requests
                 )
-                db.add(db_request)
-                await db.commit()
+            if not reserved:
+                raise ValueError(f"Превышен лимит активных запросов ({settings.max_pending_requests})")
             
-            # Отправляем уведомление пользователю в Telegram
-            await send_auth_request_to_user(
-                telegram_id=telegram_id,
-                request_id=request_id,
-                operation=operation,
-                amount=amount,
-                client_id=client_id
-            )
+            try:
+                # Сохраняем в базу данных для истории
+                # (в режиме write-behind запись сделает фоновый обработчик)
+                if not settings.db_write_behind:
+                    with metrics.CREATE_DB_INSERT.time():
+                        async with async_session() as db:
+                            db_request = AuthRequest(
+                                request_id=request_id,
+                                client_id=client_id,
+                                telegram_id=telegram_id,
+                                operation=operation,
+                                amount=amount,
+                                status='pending',
+                                metadata_json=str(metadata) if metadata else None
+                            )
+                            db.add(db_request)
+                            await db.commit()
+                
+                # Ставим уведомление пользователю в приоритетную очередь отправки
+                with metrics.CREATE_TELEGRAM_ENQUEUE.time():
+                    await telegram_sender.enqueue(
+                        priority=True,
+                        telegram_id=telegram_id,
+                        request_id=request_id,
+                        operation=operation,
+                        amount=amount,
+                        client_id=client_id
+                    )
+            except BaseException:
+                await self._discard_requests([(request_id, telegram_id)])
+                raise
+            
+            rollup_service.record_created(client_id, redis_payload['created_at'], amount)
             
             logger.info(f"Auth request {request_id} created for client {client_id}")
             return request_id
@@ -81,60 +130,197 @@ class AuthService:
             logger.error(f"Error creating auth request: {e}")
             raise
     
-    async def approve_request(self, request_id: str, user_id: int):
-        """Подтверждение запроса авторизации"""
-        try:
-            # Обновляем статус в Redis
-            await redis_service.update_auth_request_status(
-                request_id, 
-                'approved',
-                {'approved_by': user_id}
+    async def create_auth_requests_batch(
+        self,
+        items: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Пакетное создание запросов на авторизацию.
+        
+        Клиенты проверяются одним запросом, слоты резервируются и записи
+        сохраняются в Redis одним pipeline, история - одним INSERT, а отправка
+        в Telegram передается фоновому отправителю. Возвращает результат
+        по каждому элементу в исходном порядке.
+        """
+        results: List[Dict[str, Any]] = [
+            {'index': index, 'request_id': None, 'status': 'error', 'error': None}
+            for index in range(len(items))
+        ]
+        
+        # Проверяем клиентов одним запросом
+        client_ids = {item['client_id'] for item in items}
+        async with async_session() as db:
+            rows = await db.execute(
+                select(Client.client_id, Client.telegram_id).where(Client.client_id.in_(client_ids))
             )
+            client_telegram_ids = dict(rows.all())
+        
+        payloads = []
+        for index, item in enumerate(items):
+            if item['client_id'] not in client_telegram_ids:
+                results[index]['error'] = f"Client {item['client_id']} not found"
+            elif client_telegram_ids[item['client_id']] != item['telegram_id']:
+                results[index]['error'] = "Telegram ID does not match client info"
+            else:
+                payload = {
+                    'request_id': redis_service.new_request_id(item['telegram_id']),
+                    'client_id': item['client_id'],
+                    'telegram_id': item['telegram_id'],
+                    'operation': item['operation'],
+                    'amount': item.get('amount'),
+                    'status': 'pending',
+                    'delivery_status': 'queued',
+                    'created_at': datetime.now().isoformat(),
+                    'metadata': item.get('metadata') or {}
+                }
+                payloads.append((index, payload))
+        
+        if not payloads:
+            return results
+        
+        # Резервируем слоты и сохраняем в Redis одним pipeline
+        reserved = await redis_service.reserve_auth_requests_batch(
+            [payload for _, payload in payloads],
+            limit=settings.max_pending_requests
+        )
+        accepted = []
+        for (index, payload), ok in zip(payloads, reserved):
+            if ok:
+                accepted.append((index, payload))
+            else:
+                results[index]['error'] = (
+                    f"Превышен лимит активных запросов ({settings.max_pending_requests})"
+                )
+        
+        if not accepted:
+            return results
+        
+        try:
+            # Сохраняем историю одним INSERT
+            if not settings.db_write_behind:
+                async with async_session() as db:
+                    await db.execute(
+                        insert(AuthRequest).values([
+                            {
+                                'request_id': payload['request_id'],
+                                'client_id': payload['client_id'],
+                                'telegram_id': payload['telegram_id'],
+                                'operation': payload['operation'],
+                                'amount': payload['amount'],
+                                'status': 'pending',
+                                'metadata_json': str(payload['metadata']) if payload['metadata'] else None
+                            }
+                            for _, payload in accepted
+                        ])
+                    )
+                    await db.commit()
             
-            # Обновляем в базе данных
+            # Отправка в Telegram через общую очередь с учетом лимитов Bot API
+            await telegram_sender.enqueue_many([
+                {
+                    'telegram_id': payload['telegram_id'],
+                    'request_id': payload['request_id'],
+                    'operation': payload['operation'],
+                    'amount': payload['amount'],
+                    'client_id': payload['client_id']
+                }
+                for _, payload in accepted
+            ])
+        except BaseException:
+            await self._discard_requests([(payload['request_id'], payload['telegram_id']) for _, payload in accepted])
+            raise
+        
+        for _, payload in accepted:
+            rollup_service.record_created(payload['client_id'], payload['created_at'], payload['amount'])
+        for index, payload in accepted:
+            results[index].update(request_id=payload['request_id'], status='pending')
+        
+        logger.info(f"Batch of {len(accepted)}/{len(items)} auth requests created")
+        return results
+    
+    async def _discard_requests(self, requests: List[tuple]):
+        """
+        Отмена зарезервированных запросов (request_id, telegram_id), которые
+        не удалось записать в БД или поставить в очередь отправки: иначе они
+        занимают слоты активных запросов пользователя, а затем "истекают"
+        с событиями и webhook'ами, хотя пользователь их не видел.
+        Ошибки только логируются, чтобы не скрыть исходную.
+        """
+        request_ids = [request_id for request_id, _ in requests]
+        for request_id, telegram_id in requests:
+            try:
+                await redis_service.discard_auth_request(request_id, telegram_id)
+            except Exception as e:
+                logger.error(f"Error discarding auth request {request_id}: {e}")
+        
+        if settings.db_write_behind:
+            return
+        try:
             async with async_session() as db:
-                result = await db.execute(
-                    update(AuthRequest)
-                    .where(AuthRequest.request_id == request_id)
-                    .values(
-                        status='approved',
-                        approved_at=datetime.now()
-                    )
-                )
+                await db.execute(delete(AuthRequest).where(AuthRequest.request_id.in_(request_ids)))
                 await db.commit()
-            
-            logger.info(f"Auth request {request_id} approved by user {user_id}")
-            
         except Exception as e:
-            logger.error(f"Error approving request: {e}")
-            raise
+            logger.error(f"Error deleting discarded auth requests: {e}")
+    
+    async def approve_request(self, request_id: str, user_id: int) -> Dict[str, Optional[str]]:
+        """Подтверждение запроса авторизации"""
+        return await self._complete_request(request_id, user_id, 'approved')
     
-    async def reject_request(self, request_id: str, user_id: int):
+    async def reject_request(self, request_id: str, user_id: int) -> Dict[str, Optional[str]]:
         """Отклонение запроса авторизации"""
+        return await self._complete_request(request_id, user_id, 'rejected')
+    
+    async def _complete_request(
+        self,
+        request_id: str,
+        user_id: int,
+        status: str
+    ) -> Dict[str, Optional[str]]:
+        """
+        Перевод активного запроса в конечный статус (approved/rejected).
+        
+        Возвращает результат перехода в Redis: если запрос уже обработан
+        (result != 'ok'), база данных не обновляется.
+        """
         try:
-            # Обновляем статус в Redis
-            await redis_service.update_auth_request_status(
+            # Атомарно обновляем статус в Redis
+            transition = await redis_service.transition_auth_request_status(
                 request_id,
-                'rejected',
-                {'rejected_by': user_id}
+                user_id,
+                status,
+                additional_info={f'{status}_by': user_id}
+            )
+            if transition['result'] != 'ok':
+                return transition
+            
+            metrics.AUTH_REQUESTS_FINALIZED_TOTAL.labels(status).inc()
+            if transition['created_at']:
+                metrics.AUTH_DECISION_SECONDS.labels(status).observe(
+                    (datetime.now() - datetime.fromisoformat(transition['created_at'])).total_seconds()
+                )
+            rollup_service.record_decision(
+                transition['client_id'],
+                status,
+                transition['created_at'],
+                amount=transition['amount']
             )
             
             # Обновляем в базе данных
-            async with async_session() as db:
-                result = await db.execute(
-                    update(AuthRequest)
-                    .where(AuthRequest.request_id == request_id)
-                    .values(
-                        status='rejected',
-                        rejected_at=datetime.now()
+            if not settings.db_write_behind:
+                timestamp_field = 'approved_at' if status == 'approved' else 'rejected_at'
+                async with async_session() as db:
+                    await db.execute(
+                        update(AuthRequest)
+                        .where(AuthRequest.request_id == request_id)
+                        .values(status=status, **{timestamp_field: datetime.now()})
                     )
-                )
-                await db.commit()
+                    await db.commit()
             
-            logger.info(f"Auth request {request_id} rejected by user {user_id}")
+            logger.info(f"Auth request {request_id} {status} by user {user_id}")
+            return transition
             
         except Exception as e:
-            logger.error(f"Error rejecting request: {e}")
+            logger.error(f"Error completing request {request_id} as {status}: {e}")
             raise
     
     async def get_request_status(self, request_id: str) -> Optional[Dict[str, Any]]:
@@ -163,6 +349,7 @@ class AuthService:
                         'created_at': db_request.created_at.isoformat() if db_request.created_at else None,
                         'approved_at': db_request.approved_at.isoformat() if db_request.approved_at else None,
                         'rejected_at': db_request.rejected_at.isoformat() if db_request.rejected_at else None,
+                        'expired_at': db_request.expired_at.isoformat() if db_request.expired_at else None,
                         'metadata': db_request.metadata_json
                     }
             
@@ -172,6 +359,66 @@ class AuthService:
             logger.error(f"Error getting request status: {e}")
             return None
     
+    async def iter_client_requests(
+        self,
+        client_id: str,
+        statuses: Optional[List[str]] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        История запросов клиента, от новых к старым.
+        
+        Пагинация по ключу (created_at, id): следующая страница начинается
+        строго после позиции курсора, поэтому глубокие страницы читаются по
+        индексу (client_id, created_at, id) так же быстро, как первая, без
+        OFFSET. Строки читаются из БД порциями, а не целиком.
+        """
+        query = select(*HISTORY_COLUMNS).where(AuthRequest.client_id == client_id)
+        if statuses:
+            query = query.where(AuthRequest.status.in_(statuses))
+        if created_from:
+            query = query.where(AuthRequest.created_at >= created_from)
+        if created_to:
+            query = query.where(AuthRequest.created_at < created_to)
+        if cursor:
+            query = query.where(
+                tuple_(AuthRequest.created_at, AuthRequest.id) < tuple_(*decode_cursor(cursor))
+            )
+        query = (
+            query
+            .order_by(AuthRequest.created_at.desc(), AuthRequest.id.desc())
+            .limit(limit)
+            .execution_options(yield_per=settings.history_fetch_size)
+        )
+        
+        async with async_session() as db:
+            result = await db.stream(query)
+            async for row in result.mappings():
+                yield dict(row)
+    
+    async def wait_for_request_status(
+        self,
+        request_id: str,
+        wait: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Получение статуса запроса с ожиданием (long-poll): если запрос еще
+        в статусе pending, ждем его изменения не дольше wait секунд.
+        """
+        # Подписываемся до чтения статуса, чтобы не пропустить событие
+        future = events_service.subscribe(request_id)
+        try:
+            status_info = await self.get_request_status(request_id)
+            if status_info and status_info.get('status') == 'pending' and wait > 0:
+                if await events_service.wait_for_event(future, wait):
+                    status_info = await self.get_request_status(request_id) or status_info
+            return status_info
+        finally:
+            events_service.unsubscribe(request_id, future)
+    
     async def register_client(
         self,
         client_id: str,
@@ -180,9 +427,10 @@ class AuthService:
         last_name: Optional[str] = None,
         username: Optional[str] = None,
         phone: Optional[str] = None,
-        email: Optional[str] = None
+        email: Optional[str] = None,
+        tenant: str = LEGACY_TENANT
     ) -> bool:
-        """Регистрация нового клиента"""
+        """Регистрация нового клиента, tenant - владелец ключа, которым клиент зарегистрирован"""
         try:
             async with async_session() as db:
                 # Проверяем, существует ли клиент
@@ -205,12 +453,15 @@ class AuthService:
                     username=username,
                     phone=phone,
                     email=email,
+                    tenant=tenant,
                     is_active=True
                 )
                 
                 db.add(client)
                 await db.commit()
                 
+                await client_cache.invalidate(client_id)
+                
                 logger.info(f"Client {client_id} registered successfully")
                 return True
                 
@@ -219,32 +470,41 @@ class AuthService:
             return False
     
     async def get_client_by_id(self, client_id: str) -> Optional[Dict[str, Any]]:
-        """Получение данных клиента по ID"""
+        """Получение данных клиента по ID (через кеш)"""
         try:
-            async with async_session() as db:
-                result = await db.execute(
-                    select(Client).where(Client.client_id == client_id)
-                )
-                client = result.scalar_one_or_none()
-                
-                if client:
-                    return {
-                        'client_id': client.client_id,
-                        'telegram_id': client.telegram_id,
-                        'first_name': client.first_name,
-                        'last_name': client.last_name,
-                        'username': client.username,
-                        'phone': client.phone,
-                        'email': client.email,
-                        'is_active': client.is_active,
-                        'created_at': client.created_at.isoformat() if client.created_at else None
-                    }
-                
-                return None
-                
+            return await client_cache.get(client_id, self._load_client)
         except Exception as e:
             logger.error(f"Error getting client: {e}")
             return None
+    
+    async def get_client_tenant(self, client_id: str) -> Optional[str]:
+        """Владелец клиента (None, если клиента нет). Ошибки не скрываются: по ответу проверяется доступ"""
+        client = await client_cache.get(client_id, self._load_client)
+        return client['tenant'] if client else None
+    
+    async def _load_client(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """Загрузка данных клиента из базы данных"""
+        async with async_session() as db:
+            result = await db.execute(
+                select(Client).where(Client.client_id == client_id)
+            )
+            client = result.scalar_one_or_none()
+            
+            if client:
+                return {
+                    'client_id': client.client_id,
+                    'telegram_id': client.telegram_id,
+                    'first_name': client.first_name,
+                    'last_name': client.last_name,
+                    'username': client.username,
+                    'phone': client.phone,
+                    'email': client.email,
+                    'tenant': client.tenant,
+                    'is_active': client.is_active,
+                    'created_at': client.created_at.isoformat() if client.created_at else None
+                }
+            
+            return None
 
 
 # Глобальный экземпляр
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services.events_service import events_service
+
+
+# Канал оповещения процессов об изменении клиента
+CLIENT_INVALIDATION_CHANNEL = "client_cache_invalidate"
+
+
+class ClientCache:
+    """
+    Двухуровневый кеш данных клиентов: LRU в памяти процесса с TTL
+    и общий уровень в Redis.
+
+    Одновременные промахи по одному client_id загружают данные из базы
+    один раз (single-flight). Изменение клиента сбрасывает оба уровня
+    и рассылается остальным процессам через pub/sub.
+    """
+
+    def __init__(
+        self,
+        max_size: int = settings.client_cache_size,
+        ttl: int = settings.client_cache_ttl,
+        redis_ttl: int = settings.client_cache_redis_ttl
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self.stats = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    @staticmethod
+    def _redis_key(client_id: str) -> str:
+        # v2: в данных клиента есть tenant, записи без него не читаются
+        return f"client_cache:v2:{client_id}"
+
+    def _get_local(self, client_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(client_id)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[client_id]
+            return None
+        self._entries.move_to_end(client_id)
+        return value
+
+    def _set_local(self, client_id: str, value: Dict[str, Any]):
+        self._entries[client_id] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(client_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    async def get(
+        self,
+        client_id: str,
+        loader: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """Получение клиента из кеша, при промахе - через loader (база данных)"""
+        value = self._get_local(client_id)
+        if value is not None:
+            self.stats['local_hits'] += 1
+            return value
+
+        # Single-flight: остальные ждут уже идущую загрузку
+        loading = self._loading.get(client_id)
+        if loading is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[client_id] = future
+        try:
+            value = await self._load(client_id, loader)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие, в самом future его не оставляем
+            future.exception()
+            raise
+        finally:
+            del self._loading[client_id]
+
+    async def _load(
+        self,
+        client_id: str,
+        loader: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        generation = self._generations.get(client_id, 0)
+
+        try:
+            cached = await redis_service.redis.get(self._redis_key(client_id))
+        except Exception as e:
+            logger.warning(f"Client cache Redis tier unavailable: {e}")
+            cached = None
+
+        if cached is not None:
+            self.stats['redis_hits'] += 1
+            value = json.loads(cached)
+        else:
+            self.stats['misses'] += 1
+            value = await loader(client_id)
+            if value is None:
+                return None
+            try:
+                await redis_service.redis.set(
+                    self._redis_key(client_id),
+                    json.dumps(value, default=str),
+                    ex=self.redis_ttl
+                )
+            except Exception as e:
+                logger.warning(f"Error writing client {client_id} to Redis cache: {e}")
+
+        # Не кешируем локально, если клиент изменился во время загрузки
+        if self._generations.get(client_id, 0) == generation:
+            self._set_local(client_id, value)
+        return value
+
+    def _drop_local(self, client_id: str):
+        self._entries.pop(client_id, None)
+        self._generations[client_id] = self._generations.get(client_id, 0) + 1
+        self.stats['invalidations'] += 1
+
+    async def invalidate(self, client_id: str):
+        """Сброс клиента во всех уровнях кеша и во всех процессах"""
+        self._drop_local(client_id)
+        try:
+            async with redis_service.pipeline() as pipe:
+                pipe.delete(self._redis_key(client_id))
+                pipe.publish(CLIENT_INVALIDATION_CHANNEL, json.dumps({'client_id': client_id}))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error invalidating client {client_id} in cache: {e}")
+
+    def handle_invalidation(self, message: Dict[str, Any]):
+        """Обработчик оповещения об изменении клиента из другого процесса"""
+        client_id = message.get('client_id')
+        if client_id:
+            self._drop_local(client_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов для подбора размера кеша"""
+        lookups = (
+            self.stats['local_hits'] + self.stats['redis_hits']
+            + self.stats['coalesced'] + self.stats['misses']
+        )
+        return {
+            **self.stats,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hit_ratio': round((lookups - self.stats['misses']) / lookups, 4) if lookups else None
+        }
+
+
+# Глобальный экземпляр
+client_cache = ClientCache()
+events_service.add_handler(CLIENT_INVALIDATION_CHANNEL, client_cache.handle_invalidation)
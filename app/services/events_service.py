@@ -0,0 +1,160 @@
+import asyncio
+import json
+from typing import Optional, Dict, Any, Set, Iterable, Callable
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service, AUTH_EVENTS_CHANNEL, event_id_key
+
+
+# Тип события для потока по статусу запроса
+EVENT_TYPES = {
+    'pending': 'created',
+    'approved': 'approved',
+    'rejected': 'rejected',
+    'expired': 'expired',
+}
+
+
+class EventSubscription:
+    """
+    Подписка потока событий (SSE) на набор client_id.
+    
+    Буфер ограничен: при переполнении подписка помечается как отставшая
+    и должна быть закрыта, клиент возобновляет поток через Last-Event-ID.
+    """
+    
+    def __init__(self, client_ids: Iterable[str], buffer_size: int = settings.sse_buffer_size):
+        self.client_ids = set(client_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.overflowed = False
+    
+    def push(self, event: Dict[str, Any]):
+        """Добавление события в буфер подписки"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            logger.warning(f"Slow event stream consumer for clients {sorted(self.client_ids)}")
+
+
+class EventsService:
+    """
+    Сервис событий изменения статуса запросов.
+    
+    Держит одну pub/sub подписку на процесс и раздает события локальным
+    ожидающим (long-poll), не создавая подписку на каждого ожидающего.
+    """
+    
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._streams: Dict[str, Set[EventSubscription]] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            AUTH_EVENTS_CHANNEL: self._dispatch
+        }
+    
+    def add_handler(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        """
+        Подписка обработчика на дополнительный канал через общую подписку
+        процесса. Обработчики регистрируются до запуска.
+        """
+        self._handlers[channel] = handler
+    
+    async def start(self):
+        """Запуск фонового подписчика"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+            logger.info("Events listener started")
+    
+    async def stop(self):
+        """Остановка фонового подписчика"""
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+            logger.info("Events listener stopped")
+    
+    async def _listen(self):
+        """Чтение событий из Redis с переподключением при ошибках"""
+        while True:
+            pubsub = redis_service.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*self._handlers)
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    try:
+                        event = json.loads(message['data'])
+                    except ValueError:
+                        logger.warning(f"Malformed event in {message['channel']}: {message['data']!r}")
+                        continue
+                    self._handlers[message['channel']](event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Events listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+    
+    def _dispatch(self, event: Dict[str, Any]):
+        """Пробуждение ожидающих изменения статуса и раздача событий потокам"""
+        for future in self._waiters.pop(event.get('request_id'), ()):
+            if not future.done():
+                future.set_result(event)
+        
+        for subscription in tuple(self._streams.get(event.get('client_id'), ())):
+            subscription.push(event)
+            if subscription.overflowed:
+                self.close_stream(subscription)
+    
+    def subscribe(self, request_id: str) -> asyncio.Future:
+        """Регистрация ожидающего события по запросу"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(request_id, set()).add(future)
+        return future
+    
+    def unsubscribe(self, request_id: str, future: asyncio.Future):
+        """Снятие регистрации ожидающего"""
+        waiters = self._waiters.get(request_id)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                del self._waiters[request_id]
+    
+    def open_stream(self, client_ids: Iterable[str]) -> EventSubscription:
+        """Открытие подписки потока событий на набор client_id"""
+        subscription = EventSubscription(client_ids)
+        for client_id in subscription.client_ids:
+            self._streams.setdefault(client_id, set()).add(subscription)
+        return subscription
+    
+    def close_stream(self, subscription: EventSubscription):
+        """Закрытие подписки потока событий"""
+        for client_id in subscription.client_ids:
+            streams = self._streams.get(client_id)
+            if streams is not None:
+                streams.discard(subscription)
+                if not streams:
+                    del self._streams[client_id]
+    
+    async def wait_for_event(
+        self,
+        future: asyncio.Future,
+        timeout: float
+    ) -> Optional[Dict[str, Any]]:
+        """Ожидание события не дольше timeout секунд"""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# Глобальный экземпляр
+events_service = EventsService()
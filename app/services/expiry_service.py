@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from loguru import logger
+from redis.exceptions import ResponseError, NoScriptError
+from sqlalchemy import update, func
+
+from app.config import settings
+from app.database.database import async_session
+from app.database.models import AuthRequest
+from app.services import metrics
+from app.services.rollup_service import rollup_service
+from app.services.redis_service import (
+    redis_service,
+    EMIT_EVENT_LUA,
+    MIGRATE_RECORD_LUA,
+    AUTH_EVENTS_CHANNEL,
+    AUTH_EVENTS_LOG_KEY,
+    AUTH_HISTORY_STREAM_KEY,
+    AUTH_DEADLINES_KEY,
+    WEBHOOK_OUTBOX_KEY
+)
+
+
+# Поток истекших запросов для записи в БД и правки сообщений в Telegram
+AUTH_EXPIRED_STREAM_KEY = "auth_expired_stream"
+
+# Группа потребителей потока истекших запросов
+EXPIRY_GROUP = "expiry"
+
+# Через сколько секунд простоя записи упавшего обработчика забираются другим
+EXPIRY_CLAIM_IDLE_SECONDS = 30
+
+
+# Истечение одного запроса, срок которого прошел. Срок удаляется из
+# auth_deadlines атомарно с истечением, поэтому обработчики разных процессов
+# не пересекаются: второй вызов для того же запроса ничего не делает.
+# Для запроса в статусе pending: статус expired, удаление из индекса
+# пользователя, событие, запись в поток истекших (и в поток истории
+# в режиме write-behind). Все ключи объявлены в KEYS и лежат в одном шарде.
+# KEYS: сроки, запись запроса, индекс активных запросов пользователя,
+#       журнал событий, поток истории, поток истекших, исходящие события для webhook'ов
+# ARGV: request_id, время (ISO), канал событий, длина журнала,
+#       режим write-behind (1/0), доставка webhook'ов (1/0)
+# Возвращает 1, если запрос истек
+EXPIRE_REQUEST_SCRIPT = EMIT_EVENT_LUA + MIGRATE_RECORD_LUA + """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+migrate_record(KEYS[2])
+local current = redis.call('HMGET', KEYS[2], 'status', 'telegram_id', 'client_id', 'message_id', 'created_at', 'amount')
+if current[1] ~= 'pending' then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'status', 'expired', 'updated_at', ARGV[2], 'expired_at', ARGV[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+emit_event(KEYS[4], ARGV[3], ARGV[4], {
+    request_id = ARGV[1],
+    client_id = current[3],
+    telegram_id = tonumber(current[2]),
+    status = 'expired',
+    old_status = 'pending',
+    timestamp = ARGV[2]
+}, ARGV[6] == '1' and KEYS[7] or nil)
+if ARGV[5] == '1' then
+    redis.call('XADD', KEYS[5], '*', 'op', 'update', 'data', cjson.encode({
+        request_id = ARGV[1],
+        status = 'expired',
+        timestamp = ARGV[2]
+    }))
+end
+redis.call('XADD', KEYS[6], '*', 'data', cjson.encode({
+    request_id = ARGV[1],
+    telegram_id = tonumber(current[2]),
+    message_id = tonumber(current[4] or ''),
+    client_id = current[3],
+    created_at = current[5],
+    amount = current[6],
+    expired_at = ARGV[2]
+}))
+return 1
+"""
+
+
+class ExpiryService:
+    """
+    Обработка истечения срока запросов на авторизацию.
+    
+    Сроки всех активных запросов хранятся в sorted set auth_deadlines.
+    Фоновый цикл несколько раз в секунду читает наступившие сроки пачками,
+    узнает пользователей запросов и переводит каждый запрос в expired
+    скриптом с объявленными ключами (одним pipeline на пачку). Затем записи из потока истекших
+    пачками применяются к БД (status = 'expired', expired_at), а у сообщений
+    в Telegram убираются кнопки. В Redis Cluster сроки и поток истекших
+    ведутся по шардам, сроки всех шардов обрабатываются каждый тик.
+    """
+    
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+        self._expire_script = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.stats = {
+            'expired': 0,
+            'messages_updated': 0,
+            'last_tick_lag_seconds': None
+        }
+    
+    async def start(self):
+        """Запуск фоновых обработчиков"""
+        if self._tasks:
+            return
+        
+        self._expire_script = redis_service.redis.register_script(EXPIRE_REQUEST_SCRIPT)
+        for shard in redis_service.shards:
+            try:
+                await redis_service.redis.xgroup_create(
+                    redis_service.shard_key(AUTH_EXPIRED_STREAM_KEY, shard), EXPIRY_GROUP, id="0", mkstream=True
+                )
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        
+        self._tasks = [asyncio.create_task(self._expire_loop())] + [
+            asyncio.create_task(self._finalize_loop(redis_service.shard_key(AUTH_EXPIRED_STREAM_KEY, shard)))
+            for shard in redis_service.shards
+        ]
+        logger.info("Expiry engine started")
+    
+    async def stop(self):
+        """Остановка фоновых обработчиков"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Expiry engine stopped")
+    
+    async def expire_due(self) -> int:
+        """Истечение всех запросов с наступившим сроком во всех шардах. Возвращает их количество"""
+        return sum(await asyncio.gather(*[self._expire_shard(shard) for shard in redis_service.shards]))
+    
+    async def _expire_shard(self, shard: int) -> int:
+        deadlines = redis_service.shard_key(AUTH_DEADLINES_KEY, shard)
+        total = 0
+        while True:
+            due = await redis_service.redis.zrangebyscore(
+                deadlines, "-inf", time.time(), start=0, num=settings.expiry_batch_size
+            )
+            if not due:
+                return total
+            
+            owners = await self._owners(due)
+            # Записей уже нет (истекли по TTL): удаляем только сроки
+            missing = [request_id for request_id in due if owners.get(request_id) is None]
+            if missing:
+                await redis_service.redis.zrem(deadlines, *missing)
+            
+            calls = [
+                self._expire_call(shard, request_id, owners[request_id])
+                for request_id in due if owners.get(request_id) is not None
+            ]
+            if calls:
+                async with redis_service.redis.pipeline(transaction=False) as pipe:
+                    for call in calls:
+                        await self._expire_script(client=pipe, **call)
+                    results = await pipe.execute(raise_on_error=False)
+                # Узел кластера, не знающий скрипт, отвечает NOSCRIPT: повторяем с загрузкой
+                for i, result in enumerate(results):
+                    if isinstance(result, NoScriptError):
+                        results[i] = await self._expire_script(**calls[i])
+                    elif isinstance(result, Exception):
+                        raise result
+                total += sum(results)
+            
+            if len(due) < settings.expiry_batch_size:
+                return total
+    
+    async def _owners(self, request_ids: List[str]) -> Dict[str, Optional[int]]:
+        """telegram_id запросов (None - записи нет) одним pipeline"""
+        async with redis_service.redis.pipeline(transaction=False) as pipe:
+            for request_id in request_ids:
+                pipe.hget(redis_service._request_key(request_id), 'telegram_id')
+            values = await pipe.execute(raise_on_error=False)
+        
+        owners = {}
+        for request_id, value in zip(request_ids, values):
+            if isinstance(value, ResponseError) and 'WRONGTYPE' in str(value):
+                # Запись еще в прежнем формате (JSON-строка)
+                info = await redis_service.get_auth_request(request_id)
+                value = info.get('telegram_id') if info else None
+            elif isinstance(value, Exception):
+                raise value
+            owners[request_id] = int(value) if value is not None else None
+        return owners
+    
+    def _expire_call(self, shard: int, request_id: str, telegram_id: int) -> Dict[str, list]:
+        """Ключи и аргументы скрипта истечения запроса"""
+        return {
+            'keys': [
+                redis_service.shard_key(AUTH_DEADLINES_KEY, shard),
+                redis_service._request_key(request_id),
+                redis_service._pending_index_key(telegram_id, shard),
+                redis_service.shard_key(AUTH_EVENTS_LOG_KEY, shard),
+                redis_service.shard_key(AUTH_HISTORY_STREAM_KEY, shard),
+                redis_service.shard_key(AUTH_EXPIRED_STREAM_KEY, shard),
+                redis_service.shard_key(WEBHOOK_OUTBOX_KEY, shard)
+            ],
+            'args': [
+                request_id,
+                datetime.now().isoformat(),
+                AUTH_EVENTS_CHANNEL,
+                settings.events_log_maxlen,
+                int(settings.db_write_behind),
+                int(settings.webhooks_enabled)
+            ]
+        }
+    
+    async def _expire_loop(self):
+        while True:
+            try:
+                expired = await self.expire_due()
+                if expired:
+                    self.stats['expired'] += expired
+                    metrics.AUTH_REQUESTS_FINALIZED_TOTAL.labels("expired").inc(expired)
+                    logger.info(f"Expired {expired} auth requests")
+                
+                # Отставание самого старого из еще не обработанных сроков
+                oldest = await asyncio.gather(*[
+                    redis_service.redis.zrange(redis_service.shard_key(AUTH_DEADLINES_KEY, shard), 0, 0, withscores=True)
+                    for shard in redis_service.shards
+                ])
+                deadlines = [shard_oldest[0][1] for shard_oldest in oldest if shard_oldest]
+                self.stats['last_tick_lag_seconds'] = (
+                    max(0.0, round(time.time() - min(deadlines), 3)) if deadlines else 0.0
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Expiry engine error: {e}")
+            await asyncio.sleep(settings.expiry_tick_interval)
+    
+    async def _finalize_loop(self, stream: str):
+        while True:
+            try:
+                _, entries, *_ = await redis_service.redis.xautoclaim(
+                    stream,
+                    EXPIRY_GROUP,
+                    self._consumer,
+                    min_idle_time=EXPIRY_CLAIM_IDLE_SECONDS * 1000,
+                    count=settings.expiry_batch_size
+                )
+                entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+                if not entries:
+                    response = await redis_service.redis.xreadgroup(
+                        EXPIRY_GROUP,
+                        self._consumer,
+                        {stream: ">"},
+                        count=settings.expiry_batch_size,
+                        block=5000
+                    )
+                    entries = response[0][1] if response else []
+                
+                if entries:
+                    await self._finalize(stream, entries)
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Expiry finalize error: {e}")
+                await asyncio.sleep(1)
+    
+    async def _finalize(self, stream: str, entries: List[tuple]):
+        """
+        Запись истечения в БД одним UPDATE, подтверждение записей потока,
+        учет в итогах и правка сообщений в Telegram.
+        
+        Записи подтверждаются сразу после БД (повтор UPDATE безопасен), а итоги
+        учитываются только после подтверждения: повторная доставка пачки
+        (XAUTOCLAIM) не учитывает истечения дважды. Ошибка правки сообщений
+        не возвращает пачку в поток.
+        """
+        expired = [json.loads(fields['data']) for _, fields in entries]
+        if not settings.db_write_behind:
+            async with async_session() as db:
+                await db.execute(
+                    update(AuthRequest)
+                    .where(
+                        AuthRequest.request_id.in_([item['request_id'] for item in expired]),
+                        AuthRequest.status == 'pending'
+                    )
+                    .values(status='expired', expired_at=func.now())
+                )
+                await db.commit()
+        
+        entry_ids = [entry_id for entry_id, _ in entries]
+        async with redis_service.pipeline() as pipe:
+            pipe.xack(stream, EXPIRY_GROUP, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+        
+        for item in expired:
+            rollup_service.record_decision(
+                item.get('client_id'),
+                'expired',
+                item.get('created_at'),
+                item.get('expired_at'),
+                item.get('amount')
+            )
+        
+        semaphore = asyncio.Semaphore(settings.expiry_edit_concurrency)
+        
+        async def edit(item: Dict[str, Any]):
+            async with semaphore:
+                await self._remove_buttons(item['telegram_id'], item.get('message_id'))
+        
+        results = await asyncio.gather(*(edit(item) for item in expired), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.error(f"Cannot update {len(errors)} expired messages: {errors[0]}")
+    
+    async def _remove_buttons(self, chat_id: int, message_id: Optional[int]):
+        """Удаление кнопок у сообщения с истекшим запросом"""
+        if not message_id:
+            return
+        
+        from app.bot.bot import bot
+        from app.bot.sender import telegram_sender
+        
+        while True:
+            await telegram_sender.wait_for_slot(chat_id)
+            try:
+                await bot.edit_message_reply_markup(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=None
+                )
+                self.stats['messages_updated'] += 1
+                return
+            except TelegramRetryAfter as e:
+                await telegram_sender.pause(e.retry_after)
+            except TelegramAPIError as e:
+                # Сообщение удалено, уже без кнопок или бот заблокирован
+                logger.warning(f"Cannot update expired message {message_id} in chat {chat_id}: {e}")
+                return
+
+
+# Глобальный экземпляр
+expiry_service = ExpiryService()
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+from loguru import logger
+from redis.exceptions import ResponseError
+from sqlalchemy import update, delete, values, column, cast, func, String, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import settings
+from app.database.database import async_session
+from app.database.models import AuthRequest
+from app.services.redis_service import redis_service, AUTH_HISTORY_STREAM_KEY, STATUS_TIMESTAMP_FIELDS
+
+
+# Группа потребителей потока изменений
+HISTORY_GROUP = "history_flusher"
+
+# Аренда потока шарда: поток читает один процесс, пока продлевает аренду.
+# Через столько секунд после падения владельца поток забирает другой процесс
+HISTORY_LEASE_SECONDS = 30
+
+# Продление аренды потока, если она еще принадлежит процессу
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Освобождение аренды потока
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(stream: str) -> str:
+    return f"{stream}:owner"
+
+
+class HistoryWriter:
+    """
+    Отложенная запись истории запросов в таблицу auth_requests (write-behind).
+
+    Скрипты Redis атомарно со сменой состояния добавляют изменения в поток
+    auth_history_stream, а фоновый обработчик применяет их пачками: новые
+    запросы - одним INSERT ... ON CONFLICT DO NOTHING, смены статуса - одним
+    UPDATE ... FROM (VALUES ...), недосозданные запросы - одним DELETE.
+    Повторное применение безопасно, поэтому доставка "хотя бы один раз"
+    не портит данные. Пока пачка не записана, актуальное состояние читается
+    из Redis. В Redis Cluster у каждого шарда свой поток и свой обработчик.
+
+    Смена статуса применяется только к уже записанному запросу, поэтому
+    пачки потока должны записываться по порядку: поток шарда читает один
+    процесс, арендующий его (как разделы обновлений в app.bot.worker).
+    Новый владелец сначала дописывает неподтвержденные записи прежнего.
+    """
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._renew_script = None
+        self._release_script = None
+        self.stats = {
+            'flushed_batches': 0,
+            'flushed_entries': 0,
+            'last_flush_at': None,
+            'last_batch_lag_seconds': None
+        }
+
+    async def start(self):
+        """Запуск фоновых обработчиков (по одному на шард)"""
+        if self._tasks:
+            return
+
+        for shard in redis_service.shards:
+            try:
+                await redis_service.redis.xgroup_create(
+                    redis_service.shard_key(AUTH_HISTORY_STREAM_KEY, shard), HISTORY_GROUP, id="0", mkstream=True
+                )
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+        self._renew_script = redis_service.redis.register_script(RENEW_LEASE_SCRIPT)
+        self._release_script = redis_service.redis.register_script(RELEASE_LEASE_SCRIPT)
+        self._tasks = [
+            asyncio.create_task(self._flush_loop(redis_service.shard_key(AUTH_HISTORY_STREAM_KEY, shard)))
+            for shard in redis_service.shards
+        ]
+        logger.info("History write-behind flusher started")
+
+    async def stop(self):
+        """Остановка фоновых обработчиков"""
+        if self._tasks:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            logger.info("History write-behind flusher stopped")
+
+    async def _flush_loop(self, stream: str):
+        """Ожидание аренды потока и его чтение, пока аренда за процессом"""
+        try:
+            while True:
+                try:
+                    if await self._acquire(stream):
+                        await self._consume(stream)
+                        logger.warning(f"Lost lease on history stream {stream}")
+                    else:
+                        await asyncio.sleep(HISTORY_LEASE_SECONDS / 3)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"History flush error: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            try:
+                await self._release_script(keys=[lease_key(stream)], args=[self._consumer])
+            except Exception as e:
+                logger.warning(f"Error releasing history stream {stream}: {e}")
+
+    async def _acquire(self, stream: str) -> bool:
+        """Продление своей аренды потока или захват свободной"""
+        lease_ms = HISTORY_LEASE_SECONDS * 1000
+        if await self._renew_script(keys=[lease_key(stream)], args=[self._consumer, lease_ms]):
+            return True
+        return bool(await redis_service.redis.set(lease_key(stream), self._consumer, nx=True, px=lease_ms))
+
+    async def _consume(self, stream: str):
+        """
+        Чтение потока по порядку: сначала неподтвержденные записи прежнего
+        владельца, затем новые. Аренда продлевается перед каждой пачкой.
+        """
+        start_id = "0-0"
+        while True:
+            start_id, entries, *_ = await redis_service.redis.xautoclaim(
+                stream,
+                HISTORY_GROUP,
+                self._consumer,
+                min_idle_time=0,
+                start_id=start_id,
+                count=settings.history_flush_batch_size
+            )
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            if entries:
+                await self._apply(stream, entries)
+            if start_id == "0-0":
+                break
+            if not await self._acquire(stream):
+                return
+
+        while await self._acquire(stream):
+            response = await redis_service.redis.xreadgroup(
+                HISTORY_GROUP,
+                self._consumer,
+                {stream: ">"},
+                count=settings.history_flush_batch_size,
+                block=int(settings.history_flush_interval * 1000)
+            )
+            if response and response[0][1]:
+                await self._apply(stream, response[0][1])
+
+    async def _apply(self, stream: str, entries: List[tuple]):
+        """Применение пачки изменений к БД и удаление их из потока"""
+        inserts: Dict[str, Dict[str, Any]] = {}
+        updates: Dict[str, Dict[str, Any]] = {}
+        deletes: List[str] = []
+
+        for _, fields in entries:
+            data = json.loads(fields['data'])
+            if fields['op'] == 'delete':
+                # Запрос не удалось создать до конца (см. discard_auth_request)
+                inserts.pop(data['request_id'], None)
+                updates.pop(data['request_id'], None)
+                deletes.append(data['request_id'])
+            elif fields['op'] == 'insert':
+                inserts[data['request_id']] = {
+                    'request_id': data['request_id'],
+                    'client_id': data['client_id'],
+                    'telegram_id': data['telegram_id'],
+                    'operation': data['operation'],
+                    'amount': data.get('amount'),
+                    'status': 'pending',
+                    'created_at': datetime.fromisoformat(data['created_at']),
+                    'metadata_json': str(data['metadata']) if data.get('metadata') else None
+                }
+            else:
+                updates[data['request_id']] = data
+
+        async with async_session() as db:
+            if inserts:
+                await db.execute(
+                    pg_insert(AuthRequest)
+                    .values(list(inserts.values()))
+                    .on_conflict_do_nothing(index_elements=['request_id', 'created_at'])
+                )
+            if updates:
+                await db.execute(self._build_update(list(updates.values())))
+            if deletes:
+                await db.execute(delete(AuthRequest).where(AuthRequest.request_id.in_(deletes)))
+            await db.commit()
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        async with redis_service.pipeline() as pipe:
+            pipe.xack(stream, HISTORY_GROUP, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+
+        oldest_ms = int(entry_ids[0].split('-')[0])
+        self.stats['flushed_batches'] += 1
+        self.stats['flushed_entries'] += len(entries)
+        self.stats['last_flush_at'] = datetime.now().isoformat()
+        self.stats['last_batch_lag_seconds'] = round(time.time() - oldest_ms / 1000, 3)
+
+    @staticmethod
+    def _build_update(changes: List[Dict[str, Any]]):
+        """UPDATE auth_requests ... FROM (VALUES ...) для пачки смен статуса"""
+        timestamp_fields = list(STATUS_TIMESTAMP_FIELDS.values())
+        rows = []
+        for change in changes:
+            field = STATUS_TIMESTAMP_FIELDS.get(change['status'])
+            rows.append((
+                change['request_id'],
+                change['status'],
+                *[change['timestamp'] if name == field else None for name in timestamp_fields]
+            ))
+
+        changed = values(
+            column('request_id', String),
+            column('status', String),
+            *[column(name, String) for name in timestamp_fields],
+            name='changed'
+        ).data(rows)
+
+        return (
+            update(AuthRequest)
+            .where(
+                AuthRequest.request_id == changed.c.request_id,
+                AuthRequest.status == 'pending'
+            )
+            .values(
+                status=changed.c.status,
+                **{
+                    name: func.coalesce(
+                        cast(changed.c[name], DateTime(timezone=True)),
+                        getattr(AuthRequest, name)
+                    )
+                    for name in timestamp_fields
+                }
+            )
+        )
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Метрики отставания записи истории (сумма и максимум по шардам)"""
+        backlog = 0
+        lag = None
+        for shard in redis_service.shards:
+            stream = redis_service.shard_key(AUTH_HISTORY_STREAM_KEY, shard)
+            backlog += await redis_service.redis.xlen(stream)
+            oldest = await redis_service.redis.xrange(stream, count=1)
+            if oldest:
+                shard_lag = round(time.time() - int(oldest[0][0].split('-')[0]) / 1000, 3)
+                lag = max(lag or 0.0, shard_lag)
+        return {
+            **self.stats,
+            'backlog': backlog,
+            'lag_seconds': lag or 0.0
+        }
+
+
+# Глобальный экземпляр
+history_writer = HistoryWriter()
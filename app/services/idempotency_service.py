@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from typing import Optional, Dict, Any
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service
+
+
+# Снятие отметки "выполняется", только если она поставлена этим вызовом
+RELEASE_PENDING_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class IdempotencyKeyReused(Exception):
+    """Ключ уже использован с другим телом запроса"""
+
+
+class IdempotencyInProgress(Exception):
+    """Исходный запрос с этим ключом еще выполняется"""
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Отпечаток тела запроса для проверки повторного использования ключа"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyService:
+    """
+    Ключи идемпотентности (заголовок Idempotency-Key).
+    
+    Первый запрос с ключом ставит в Redis отметку "выполняется" с коротким
+    TTL (idempotency_lock_ttl) и после выполнения заменяет ее ответом на
+    idempotency_ttl секунд. Повтор с тем же ключом получает сохраненный ответ,
+    не обращаясь к БД и Telegram. Повторы, пришедшие во время выполнения,
+    ждут исходный запрос: в том же процессе - его завершения, в других -
+    опрашивая Redis. Если исходный запрос завершился ошибкой сервера,
+    отметка снимается и следующий повтор выполняется заново.
+    
+    Ключи хранятся отдельно для каждого владельца API ключа (scope):
+    одинаковые Idempotency-Key разных интеграторов не пересекаются.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._markers: Dict[str, str] = {}
+        self._release_script = None
+    
+    @staticmethod
+    def _key(scope: str, idempotency_key: str) -> str:
+        return f"idempotency:{scope}:{hashlib.sha256(idempotency_key.encode()).hexdigest()}"
+    
+    async def begin(self, scope: str, idempotency_key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Начало запроса с ключом. Возвращает сохраненный ответ
+        ({status_code, body}) для повтора или None, если запрос нужно выполнить
+        (тогда после него обязателен complete или abandon).
+        """
+        key = self._key(scope, idempotency_key)
+        deadline = time.monotonic() + settings.idempotency_wait_timeout
+        delay = 0.02
+        
+        while True:
+            marker = json.dumps({'state': 'pending', 'fingerprint': fingerprint, 'token': secrets.token_hex(8)})
+            if await redis_service.redis.set(key, marker, nx=True, ex=settings.idempotency_lock_ttl):
+                self._inflight[key] = asyncio.get_running_loop().create_future()
+                self._markers[key] = marker
+                return None
+            
+            local = self._inflight.get(key)
+            if local is not None:
+                # Исходный запрос выполняется в этом процессе
+                try:
+                    await asyncio.wait_for(asyncio.shield(local), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    raise IdempotencyInProgress()
+                continue
+            
+            raw = await redis_service.redis.get(key)
+            if raw is None:
+                # Исходный запрос завершился ошибкой - выполняем заново
+                continue
+            
+            record = json.loads(raw)
+            if record['fingerprint'] != fingerprint:
+                raise IdempotencyKeyReused()
+            if record['state'] == 'done':
+                return record
+            
+            if time.monotonic() + delay > deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+    
+    async def complete(self, scope: str, idempotency_key: str, fingerprint: str, status_code: int, body: Any):
+        """Сохранение ответа для повторов"""
+        key = self._key(scope, idempotency_key)
+        try:
+            await redis_service.redis.set(
+                key,
+                json.dumps({
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status_code': status_code,
+                    'body': body
+                }, default=str),
+                ex=settings.idempotency_ttl
+            )
+        except Exception as e:
+            logger.error(f"Error storing idempotent response: {e}")
+        finally:
+            self._finish(key)
+    
+    async def abandon(self, scope: str, idempotency_key: str):
+        """Снятие отметки после ошибки сервера, чтобы повтор выполнился заново"""
+        key = self._key(scope, idempotency_key)
+        try:
+            if self._release_script is None:
+                self._release_script = redis_service.redis.register_script(RELEASE_PENDING_SCRIPT)
+            await self._release_script(keys=[key], args=[self._markers.get(key, '')])
+        except Exception as e:
+            logger.error(f"Error releasing idempotency key: {e}")
+        finally:
+            self._finish(key)
+    
+    def _finish(self, key: str):
+        self._markers.pop(key, None)
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+
+# Глобальный экземпляр
+idempotency_service = IdempotencyService()
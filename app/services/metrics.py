@@ -0,0 +1,223 @@
+import asyncio
+import os
+from typing import Optional
+from loguru import logger
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+
+from app.config import settings
+
+
+# Границы корзин для этапов обработки (секунды)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Границы корзин для времени от создания запроса до решения (секунды)
+DECISION_BUCKETS = (1, 2, 5, 10, 15, 30, 60, 120, 180, 300, 600)
+
+
+# Создание запроса на авторизацию по этапам
+AUTH_CREATE_STAGE_SECONDS = Histogram(
+    "auth_create_stage_seconds",
+    "Длительность этапов создания запроса на авторизацию",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+CREATE_CLIENT_LOOKUP = AUTH_CREATE_STAGE_SECONDS.labels("client_lookup")
+CREATE_REDIS_RESERVE = AUTH_CREATE_STAGE_SECONDS.labels("redis_reserve")
+CREATE_DB_INSERT = AUTH_CREATE_STAGE_SECONDS.labels("db_insert")
+CREATE_TELEGRAM_ENQUEUE = AUTH_CREATE_STAGE_SECONDS.labels("telegram_enqueue")
+CREATE_TOTAL = AUTH_CREATE_STAGE_SECONDS.labels("total")
+
+# Отправка сообщения в Telegram фоновым отправителем
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds",
+    "Длительность отправки запроса на авторизацию в Telegram",
+    buckets=STAGE_BUCKETS
+)
+TELEGRAM_SEND_TOTAL = Counter(
+    "telegram_send_total",
+    "Отправки запросов в Telegram по результату",
+    ["result"]
+)
+
+# Обработка нажатий кнопок авторизации
+AUTH_CALLBACK_SECONDS = Histogram(
+    "auth_callback_seconds",
+    "Длительность обработки нажатия кнопки авторизации",
+    ["action"],
+    buckets=STAGE_BUCKETS
+)
+
+# Обновления Telegram (webhook)
+TELEGRAM_UPDATE_SECONDS = Histogram(
+    "telegram_update_seconds",
+    "Длительность обработки обновления Telegram диспетчером",
+    buckets=STAGE_BUCKETS
+)
+TELEGRAM_UPDATE_QUEUE_SECONDS = Histogram(
+    "telegram_update_queue_seconds",
+    "Время ожидания обновления Telegram в очереди обработки",
+    buckets=STAGE_BUCKETS
+)
+TELEGRAM_UPDATES_TOTAL = Counter(
+    "telegram_updates_total",
+    "Принятые обновления Telegram по результату",
+    ["result"]
+)
+TELEGRAM_UPDATE_QUEUE_DEPTH = Gauge(
+    "telegram_update_queue_depth",
+    "Обновления Telegram в очереди обработки",
+    multiprocess_mode="livesum"
+)
+
+# Решения по запросам
+AUTH_DECISION_SECONDS = Histogram(
+    "auth_decision_seconds",
+    "Время от создания запроса до конечного статуса",
+    ["status"],
+    buckets=DECISION_BUCKETS
+)
+AUTH_REQUESTS_FINALIZED_TOTAL = Counter(
+    "auth_requests_finalized_total",
+    "Запросы на авторизацию по конечному статусу",
+    ["status"]
+)
+
+# Пулы соединений
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Соединения пула PostgreSQL",
+    ["state"],
+    multiprocess_mode="livesum"
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    "redis_pool_connections",
+    "Соединения пула Redis",
+    ["state"],
+    multiprocess_mode="livesum"
+)
+
+# Контроль допуска запросов к API
+ADMISSION_LIMIT = Gauge(
+    "admission_limit",
+    "Текущий адаптивный лимит параллельных запросов маршрута",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_INFLIGHT = Gauge(
+    "admission_inflight",
+    "Выполняющиеся запросы маршрута под контролем допуска",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "admission_queue_seconds",
+    "Время ожидания слота контроля допуска",
+    ["route"],
+    buckets=STAGE_BUCKETS
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "admission_rejected_total",
+    "Запросы, отклоненные контролем допуска, по причине",
+    ["route", "reason"]
+)
+
+# Ограничение частоты запросов
+RATE_LIMITED_TOTAL = Counter(
+    "rate_limited_total",
+    "Запросы, отклоненные по лимиту частоты, по измерению лимита",
+    ["dimension"]
+)
+
+# Запросы к API по владельцу ключа
+API_REQUESTS_BY_TENANT = Counter(
+    "api_requests_by_tenant_total",
+    "Запросы к API с проверенным ключом по владельцу ключа",
+    ["tenant"]
+)
+
+# Запуск процесса
+STARTUP_PHASE_SECONDS = Gauge(
+    "startup_phase_seconds",
+    "Длительность этапов запуска процесса",
+    ["phase"],
+    multiprocess_mode="max"
+)
+
+
+def render_metrics() -> tuple:
+    """
+    Текст метрик для Prometheus. При нескольких процессах uvicorn
+    (задан PROMETHEUS_MULTIPROC_DIR) метрики всех процессов суммируются.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class PoolMetricsSampler:
+    """
+    Периодический замер заполнения пулов соединений PostgreSQL и Redis.
+    Замер идет в фоне, а не при запросе /metrics, чтобы каждый процесс
+    отдавал свои значения.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_loop())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            multiprocess.mark_process_dead(os.getpid())
+    
+    @staticmethod
+    def sample():
+        from app.database.database import engine
+        from app.services.redis_service import redis_service
+        
+        pool = engine.sync_engine.pool
+        DB_POOL_CONNECTIONS.labels("in_use").set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels("idle").set(pool.checkedin())
+        DB_POOL_CONNECTIONS.labels("max").set(pool.size() + pool._max_overflow)
+        
+        # В кластере у каждого узла свой пул, значения суммируются
+        redis_pools = redis_service.pool_usage()
+        if redis_pools:
+            in_use, idle, maximum = (sum(values) for values in zip(*redis_pools))
+            REDIS_POOL_CONNECTIONS.labels("in_use").set(in_use)
+            REDIS_POOL_CONNECTIONS.labels("idle").set(idle)
+            REDIS_POOL_CONNECTIONS.labels("max").set(maximum)
+    
+    async def _sample_loop(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"Error sampling pool metrics: {e}")
+            await asyncio.sleep(settings.metrics_sample_interval)
+
+
+# Глобальный экземпляр
+pool_metrics = PoolMetricsSampler()
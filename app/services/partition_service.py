@@ -0,0 +1,231 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+from loguru import logger
+from redis.exceptions import LockError
+from sqlalchemy import text
+
+from app.config import settings
+from app.database.database import engine
+from app.services.redis_service import redis_service
+
+
+# Секционированная таблица и формат имен ее месячных секций
+PARTITIONED_TABLE = "auth_requests"
+PARTITION_NAME = re.compile(rf"^{PARTITIONED_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+# Обслуживание секций выполняет один процесс развертывания
+PARTITION_LOCK_KEY = "partitions:lock"
+
+# Строк на одну выборку при выгрузке секции в архив
+ARCHIVE_FETCH_SIZE = 5000
+
+
+def month_start(year: int, month: int) -> datetime:
+    """Начало месяца (UTC), month может выходить за 1..12"""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(lower: datetime) -> str:
+    return f"{PARTITIONED_TABLE}_p{lower:%Y%m}"
+
+
+class PartitionService:
+    """
+    Обслуживание секций таблицы auth_requests.
+    
+    Заранее создает месячные секции на partition_premake_months вперед, чтобы
+    вставки не попадали в секцию по умолчанию. Секции старше
+    partition_retention_months отсоединяются, выгружаются в сжатый файл
+    (gzip JSONL, строка на запись) в partition_archive_dir и удаляются:
+    DROP секции вместо DELETE не оставляет мертвых строк, поэтому объем
+    индексов и работа VACUUM ограничены окном хранения.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'created': 0,
+            'archived': 0,
+            'archived_rows': 0,
+            'last_run_at': None
+        }
+    
+    async def start(self):
+        """Запуск периодического обслуживания"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintenance_loop())
+            logger.info("Partition maintenance started")
+    
+    async def stop(self):
+        """Остановка периодического обслуживания"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Partition maintenance stopped")
+    
+    async def _is_partitioned(self, conn) -> bool:
+        result = await conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ), {'table': PARTITIONED_TABLE})
+        return result.scalar() is not None
+    
+    async def _partitions(self, conn) -> List[str]:
+        """Секции, присоединенные к таблице"""
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+        ), {'table': PARTITIONED_TABLE})
+        return [row[0] for row in result]
+    
+    async def _monthly_tables(self, conn) -> List[str]:
+        """Месячные секции, включая отсоединенные, но не выгруженные"""
+        result = await conn.execute(text(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND relname LIKE :pattern AND pg_table_is_visible(oid)"
+        ), {'pattern': f"{PARTITIONED_TABLE}\\_p%"})
+        return [row[0] for row in result]
+    
+    async def ensure_partitions(self) -> List[str]:
+        """Создание секций с текущего месяца на partition_premake_months вперед"""
+        now = datetime.now(timezone.utc)
+        created = []
+        
+        async with engine.begin() as conn:
+            if not await self._is_partitioned(conn):
+                logger.warning(f"Table {PARTITIONED_TABLE} is not partitioned, run alembic upgrade head")
+                return created
+            
+            existing = set(await self._partitions(conn))
+            for offset in range(settings.partition_premake_months + 1):
+                lower = month_start(now.year, now.month + offset)
+                upper = month_start(lower.year, lower.month + 1)
+                name = partition_name(lower)
+                if name in existing:
+                    continue
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARTITIONED_TABLE} "
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                created.append(name)
+            
+            if f"{PARTITIONED_TABLE}_default" not in existing:
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {PARTITIONED_TABLE}_default "
+                    f"PARTITION OF {PARTITIONED_TABLE} DEFAULT"
+                ))
+        
+        if created:
+            self.stats['created'] += len(created)
+            logger.info(f"Created partitions: {', '.join(created)}")
+        return created
+    
+    async def apply_retention(self) -> List[str]:
+        """Архивация и удаление секций старше partition_retention_months"""
+        if settings.partition_retention_months <= 0:
+            return []
+        
+        now = datetime.now(timezone.utc)
+        cutoff = month_start(now.year, now.month - settings.partition_retention_months)
+        
+        async with engine.connect() as conn:
+            names = await self._monthly_tables(conn)
+        
+        expired = []
+        for name in sorted(names):
+            match = PARTITION_NAME.match(name)
+            if not match:
+                continue
+            lower = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            # Секция целиком старше окна хранения
+            if month_start(lower.year, lower.month + 1) <= cutoff:
+                expired.append(name)
+        
+        for name in expired:
+            await self.archive_partition(name)
+        return expired
+    
+    async def archive_partition(self, name: str) -> str:
+        """
+        Отсоединение секции, выгрузка в {partition_archive_dir}/{name}.jsonl.gz
+        и удаление. Файл пишется во временный и переименовывается только
+        после полной выгрузки, секция удаляется после этого.
+        """
+        os.makedirs(settings.partition_archive_dir, exist_ok=True)
+        path = os.path.join(settings.partition_archive_dir, f"{name}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+        
+        async with engine.begin() as conn:
+            if name in await self._partitions(conn):
+                await conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}"))
+        
+        rows = 0
+        archive = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+        try:
+            async with engine.connect() as conn:
+                result = await conn.stream(
+                    text(f"SELECT * FROM {name} ORDER BY created_at, id"),
+                    execution_options={'yield_per': ARCHIVE_FETCH_SIZE}
+                )
+                async for partition in result.mappings().partitions(ARCHIVE_FETCH_SIZE):
+                    chunk = "".join(
+                        json.dumps(dict(row), default=str, ensure_ascii=False) + "\n"
+                        for row in partition
+                    )
+                    await asyncio.to_thread(archive.write, chunk)
+                    rows += len(partition)
+        finally:
+            await asyncio.to_thread(archive.close)
+        
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        
+        self.stats['archived'] += 1
+        self.stats['archived_rows'] += rows
+        logger.info(f"Partition {name} archived to {path} ({rows} rows) and dropped")
+        return path
+    
+    async def run_once(self) -> Dict[str, Any]:
+        """Один проход обслуживания под блокировкой в Redis"""
+        lock = redis_service.redis.lock(PARTITION_LOCK_KEY, timeout=settings.partition_lock_timeout)
+        if not await lock.acquire(blocking=False):
+            return {'skipped': True}
+        
+        try:
+            created = await self.ensure_partitions()
+            archived = await self.apply_retention()
+            self.stats['last_run_at'] = datetime.now().isoformat()
+            return {'created': created, 'archived': archived}
+        finally:
+            try:
+                await lock.release()
+            except LockError:
+                logger.warning("Partition maintenance lock expired before completion")
+    
+    async def _maintenance_loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Partition maintenance error: {e}")
+            await asyncio.sleep(settings.partition_maintenance_interval)
+
+
+# Глобальный экземпляр
+partition_service = PartitionService()
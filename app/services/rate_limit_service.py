@@ -0,0 +1,242 @@
+import asyncio
+import json
+import math
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
+from loguru import logger
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services.redis_backend import is_cluster
+from app.services import metrics
+
+
+# Проверка и списание по нескольким ключам GCRA за один вызов.
+# KEYS - ключи, ARGV - тройки (интервал между запросами в мс, burst, стоимость).
+# Время берется из Redis, поэтому часы процессов не влияют на результат.
+# Запрос списывается со всех ключей, только если все они его допускают.
+# Отрицательная стоимость возвращает ранее списанное.
+# Возвращает {допущен, индекс ограничивающего ключа, осталось, до сброса мс, повтор через мс}.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local result = {1, 0, -1, 0, 0}
+local tats = {}
+
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[i * 3 - 2])
+    local burst = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + interval * cost
+    local tolerance = interval * burst
+    local used = new_tat - now
+    
+    if used > tolerance then
+        local retry = used - tolerance
+        if result[1] == 1 or retry > result[5] then
+            result = {0, i, 0, math.ceil(tat - now), math.ceil(retry)}
+        end
+    elseif result[1] == 1 then
+        local remaining = math.floor((tolerance - used) / interval)
+        if result[3] < 0 or remaining < result[3] then
+            result = {1, i, remaining, math.ceil(used), 0}
+        end
+    end
+    tats[i] = new_tat
+end
+
+if result[1] == 1 then
+    for i = 1, #KEYS do
+        redis.call('SET', KEYS[i], string.format('%.3f', tats[i]), 'PX', math.max(1, math.ceil(tats[i] - now)))
+    end
+end
+return result
+"""
+
+
+class RatePolicy(NamedTuple):
+    """Лимит: rate запросов за period секунд, до burst запросов подряд"""
+    rate: int
+    period: float
+    burst: int
+    
+    @classmethod
+    def parse(cls, value: str) -> "RatePolicy":
+        """Лимит из строки "rate/period[:burst]", например "100/1:200" """
+        quota, _, burst = value.partition(":")
+        rate, _, period = quota.partition("/")
+        rate = int(rate)
+        return cls(rate, float(period or 1), int(burst) if burst else rate)
+    
+    @property
+    def interval_ms(self) -> float:
+        return self.period * 1000 / self.rate
+    
+    def header(self) -> str:
+        """Значение заголовка RateLimit-Policy"""
+        return f"{self.rate};w={self.period:g};burst={self.burst}"
+
+
+class RateLimitExceeded(Exception):
+    """Запрос превышает лимит"""
+    
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result['dimension'])
+        self.result = result
+
+
+class RateLimitCostExceeded(ValueError):
+    """Стоимость запроса больше burst лимита: такой запрос не будет допущен никогда"""
+    
+    def __init__(self, dimension: str, identifier: str, cost: int, policy: RatePolicy):
+        super().__init__(
+            f"Request cost {cost} exceeds {dimension} rate limit burst {policy.burst} for {identifier}"
+        )
+        self.dimension = dimension
+        self.cost = cost
+        self.policy = policy
+
+
+class RateLimitService:
+    """
+    Ограничение частоты запросов по владельцу API ключа (интегратору), client_id
+    и telegram_id алгоритмом GCRA.
+    
+    Для каждого субъекта в Redis хранится одно число - теоретическое время
+    прибытия следующего запроса (TAT), поэтому лимит общий для всех
+    процессов и узлов. Все субъекты запроса проверяются и списываются одним
+    Lua-скриптом за один обход Redis. Лимиты по умолчанию задаются для
+    каждого измерения, для отдельных субъектов их можно переопределить
+    (rate_limit_overrides). При недоступности Redis запросы пропускаются.
+    
+    В Redis Cluster ключ каждого субъекта лежит в своем слоте (хеш-тег -
+    сам субъект), чтобы лимиты client_id и telegram_id оставались общими
+    для всех владельцев ключей. Скрипт не может работать с ключами разных
+    слотов, поэтому субъекты проверяются отдельными вызовами параллельно,
+    а при отказе списанное с остальных субъектов возвращается.
+    """
+    
+    def __init__(self):
+        self._script = None
+        self._defaults: Dict[str, RatePolicy] = {}
+        self._overrides: Dict[str, RatePolicy] = {}
+        self._parsed: Dict[str, RatePolicy] = {}
+        self._loaded = False
+    
+    def _load_policies(self):
+        self._defaults = {
+            'api_key': RatePolicy.parse(settings.rate_limit_api_key),
+            'client': RatePolicy.parse(settings.rate_limit_client),
+            'telegram': RatePolicy.parse(settings.rate_limit_telegram)
+        }
+        overrides = json.loads(settings.rate_limit_overrides) if settings.rate_limit_overrides else {}
+        self._overrides = {subject: RatePolicy.parse(value) for subject, value in overrides.items()}
+        self._loaded = True
+    
+    def policy(self, dimension: str, identifier: str, own: Optional[str] = None) -> RatePolicy:
+        """
+        Лимит субъекта: собственный (own, например лимит API ключа из БД),
+        переопределение "dimension:identifier" или лимит измерения
+        """
+        if not self._loaded:
+            self._load_policies()
+        if own:
+            if own not in self._parsed:
+                self._parsed[own] = RatePolicy.parse(own)
+            return self._parsed[own]
+        return self._overrides.get(f"{dimension}:{identifier}") or self._defaults[dimension]
+    
+    @staticmethod
+    def _key(dimension: str, identifier) -> str:
+        if is_cluster():
+            return f"ratelimit:{{{dimension}:{identifier}}}"
+        return f"ratelimit:{dimension}:{identifier}"
+    
+    async def _check_per_slot(self, keys: List[str], args: list) -> list:
+        """
+        Проверка субъектов в разных слотах кластера: по вызову скрипта на
+        субъект. Если хотя бы один субъект запрос не допускает, списанное
+        с остальных возвращается тем же скриптом с отрицательной стоимостью.
+        Результат в формате скрипта для всех ключей.
+        """
+        calls = [(key, args[i * 3:i * 3 + 3]) for i, key in enumerate(keys)]
+        results = await asyncio.gather(*[self._script(keys=[key], args=call_args) for key, call_args in calls])
+        
+        rejected = [i for i, result in enumerate(results) if not result[0]]
+        if not rejected:
+            index = min(range(len(results)), key=lambda i: results[i][2])
+            return [1, index + 1, *results[index][2:]]
+        
+        await asyncio.gather(*[
+            self._script(keys=[key], args=[interval, burst, -cost])
+            for (key, (interval, burst, cost)), result in zip(calls, results) if result[0]
+        ])
+        index = max(rejected, key=lambda i: results[i][4])
+        return [0, index + 1, *results[index][2:]]
+    
+    async def check(self, subjects: List[Tuple]) -> Optional[Dict[str, Any]]:
+        """
+        Проверка и списание запроса по субъектам (dimension, identifier, cost[, policy]).
+        Возвращает состояние самого строгого лимита или None, если
+        ограничение выключено или Redis недоступен. Стоимость больше burst
+        (например, пакет больше лимита клиента) - RateLimitCostExceeded.
+        """
+        if not settings.rate_limit_enabled or not subjects:
+            return None
+        
+        policies = [self.policy(subject[0], str(subject[1]), *subject[3:4]) for subject in subjects]
+        for policy, subject in zip(policies, subjects):
+            if subject[2] > policy.burst:
+                raise RateLimitCostExceeded(subject[0], str(subject[1]), subject[2], policy)
+        keys = [self._key(subject[0], subject[1]) for subject in subjects]
+        args = []
+        for policy, subject in zip(policies, subjects):
+            args.extend([policy.interval_ms, policy.burst, subject[2]])
+        
+        try:
+            if self._script is None:
+                self._script = redis_service.redis.register_script(GCRA_SCRIPT)
+            if is_cluster() and len(keys) > 1:
+                allowed, index, remaining, reset_ms, retry_ms = await self._check_per_slot(keys, args)
+            else:
+                allowed, index, remaining, reset_ms, retry_ms = await self._script(keys=keys, args=args)
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, request allowed: {e}")
+            return None
+        
+        policy = policies[index - 1]
+        dimension = subjects[index - 1][0]
+        result = {
+            'allowed': bool(allowed),
+            'dimension': dimension,
+            'policy': policy,
+            'remaining': max(int(remaining), 0),
+            'reset': math.ceil(int(reset_ms) / 1000),
+            'retry_after': math.ceil(int(retry_ms) / 1000)
+        }
+        if not allowed:
+            metrics.RATE_LIMITED_TOTAL.labels(dimension).inc()
+            raise RateLimitExceeded(result)
+        return result
+
+
+def rate_limit_headers(result: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Заголовки RateLimit-* (draft-ietf-httpapi-ratelimit-headers) и Retry-After"""
+    if not result:
+        return {}
+    headers = {
+        "RateLimit-Limit": str(result['policy'].burst),
+        "RateLimit-Remaining": str(result['remaining']),
+        "RateLimit-Reset": str(result['reset']),
+        "RateLimit-Policy": result['policy'].header()
+    }
+    if not result['allowed']:
+        headers["Retry-After"] = str(max(result['retry_after'], 1))
+    return headers
+
+
+# Глобальный экземпляр
+rate_limiter = RateLimitService()
@@ -0,0 +1,57 @@
+import json
+from typing import Optional, Dict, Any, List
+
+import orjson
+
+
+# Поля записи запроса, которые хранятся в Redis числами
+INT_FIELDS = {'telegram_id', 'message_id'}
+
+# Поля со вложенными данными, кодируются целиком (orjson)
+BLOB_FIELDS = {'metadata'}
+
+
+def _encode_value(field: str, value: Any) -> str:
+    if field in BLOB_FIELDS:
+        return orjson.dumps(value, default=str).decode()
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def encode_record(info: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Запись запроса -> поля HASH в Redis. Статус и время переходов хранятся
+    отдельными полями и обновляются на месте, пустые значения не хранятся.
+    """
+    return {
+        field: _encode_value(field, value)
+        for field, value in info.items()
+        if value is not None
+    }
+
+
+def encode_record_args(info: Dict[str, Any]) -> List[str]:
+    """Поля записи плоским списком field, value, ... для аргументов скриптов"""
+    args = []
+    for field, value in encode_record(info).items():
+        args.extend((field, value))
+    return args
+
+
+def decode_record(fields: Dict[str, str]) -> Dict[str, Any]:
+    """Поля HASH из Redis -> запись запроса"""
+    info: Dict[str, Any] = {}
+    for field, value in fields.items():
+        if field in INT_FIELDS:
+            info[field] = int(value)
+        elif field in BLOB_FIELDS:
+            info[field] = orjson.loads(value)
+        else:
+            info[field] = value
+    return info
+
+
+def decode_legacy_record(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Запись в прежнем формате (одна JSON-строка)"""
+    return json.loads(raw) if raw else None
@@ -0,0 +1,113 @@
+from typing import List, Tuple, Union
+from redis.asyncio import Redis, ConnectionPool
+from redis.asyncio.client import PubSub
+from redis.asyncio.cluster import RedisCluster, ClusterNode
+from redis.asyncio.sentinel import Sentinel
+
+from app.config import settings
+
+
+# Поддерживаемые развертывания Redis
+REDIS_MODES = ('standalone', 'sentinel', 'cluster')
+
+RedisClient = Union[Redis, RedisCluster]
+
+
+def is_cluster() -> bool:
+    return settings.redis_mode == "cluster"
+
+
+def parse_nodes(value: str) -> List[Tuple[str, int]]:
+    """Адреса узлов из строки "host:port,host:port" """
+    nodes = []
+    for node in value.split(","):
+        host, _, port = node.strip().rpartition(":")
+        if host:
+            nodes.append((host, int(port)))
+    return nodes
+
+
+def hash_tag(key: str, tag) -> str:
+    """
+    Ключ (или префикс ключа) с хеш-тегом для Redis Cluster: ключи с одинаковым
+    тегом попадают в один слот, поэтому скрипты и транзакции могут работать
+    с ними вместе. Тег ставится до изменяемой части ключа - слот определяется
+    первой парой фигурных скобок. Без кластера ключ не меняется.
+    """
+    return f"{key}:{{{tag}}}" if is_cluster() else key
+
+
+def create_client(**options) -> RedisClient:
+    """
+    Клиент Redis для settings.redis_mode. Соединения открываются при первом
+    запросе, поэтому клиент можно создавать при импорте модуля.
+    options передаются в пул соединений (decode_responses, max_connections
+    и т.п.; в кластере - в пул каждого узла).
+    """
+    if settings.redis_mode == "cluster":
+        nodes = parse_nodes(settings.redis_cluster_nodes) or [(settings.redis_host, settings.redis_port)]
+        return RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in nodes],
+            password=settings.redis_password or None,
+            **options
+        )
+    
+    if settings.redis_mode == "sentinel":
+        sentinel = Sentinel(
+            parse_nodes(settings.redis_sentinels),
+            sentinel_kwargs={'password': settings.redis_sentinel_password or None},
+            password=settings.redis_password or None,
+            db=settings.redis_db
+        )
+        return sentinel.master_for(settings.redis_sentinel_master, **options)
+    
+    if settings.redis_mode != "standalone":
+        raise ValueError(f"Unknown REDIS_MODE {settings.redis_mode!r}, expected one of {REDIS_MODES}")
+    return Redis(connection_pool=ConnectionPool.from_url(settings.redis_url, **options))
+
+
+class NodePubSub(PubSub):
+    """Подписка на узле кластера со своим пулом соединений: пул закрывается вместе с подпиской"""
+    
+    async def aclose(self):
+        await super().aclose()
+        await self.connection_pool.disconnect()
+
+
+def create_pubsub(client: RedisClient, **options) -> PubSub:
+    """
+    Подписка pub/sub. Кластер пересылает PUBLISH на все узлы, поэтому
+    подписка открывается на случайном узле отдельным соединением
+    (клиент кластера redis-py pub/sub не поддерживает). Пул этого
+    соединения закрывается в aclose() подписки.
+    """
+    if isinstance(client, RedisCluster):
+        node = client.get_random_node()
+        pool = ConnectionPool(
+            host=node.host,
+            port=node.port,
+            password=settings.redis_password or None,
+            decode_responses=client.get_encoder().decode_responses,
+            max_connections=1
+        )
+        return NodePubSub(pool, **options)
+    return client.pubsub(**options)
+
+
+def pool_usage(client: RedisClient) -> List[Tuple[int, int, int]]:
+    """Занятые, свободные и максимум соединений по каждому пулу (в кластере - по узлам)"""
+    if isinstance(client, RedisCluster):
+        return [
+            (len(node._connections) - len(node._free), len(node._free), node.max_connections)
+            for node in client.get_nodes()
+        ]
+    pool = client.connection_pool
+    return [(len(pool._in_use_connections), len(pool._available_connections), pool.max_connections)]
+
+
+async def close_client(client: RedisClient):
+    """Закрытие клиента вместе с соединениями пула"""
+    if isinstance(client, RedisCluster):
+        await client.aclose()
+    else:
+        await client.aclose(close_connection_pool=True)
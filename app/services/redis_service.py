@@ -1,45 +1,343 @@
-from redis.asyncio import Redis, ConnectionPool
 import json
 import asyncio
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+import heapq
+import time
+import uuid
+import zlib
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime
 from loguru import logger
+from redis.asyncio.client import PubSub
+from redis.exceptions import ResponseError, NoScriptError
 from app.config import settings
+from app.services.redis_backend import (
+    RedisClient,
+    is_cluster,
+    hash_tag,
+    create_client,
+    create_pubsub,
+    pool_usage,
+    close_client
+)
+from app.services.record_codec import (
+    encode_record,
+    encode_record_args,
+    decode_record,
+    decode_legacy_record
+)
+
+
+# Канал pub/sub с событиями изменения статуса запросов
+AUTH_EVENTS_CHANNEL = "auth_events"
+
+# Ограниченный журнал событий (Redis Stream) для возобновления подписки
+AUTH_EVENTS_LOG_KEY = "auth_events_log"
+
+
+# Поток изменений для отложенной записи истории в БД (write-behind)
+AUTH_HISTORY_STREAM_KEY = "auth_history_stream"
+
+# Исходящие события о решениях для доставки webhook'ов (Redis Stream).
+# В отличие от журнала событий не обрезается: записи удаляются
+# обработчиком после постановки заданий в очередь доставок
+WEBHOOK_OUTBOX_KEY = "webhook_outbox"
+
+# Сроки истечения активных запросов (ZSET request_id -> expires_at)
+AUTH_DEADLINES_KEY = "auth_deadlines"
+
+# Запросы на авторизацию (HASH) и индексы активных запросов пользователей
+AUTH_REQUEST_KEY = "auth_request"
+USER_PENDING_KEY = "user_pending"
+
+
+# Запись события в журнал и публикация в канал (общая часть скриптов).
+# Событие в канале дополняется id записи журнала. Если передан outbox_key,
+# событие с тем же id пишется и в исходящие для webhook'ов.
+EMIT_EVENT_LUA = """
+local function emit_event(log_key, channel, maxlen, event, outbox_key)
+    local event_id = redis.call(
+        'XADD', log_key, 'MAXLEN', '~', maxlen, '*', 'data', cjson.encode(event)
+    )
+    event['id'] = event_id
+    local payload = cjson.encode(event)
+    redis.call('PUBLISH', channel, payload)
+    if outbox_key then
+        redis.call('XADD', outbox_key, '*', 'data', payload)
+    end
+end
+"""
+
+
+# Перевод записи запроса из прежнего формата (JSON-строка) в HASH на месте
+# с сохранением TTL. Вложенные данные кодируются в JSON, как и orjson.
+MIGRATE_RECORD_LUA = """
+local function migrate_record(key)
+    if redis.call('TYPE', key)['ok'] ~= 'string' then
+        return
+    end
+    local info = cjson.decode(redis.call('GET', key))
+    local ttl = redis.call('PTTL', key)
+    local fields = {}
+    for field, value in pairs(info) do
+        if type(value) == 'table' then
+            value = cjson.encode(value)
+        end
+        if value ~= cjson.null then
+            table.insert(fields, field)
+            table.insert(fields, tostring(value))
+        end
+    end
+    redis.call('DEL', key)
+    redis.call('HSET', key, unpack(fields))
+    if ttl > 0 then
+        redis.call('PEXPIRE', key, ttl)
+    end
+end
+"""
+
+
+# Атомарная проверка лимита и резервирование слота в индексе пользователя.
+# KEYS[1] - индекс активных запросов пользователя (ZSET request_id -> expires_at)
+# KEYS[2] - ключ запроса на авторизацию
+# KEYS[3] - журнал событий, KEYS[4] - поток изменений для записи в БД,
+# KEYS[5] - сроки истечения
+# ARGV: request_id, payload для записи в БД (JSON, только в режиме write-behind),
+#       ttl, now, limit, client_id, telegram_id, время создания, канал событий,
+#       длина журнала, режим write-behind (1/0), сколько хранить запись после
+#       истечения, обработка сроков (1/0), затем поля записи (field, value, ...)
+# Сроки пишутся, только если их обрабатывает expiry_service. Сроки, прошедшие
+# больше чем на время хранения записи, удаляются: запросов уже нет в Redis.
+RESERVE_PENDING_SCRIPT = EMIT_EVENT_LUA + """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[5]) then
+    return 0
+end
+local expires_at = tonumber(ARGV[4]) + tonumber(ARGV[3])
+redis.call('ZADD', KEYS[1], expires_at, ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', '(' .. (tonumber(ARGV[4]) - tonumber(ARGV[12])))
+if ARGV[13] == '1' then
+    redis.call('ZADD', KEYS[5], expires_at, ARGV[1])
+end
+redis.call('DEL', KEYS[2])
+redis.call('HSET', KEYS[2], unpack(ARGV, 14))
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]) + tonumber(ARGV[12]))
+emit_event(KEYS[3], ARGV[9], ARGV[10], {
+    request_id = ARGV[1],
+    client_id = ARGV[6],
+    telegram_id = tonumber(ARGV[7]),
+    status = 'pending',
+    timestamp = ARGV[8]
+})
+if ARGV[11] == '1' then
+    redis.call('XADD', KEYS[4], '*', 'op', 'insert', 'data', ARGV[2])
+end
+return 1
+"""
+
+
+# Атомарный переход статуса запроса (compare-and-set). Меняются только поля
+# статуса и времени, TTL записи сохраняется.
+# KEYS[1] - ключ запроса, KEYS[2] - индекс активных запросов пользователя,
+# KEYS[3] - журнал событий, KEYS[4] - поток изменений для записи в БД,
+# KEYS[5] - сроки истечения, KEYS[6] - исходящие события для webhook'ов
+# ARGV: request_id, telegram_id, expected_status, new_status,
+#       поле с временем перехода, текущее время, канал событий, длина журнала,
+#       режим write-behind (1/0), доставка webhook'ов (1/0),
+#       затем дополнительные поля (field, value, ...)
+# Возвращает {result, old_status, new_status, created_at, client_id, amount}
+TRANSITION_STATUS_SCRIPT = EMIT_EVENT_LUA + MIGRATE_RECORD_LUA + """
+migrate_record(KEYS[1])
+local current = redis.call('HMGET', KEYS[1], 'status', 'telegram_id', 'client_id', 'created_at', 'amount')
+local old_status = current[1]
+if not old_status then
+    return {'not_found', '', '', '', '', ''}
+end
+if current[2] ~= ARGV[2] then
+    return {'forbidden', old_status, old_status, '', '', ''}
+end
+if old_status ~= ARGV[3] then
+    return {'conflict', old_status, old_status, '', '', ''}
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[4], 'updated_at', ARGV[6])
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], ARGV[5], ARGV[6])
+end
+if #ARGV > 10 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 11))
+end
+if ARGV[4] ~= 'pending' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[5], ARGV[1])
+end
+emit_event(KEYS[3], ARGV[7], ARGV[8], {
+    request_id = ARGV[1],
+    client_id = current[3],
+    telegram_id = tonumber(current[2]),
+    status = ARGV[4],
+    old_status = old_status,
+    timestamp = ARGV[6]
+}, ARGV[10] == '1' and KEYS[6] or nil)
+if ARGV[9] == '1' then
+    redis.call('XADD', KEYS[4], '*', 'op', 'update', 'data', cjson.encode({
+        request_id = ARGV[1],
+        status = ARGV[4],
+        timestamp = ARGV[6]
+    }))
+end
+return {'ok', old_status, ARGV[4], current[4] or '', current[3] or '', current[5] or ''}
+"""
+
+# Обновление отдельных полей запроса на месте.
+# KEYS[1] - ключ запроса; ARGV - поля (field, value, ...). Возвращает 0, если запроса нет.
+UPDATE_FIELDS_SCRIPT = MIGRATE_RECORD_LUA + """
+migrate_record(KEYS[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# Поле с временем перехода для каждого конечного статуса
+STATUS_TIMESTAMP_FIELDS = {
+    'approved': 'approved_at',
+    'rejected': 'rejected_at',
+    'expired': 'expired_at',
+}
+
+
+def event_id_key(event_id: str) -> tuple:
+    """Ключ сравнения id записей Redis Stream (ms-seq)"""
+    ms, _, seq = event_id.partition('-')
+    return int(ms), int(seq or 0)
 
 
 class RedisService:
-    """Сервис для работы с Redis"""
+    """
+    Сервис для работы с Redis.
+    
+    Redis может быть одним узлом, мастером под управлением Sentinel или
+    Redis Cluster (settings.redis_mode). В кластере запросы делятся на
+    redis_cluster_shards шардов: запрос, индекс активных запросов его
+    пользователя, сроки, журнал событий и поток истории шарда имеют общий
+    хеш-тег и лежат в одном слоте, поэтому скрипты по-прежнему меняют их
+    атомарно за один вызов. Шард пользователя определяется по telegram_id,
+    шард запроса записан в его request_id (см. new_request_id). Без кластера
+    шард один и имена ключей прежние.
+    """
     
     def __init__(self):
-        self.redis: Optional[Redis] = None
-        self._connection_pool = None
+        self.redis: Optional[RedisClient] = None
+        self.shards = range(settings.redis_cluster_shards if is_cluster() else 1)
+        self._reserve_pending_script = None
+        self._transition_status_script = None
+        self._update_fields_script = None
     
     async def connect(self):
         """Подключение к Redis"""
         try:
             if self.redis is None:
-                self._connection_pool = ConnectionPool.from_url(
-                    settings.redis_url,
+                self.redis = create_client(
                     decode_responses=True,
-                    max_connections=20
+                    max_connections=settings.redis_max_connections
+                )
+                self._reserve_pending_script = self.redis.register_script(
+                    RESERVE_PENDING_SCRIPT
+                )
+                self._transition_status_script = self.redis.register_script(
+                    TRANSITION_STATUS_SCRIPT
+                )
+                self._update_fields_script = self.redis.register_script(
+                    UPDATE_FIELDS_SCRIPT
                 )
-                self.redis = Redis(connection_pool=self._connection_pool)
                 
                 # Проверяем соединение
                 await self.redis.ping()
-                logger.info("Successfully connected to Redis")
+                logger.info(f"Successfully connected to Redis ({settings.redis_mode})")
                 
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {e}")
             raise
     
+    async def warm_up(self, connections: int):
+        """
+        Открытие соединений пула и загрузка Lua-скриптов заранее
+        (в кластере SCRIPT LOAD выполняется на всех мастерах)
+        """
+        await asyncio.gather(*[self.redis.ping() for _ in range(connections)])
+        await asyncio.gather(*[
+            self.redis.script_load(script.script)
+            for script in (
+                self._reserve_pending_script,
+                self._transition_status_script,
+                self._update_fields_script
+            )
+        ])
+    
     async def disconnect(self):
         """Отключение от Redis"""
         if self.redis:
-            await self.redis.close()
-            await self._connection_pool.disconnect()
+            await close_client(self.redis)
             logger.info("Disconnected from Redis")
     
+    def pipeline(self, transaction: bool = True):
+        """
+        Pipeline команд. Клиент кластера redis-py не поддерживает MULTI,
+        поэтому в кластере команды отправляются без транзакции. Везде, где
+        это используется, ключи лежат в одном слоте, и команды выполняются
+        узлом по порядку одним пакетом; между ними могут вклиниться только
+        команды других клиентов, что для этих мест (подтверждение записей
+        потоков, перестановка заданий, сброс кеша) безопасно.
+        """
+        return self.redis.pipeline(transaction=transaction and not is_cluster())
+    
+    def pubsub(self, **options) -> PubSub:
+        """Подписка pub/sub (в кластере - на одном из узлов)"""
+        return create_pubsub(self.redis, **options)
+    
+    def pool_usage(self) -> List[Tuple[int, int, int]]:
+        """Занятые, свободные и максимум соединений по пулам (в кластере - по узлам)"""
+        return pool_usage(self.redis) if self.redis is not None else []
+    
+    def shard_key(self, key: str, shard: int) -> str:
+        """Ключ шарда: с хеш-тегом {shard} в кластере, без кластера - key"""
+        return hash_tag(key, shard)
+    
+    def shard_of_user(self, telegram_id: int) -> int:
+        return int(telegram_id) % len(self.shards)
+    
+    def shard_of_request(self, request_id: str) -> int:
+        """Шард запроса по последним 16 битам request_id (см. new_request_id)"""
+        if len(self.shards) == 1:
+            return 0
+        try:
+            return int(request_id[-4:], 16) % len(self.shards)
+        except ValueError:
+            # Чужой формат id: запроса с таким id не создавалось
+            return zlib.crc32(request_id.encode()) % len(self.shards)
+    
+    def new_request_id(self, telegram_id: int) -> str:
+        """
+        Новый request_id (UUID4). Младшие 16 бит подбираются так, чтобы id
+        указывал на шард пользователя: запрос и индекс активных запросов
+        пользователя оказываются в одном слоте, а шард находится по одному id.
+        """
+        value = uuid.uuid4().int
+        shards = len(self.shards)
+        if shards > 1:
+            low = (value & 0xFFFF) % (0x10000 // shards) * shards + self.shard_of_user(telegram_id)
+            value = value & ~0xFFFF | low
+        return str(uuid.UUID(int=value))
+    
+    def _request_key(self, request_id: str) -> str:
+        return f"{self.shard_key(AUTH_REQUEST_KEY, self.shard_of_request(request_id))}:{request_id}"
+    
+    def _pending_index_key(self, telegram_id: int, shard: Optional[int] = None) -> str:
+        if shard is None:
+            shard = self.shard_of_user(telegram_id)
+        return f"{self.shard_key(USER_PENDING_KEY, shard)}:{telegram_id}"
+    
     async def set_auth_request(
         self, 
         request_id: str, 
@@ -48,113 +346,344 @@ class RedisService:
     ):
         """Сохранение запроса на авторизацию в Redis"""
         try:
-            key = f"auth_request:{request_id}"
-            await self.redis.setex(
-                key, 
-                expire_seconds, 
-                json.dumps(info, default=str)
-            )
+            key = self._request_key(request_id)
+            async with self.pipeline() as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping=encode_record(info))
+                pipe.expire(key, expire_seconds)
+                await pipe.execute()
             logger.info(f"Auth request {request_id} saved to Redis")
         except Exception as e:
             logger.error(f"Error saving auth request to Redis: {e}")
             raise
     
+    def _reserve_call(
+        self,
+        request_id: str,
+        telegram_id: int,
+        info: Dict[str, Any],
+        limit: int,
+        expire_seconds: int
+    ) -> Dict[str, list]:
+        """Ключи и аргументы скрипта резервирования"""
+        shard = self.shard_of_request(request_id)
+        return {
+            'keys': [
+                self._pending_index_key(telegram_id, shard),
+                self._request_key(request_id),
+                self.shard_key(AUTH_EVENTS_LOG_KEY, shard),
+                self.shard_key(AUTH_HISTORY_STREAM_KEY, shard),
+                self.shard_key(AUTH_DEADLINES_KEY, shard)
+            ],
+            'args': [
+                request_id,
+                json.dumps(info, default=str) if settings.db_write_behind else '',
+                expire_seconds,
+                int(time.time()),
+                limit,
+                info.get('client_id', ''),
+                telegram_id,
+                info.get('created_at', datetime.now().isoformat()),
+                AUTH_EVENTS_CHANNEL,
+                settings.events_log_maxlen,
+                int(settings.db_write_behind),
+                settings.expiry_grace_seconds,
+                int(settings.expiry_enabled),
+                *encode_record_args(info)
+            ]
+        }
+    
+    async def reserve_auth_request(
+        self,
+        request_id: str,
+        telegram_id: int,
+        info: Dict[str, Any],
+        limit: int = settings.max_pending_requests,
+        expire_seconds: int = settings.auth_request_timeout
+    ) -> bool:
+        """
+        Атомарное резервирование слота в индексе активных запросов пользователя
+        и сохранение запроса. Возвращает False, если лимит уже исчерпан.
+        """
+        try:
+            reserved = await self._reserve_pending_script(
+                **self._reserve_call(request_id, telegram_id, info, limit, expire_seconds)
+            )
+            if reserved:
+                logger.info(f"Auth request {request_id} saved to Redis")
+            return bool(reserved)
+        except Exception as e:
+            logger.error(f"Error reserving auth request in Redis: {e}")
+            raise
+    
+    async def reserve_auth_requests_batch(
+        self,
+        requests: List[Dict[str, Any]],
+        limit: int = settings.max_pending_requests,
+        expire_seconds: int = settings.auth_request_timeout
+    ) -> List[bool]:
+        """
+        Резервирование и сохранение пачки запросов за один pipeline.
+        Каждый элемент - словарь запроса (request_id, telegram_id, ...).
+        """
+        try:
+            calls = [
+                self._reserve_call(info['request_id'], info['telegram_id'], info, limit, expire_seconds)
+                for info in requests
+            ]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for call in calls:
+                    await self._reserve_pending_script(client=pipe, **call)
+                results = await pipe.execute(raise_on_error=False)
+            
+            # Pipeline кластера не загружает скрипты сам: узел, еще не знающий
+            # скрипт (например, добавленный при решардинге), отвечает NOSCRIPT.
+            # Такие запросы не выполнялись и повторяются по одному с загрузкой скрипта.
+            for i, result in enumerate(results):
+                if isinstance(result, NoScriptError):
+                    results[i] = await self._reserve_pending_script(**calls[i])
+                elif isinstance(result, Exception):
+                    raise result
+            
+            logger.info(f"Batch of {sum(map(bool, results))}/{len(requests)} auth requests saved to Redis")
+            return [bool(reserved) for reserved in results]
+        except Exception as e:
+            logger.error(f"Error reserving auth requests batch in Redis: {e}")
+            raise
+    
+    async def discard_auth_request(self, request_id: str, telegram_id: int):
+        """
+        Удаление зарезервированного запроса, который не удалось создать
+        до конца: запись, слот в индексе активных запросов пользователя и срок
+        истечения. В режиме write-behind в поток изменений добавляется
+        удаление, чтобы запись в БД не осталась в статусе pending.
+        """
+        shard = self.shard_of_request(request_id)
+        try:
+            async with self.pipeline() as pipe:
+                pipe.delete(self._request_key(request_id))
+                pipe.zrem(self._pending_index_key(telegram_id, shard), request_id)
+                pipe.zrem(self.shard_key(AUTH_DEADLINES_KEY, shard), request_id)
+                if settings.db_write_behind:
+                    pipe.xadd(
+                        self.shard_key(AUTH_HISTORY_STREAM_KEY, shard),
+                        {'op': 'delete', 'data': json.dumps({'request_id': request_id})}
+                    )
+                await pipe.execute()
+            logger.info(f"Auth request {request_id} discarded from Redis")
+        except Exception as e:
+            logger.error(f"Error discarding auth request in Redis: {e}")
+            raise
+    
     async def get_auth_request(self, request_id: str) -> Optional[Dict[str, Any]]:
         """Получение запроса на авторизацию из Redis"""
         try:
-            key = f"auth_request:{request_id}"
-            info = await self.redis.get(key)
-            if info:
-                return json.loads(info)
+            key = self._request_key(request_id)
+            try:
+                fields = await self.redis.hgetall(key)
+            except ResponseError as e:
+                # Запись еще в прежнем формате (JSON-строка)
+                if 'WRONGTYPE' not in str(e):
+                    raise
+                return decode_legacy_record(await self.redis.get(key))
+            if fields:
+                return decode_record(fields)
             return None
         except Exception as e:
             logger.error(f"Error getting auth request from Redis: {e}")
             return None
     
-    async def update_auth_request_status(
-        self, 
-        request_id: str, 
-        status: str, 
+    async def get_auth_request_status(self, request_id: str) -> Optional[str]:
+        """
+        Текущий статус запроса (None, если записи нет). В отличие от
+        get_auth_request ошибки Redis не скрываются: по ответу решают,
+        выполнять ли действие.
+        """
+        key = self._request_key(request_id)
+        try:
+            return await self.redis.hget(key, 'status')
+        except ResponseError as e:
+            if 'WRONGTYPE' not in str(e):
+                raise
+            record = decode_legacy_record(await self.redis.get(key))
+            return record.get('status') if record else None
+    
+    async def transition_auth_request_status(
+        self,
+        request_id: str,
+        telegram_id: int,
+        status: str,
+        expected_status: str = 'pending',
         additional_info: Optional[Dict[str, Any]] = None
-    ):
-        """Обновление статуса запроса на авторизацию"""
+    ) -> Dict[str, Optional[str]]:
+        """
+        Атомарный перевод запроса из expected_status в status за один запрос к Redis.
+        
+        Возвращает словарь с ключами result (ok, not_found, forbidden, conflict),
+        old_status, new_status, а при успехе также created_at (время создания
+        запроса), client_id и amount.
+        """
         try:
-            key = f"auth_request:{request_id}"
-            info = await self.get_auth_request(request_id)
-            if info:
-                info['status'] = status
-                info['updated_at'] = datetime.now().isoformat()
-                
-                if status == 'approved':
-                    info['approved_at'] = datetime.now().isoformat()
-                elif status == 'rejected':
-                    info['rejected_at'] = datetime.now().isoformat()
-                
-                if additional_info:
-                    info.update(additional_info)
-                
-                # Сохраняем обновленные данные
-                ttl = await self.redis.ttl(key)
-                if ttl > 0:
-                    await self.redis.setex(key, ttl, json.dumps(info, default=str))
-                
+            now = datetime.now().isoformat()
+            # Индекс берется в шарде запроса: у владельца запроса шард тот же,
+            # для чужого telegram_id скрипт вернет forbidden, не трогая индекс
+            shard = self.shard_of_request(request_id)
+            result, old_status, new_status, created_at, client_id, amount = await self._transition_status_script(
+                keys=[
+                    self._request_key(request_id),
+                    self._pending_index_key(telegram_id, shard),
+                    self.shard_key(AUTH_EVENTS_LOG_KEY, shard),
+                    self.shard_key(AUTH_HISTORY_STREAM_KEY, shard),
+                    self.shard_key(AUTH_DEADLINES_KEY, shard),
+                    self.shard_key(WEBHOOK_OUTBOX_KEY, shard)
+                ],
+                args=[
+                    request_id,
+                    telegram_id,
+                    expected_status,
+                    status,
+                    STATUS_TIMESTAMP_FIELDS.get(status, ''),
+                    now,
+                    AUTH_EVENTS_CHANNEL,
+                    settings.events_log_maxlen,
+                    int(settings.db_write_behind),
+                    int(settings.webhooks_enabled),
+                    *encode_record_args(additional_info or {})
+                ]
+            )
+            if result == 'ok':
                 logger.info(f"Auth request {request_id} status updated to {status}")
+            else:
+                logger.warning(
+                    f"Auth request {request_id} transition to {status} failed: "
+                    f"{result} (current status: {old_status})"
+                )
+            return {
+                'result': result,
+                'old_status': old_status or None,
+                'new_status': new_status or None,
+                'created_at': created_at or None,
+                'client_id': client_id or None,
+                'amount': amount or None
+            }
         except Exception as e:
             logger.error(f"Error updating auth request status: {e}")
             raise
     
+    async def update_auth_request_fields(
+        self,
+        request_id: str,
+        fields: Dict[str, Any]
+    ) -> bool:
+        """Обновление служебных полей запроса (без смены статуса)"""
+        args = encode_record_args(fields)
+        if not args:
+            return False
+        try:
+            updated = await self._update_fields_script(
+                keys=[self._request_key(request_id)],
+                args=args
+            )
+            return bool(updated)
+        except Exception as e:
+            logger.error(f"Error updating auth request fields: {e}")
+            return False
+    
+    async def get_events_since(
+        self,
+        last_event_id: str,
+        count: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """
+        Чтение событий из журнала, записанных после last_event_id.
+        В кластере журналы шардов читаются параллельно и сливаются по id:
+        id записей потоков - время их добавления, поэтому last_event_id
+        служит общей отметкой времени для всех шардов.
+        """
+        try:
+            shard_entries = await asyncio.gather(*[
+                self.redis.xrange(
+                    self.shard_key(AUTH_EVENTS_LOG_KEY, shard),
+                    min=f"({last_event_id}",
+                    count=count
+                )
+                for shard in self.shards
+            ])
+            entries = heapq.merge(*shard_entries, key=lambda entry: event_id_key(entry[0]))
+            events = []
+            for event_id, fields in entries:
+                if len(events) >= count:
+                    break
+                event = json.loads(fields['data'])
+                event['id'] = event_id
+                events.append(event)
+            return events
+        except Exception as e:
+            logger.error(f"Error reading events log: {e}")
+            raise
+    
     async def delete_auth_request(self, request_id: str):
         """Удаление запроса на авторизацию из Redis"""
         try:
-            key = f"auth_request:{request_id}"
+            key = self._request_key(request_id)
             await self.redis.delete(key)
             logger.info(f"Auth request {request_id} deleted from Redis")
         except Exception as e:
             logger.error(f"Error deleting auth request from Redis: {e}")
     
+    async def get_memory_report(self, sample_size: int = 1000) -> Dict[str, Any]:
+        """
+        Оценка памяти Redis на один запрос: MEMORY USAGE по выборке ключей
+        auth_request:*, отдельно для каждого формата записи.
+        """
+        formats: Dict[str, List[int]] = {}
+        scanned = 0
+        async for key in self.redis.scan_iter(match=f"{AUTH_REQUEST_KEY}:*", count=1000):
+            if scanned >= sample_size:
+                break
+            scanned += 1
+            key_type = await self.redis.type(key)
+            usage = await self.redis.memory_usage(key, samples=0)
+            if usage:
+                formats.setdefault('json' if key_type == 'string' else key_type, []).append(usage)
+        
+        return {
+            'sampled_keys': scanned,
+            'formats': {
+                name: {
+                    'keys': len(sizes),
+                    'avg_bytes': round(sum(sizes) / len(sizes), 1),
+                    'max_bytes': max(sizes)
+                }
+                for name, sizes in formats.items()
+            }
+        }
+    
+    async def claim_update(self, update_id: int, ttl: int = settings.update_dedup_ttl) -> bool:
+        """
+        Отметка обновления Telegram как принятого. Возвращает False, если
+        обновление с таким update_id уже принималось (повторная доставка).
+        """
+        return bool(await self.redis.set(f"tg_update:{update_id}", 1, nx=True, ex=ttl))
+    
+    async def release_update(self, update_id: int):
+        """Снятие отметки, чтобы повторная доставка обновления была обработана"""
+        try:
+            await self.redis.delete(f"tg_update:{update_id}")
+        except Exception as e:
+            logger.error(f"Error releasing update {update_id}: {e}")
+    
     async def get_user_pending_requests_count(self, telegram_id: int) -> int:
         """Получение количества активных запросов пользователя"""
         try:
-            pattern = f"auth_request:*"
-            keys = await self.redis.keys(pattern)
-            
-            count = 0
-            for key in keys:
-                info = await self.redis.get(key)
-                if info:
-                    request_info = json.loads(info)
-                    if (request_info.get('telegram_id') == telegram_id and 
-                        request_info.get('status') == 'pending'):
-                        count += 1
-            
-            return count
+            return await self.redis.zcount(
+                self._pending_index_key(telegram_id),
+                f"({int(time.time())}",
+                "+inf"
+            )
         except Exception as e:
             logger.error(f"Error counting user pending requests: {e}")
             return 0
-    
-    async def cleanup_expired_requests(self):
-        """Очистка истекших запросов (фоновая задача)"""
-        try:
-            pattern = f"auth_request:*"
-            keys = await self.redis.keys(pattern)
-            
-            expired_count = 0
-            for key in keys:
-                ttl = await self.redis.ttl(key)
-                if ttl == -1:  # Ключ без TTL
-                    info = await self.redis.get(key)
-                    if info:
-                        request_info = json.loads(info)
-                        created_at = datetime.fromisoformat(request_info.get('created_at', ''))
-                        if datetime.now() - created_at > timedelta(seconds=settings.auth_request_timeout):
-                            await self.redis.delete(key)
-                            expired_count += 1
-            
-            if expired_count > 0:
-                logger.info(f"Cleaned up {expired_count} expired auth requests")
-                
-        except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
 
 
 # Глобальный экземпляр
@@ -0,0 +1,314 @@
+import asyncio
+import math
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Dict, Any, List, Union
+from loguru import logger
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import settings
+from app.database.database import async_session
+from app.database.models import DecisionRollup, DecisionLatencyBin, Client
+
+
+# Основание логарифмических корзин скетча: относительная погрешность
+# перцентиля (gamma - 1) / (gamma + 1), около 2.5%
+LATENCY_GAMMA = 1.05
+
+# Минимальное различимое время до решения, секунд
+LATENCY_MIN_SECONDS = 0.01
+
+# Счетчики итогов и статусы, для которых ведется скетч времени до решения
+ROLLUP_COUNTERS = ('created', 'approved', 'rejected', 'expired', 'amount_requested', 'amount_approved')
+SKETCH_STATUSES = ('approved', 'rejected')
+
+# Строк в одном UPSERT (ограничение числа параметров запроса)
+FLUSH_CHUNK_SIZE = 1000
+
+# Перцентили в ответе /api/v1/stats
+PERCENTILES = (0.5, 0.9, 0.99)
+
+AMOUNT_JUNK = re.compile(r"[^\d,.\-]")
+
+
+def parse_amount(amount: Optional[str]) -> Optional[Decimal]:
+    """
+    Сумма операции из строки ("1500.00", "1 500,00 ₽", "$1,500.00", "1.500,00").
+    Если есть и точка, и запятая, десятичный разделитель - последний из них.
+    Одна запятая без точек - десятичная, если после нее не три цифры;
+    несколько одинаковых разделителей - разделители разрядов.
+    """
+    if not amount:
+        return None
+    value = AMOUNT_JUNK.sub("", str(amount))
+    if "," in value and "." in value:
+        decimal_mark = "," if value.rindex(",") > value.rindex(".") else "."
+        group_mark = "." if decimal_mark == "," else ","
+        value = value.replace(group_mark, "").replace(decimal_mark, ".")
+    elif "," in value:
+        if value.count(",") == 1 and len(value.rsplit(",", 1)[1]) != 3:
+            value = value.replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    elif value.count(".") > 1:
+        value = value.replace(".", "")
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return None
+
+
+def to_utc(value: Union[str, datetime, None]) -> datetime:
+    """Время из Redis (ISO, локальное) или БД в UTC; None - текущее время"""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.astimezone(timezone.utc)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def latency_bin(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, LATENCY_MIN_SECONDS)) / math.log(LATENCY_GAMMA))
+
+
+def bin_value(index: int) -> float:
+    """Оценка значения корзины (середина по относительной погрешности)"""
+    return 2 * LATENCY_GAMMA ** index / (LATENCY_GAMMA + 1)
+
+
+def sketch_percentiles(bins: Dict[int, int]) -> Dict[str, Optional[float]]:
+    """Перцентили времени до решения по объединенному скетчу"""
+    total = sum(bins.values())
+    result = {}
+    for p in PERCENTILES:
+        key = f"p{round(p * 100)}_seconds"
+        if not total:
+            result[key] = None
+            continue
+        rank, seen = p * (total - 1), 0
+        for index in sorted(bins):
+            seen += bins[index]
+            if seen > rank:
+                result[key] = round(bin_value(index), 3)
+                break
+    return result
+
+
+class RollupService:
+    """
+    Почасовые итоги по клиентам: число созданных, подтвержденных,
+    отклоненных и истекших запросов, суммы и скетч времени до решения.
+    
+    События учитываются в памяти процесса и раз в rollup_flush_interval
+    секунд сливаются в decision_rollups и decision_latency_bins одним
+    UPSERT с прибавлением, поэтому процессы пишут итоги независимо.
+    Создание учитывается в часе создания, решение - в часе решения.
+    При аварийном завершении теряются события последнего интервала.
+    """
+    
+    def __init__(self):
+        self._counters: Dict[tuple, Dict[str, Any]] = {}
+        self._bins: Dict[tuple, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    async def start(self):
+        """Запуск периодической записи итогов"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info("Decision rollups started")
+    
+    async def stop(self):
+        """Остановка с записью накопленного"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+            logger.info("Decision rollups stopped")
+    
+    def _counter(self, client_id: str, bucket: datetime) -> Dict[str, Any]:
+        key = (client_id, bucket)
+        if key not in self._counters:
+            self._counters[key] = {name: 0 for name in ROLLUP_COUNTERS}
+        return self._counters[key]
+    
+    def record_created(self, client_id: str, created_at: Union[str, datetime, None], amount: Optional[str]):
+        """Учет созданного запроса"""
+        if not settings.rollups_enabled:
+            return
+        counter = self._counter(client_id, hour_bucket(to_utc(created_at)))
+        counter['created'] += 1
+        counter['amount_requested'] += parse_amount(amount) or 0
+    
+    def record_decision(
+        self,
+        client_id: Optional[str],
+        status: str,
+        created_at: Union[str, datetime, None],
+        decided_at: Union[str, datetime, None] = None,
+        amount: Optional[str] = None
+    ):
+        """Учет конечного статуса (approved, rejected, expired)"""
+        if not settings.rollups_enabled or not client_id or status not in ROLLUP_COUNTERS:
+            return
+        decided = to_utc(decided_at)
+        bucket = hour_bucket(decided)
+        counter = self._counter(client_id, bucket)
+        counter[status] += 1
+        if status == 'approved':
+            counter['amount_approved'] += parse_amount(amount) or 0
+        if status in SKETCH_STATUSES and created_at:
+            seconds = (decided - to_utc(created_at)).total_seconds()
+            self._bins[(client_id, bucket, status, latency_bin(seconds))] += 1
+    
+    async def flush(self):
+        """Запись накопленных итогов в БД"""
+        async with self._lock:
+            counters, self._counters = self._counters, {}
+            bins, self._bins = self._bins, defaultdict(int)
+            if not counters and not bins:
+                return
+            
+            try:
+                rollup_rows = [
+                    {'client_id': client_id, 'bucket': bucket, **values}
+                    for (client_id, bucket), values in counters.items()
+                ]
+                bin_rows = [
+                    {'client_id': client_id, 'bucket': bucket, 'status': status, 'bin': index, 'count': count}
+                    for (client_id, bucket, status, index), count in bins.items()
+                ]
+                async with async_session() as db:
+                    for start in range(0, len(rollup_rows), FLUSH_CHUNK_SIZE):
+                        statement = pg_insert(DecisionRollup).values(rollup_rows[start:start + FLUSH_CHUNK_SIZE])
+                        await db.execute(statement.on_conflict_do_update(
+                            index_elements=['client_id', 'bucket'],
+                            set_={
+                                name: getattr(DecisionRollup, name) + getattr(statement.excluded, name)
+                                for name in ROLLUP_COUNTERS
+                            }
+                        ))
+                    for start in range(0, len(bin_rows), FLUSH_CHUNK_SIZE):
+                        statement = pg_insert(DecisionLatencyBin).values(bin_rows[start:start + FLUSH_CHUNK_SIZE])
+                        await db.execute(statement.on_conflict_do_update(
+                            index_elements=['client_id', 'bucket', 'status', 'bin'],
+                            set_={'count': DecisionLatencyBin.count + statement.excluded.count}
+                        ))
+                    await db.commit()
+            except Exception:
+                # Возвращаем итоги в накопитель до следующей попытки
+                for key, values in counters.items():
+                    counter = self._counter(*key)
+                    for name in ROLLUP_COUNTERS:
+                        counter[name] += values[name]
+                for key, count in bins.items():
+                    self._bins[key] += count
+                raise
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.rollup_flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing decision rollups: {e}")
+    
+    async def get_stats(
+        self,
+        since: datetime,
+        until: datetime,
+        client_ids: Optional[List[str]] = None,
+        granularity: str = 'day',
+        tenant: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Итоги за [since, until) с разбивкой по клиентам и периодам
+        (hour, day или total - за весь интервал). Читаются таблицы итогов,
+        tenant - только клиенты этого владельца (по таблице clients).
+        """
+        if granularity not in ('hour', 'day', 'total'):
+            raise ValueError(f"Unknown granularity: {granularity}")
+        
+        def period(column):
+            if granularity == 'total':
+                return None
+            # Константы в тексте запроса, чтобы выражение в SELECT и GROUP BY совпадало
+            return func.date_trunc(literal_column(f"'{granularity}'"), column, literal_column("'UTC'"))
+        
+        rollup_period = period(DecisionRollup.bucket)
+        rollup_group = [DecisionRollup.client_id] + ([rollup_period] if rollup_period is not None else [])
+        rollups = select(
+            *rollup_group,
+            *[func.sum(getattr(DecisionRollup, name)).label(name) for name in ROLLUP_COUNTERS]
+        ).where(DecisionRollup.bucket >= since, DecisionRollup.bucket < until)
+        
+        bin_period = period(DecisionLatencyBin.bucket)
+        bin_group = [DecisionLatencyBin.client_id] + ([bin_period] if bin_period is not None else [])
+        sketches = select(
+            *bin_group,
+            DecisionLatencyBin.status,
+            DecisionLatencyBin.bin,
+            func.sum(DecisionLatencyBin.count)
+        ).where(DecisionLatencyBin.bucket >= since, DecisionLatencyBin.bucket < until)
+        
+        if client_ids:
+            rollups = rollups.where(DecisionRollup.client_id.in_(client_ids))
+            sketches = sketches.where(DecisionLatencyBin.client_id.in_(client_ids))
+        if tenant:
+            tenant_clients = select(Client.client_id).where(Client.tenant == tenant)
+            rollups = rollups.where(DecisionRollup.client_id.in_(tenant_clients))
+            sketches = sketches.where(DecisionLatencyBin.client_id.in_(tenant_clients))
+        rollups = rollups.group_by(*rollup_group).order_by(*rollup_group)
+        sketches = sketches.group_by(*bin_group, DecisionLatencyBin.status, DecisionLatencyBin.bin)
+        
+        async with async_session() as db:
+            rollup_rows = (await db.execute(rollups)).all()
+            sketch_rows = (await db.execute(sketches)).all()
+        
+        merged: Dict[tuple, Dict[str, Dict[int, int]]] = defaultdict(lambda: defaultdict(dict))
+        for *group, status, index, count in sketch_rows:
+            merged[tuple(group)][status][index] = int(count)
+        
+        result = []
+        for row in rollup_rows:
+            group = tuple(row[:len(rollup_group)])
+            values = row._mapping
+            counts = {name: int(values[name]) for name in ('created', 'approved', 'rejected', 'expired')}
+            decided = counts['approved'] + counts['rejected'] + counts['expired']
+            item = {
+                'client_id': values['client_id'],
+                'period': group[1].isoformat() if len(group) > 1 else None,
+                **counts,
+                'amount_requested': str(values['amount_requested']),
+                'amount_approved': str(values['amount_approved']),
+                'approval_rate': round(counts['approved'] / decided, 4) if decided else None,
+                'rejection_rate': round(counts['rejected'] / decided, 4) if decided else None,
+                'expiry_rate': round(counts['expired'] / decided, 4) if decided else None,
+                'decision_latency': {}
+            }
+            sketch = merged.get(group, {})
+            combined: Dict[int, int] = defaultdict(int)
+            for status in SKETCH_STATUSES:
+                for index, count in sketch.get(status, {}).items():
+                    combined[index] += count
+                item['decision_latency'][status] = sketch_percentiles(sketch.get(status, {}))
+            item['decision_latency']['all'] = sketch_percentiles(combined)
+            result.append(item)
+        return result
+
+
+# Глобальный экземпляр
+rollup_service = RollupService()
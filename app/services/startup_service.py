@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Awaitable, Optional, Dict, List
+from loguru import logger
+from redis.exceptions import LockError
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services import metrics
+
+
+# Блокировка на время общей настройки (схема БД, webhook)
+STARTUP_LOCK_KEY = "startup:lock"
+
+# Флаг готовности общей настройки, дополняется отпечатком конфигурации
+STARTUP_READY_KEY = "startup:ready"
+
+# Корень проекта (alembic.ini и каталог миграций)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def alembic_heads() -> List[str]:
+    """Головные ревизии миграций. alembic импортируется только здесь"""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    
+    config = Config(os.path.join(PROJECT_ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(PROJECT_ROOT, "alembic"))
+    return list(ScriptDirectory.from_config(config).get_heads())
+
+
+class StartupCoordinator:
+    """
+    Согласованный запуск нескольких процессов и узлов.
+    
+    Общую настройку (создание схемы БД, регистрацию webhook) выполняет
+    ровно один процесс - тот, кто захватил блокировку в Redis. Остальные
+    ждут флаг готовности. Флаг привязан к версии приложения и параметрам
+    webhook и живет startup_ready_ttl секунд, поэтому перезапуск воркеров
+    и узлов с той же конфигурацией настройку не повторяет. Если ведущий
+    процесс упал, блокировка истекает и настройку выполняет следующий.
+    
+    Также ведет разбивку времени запуска процесса по этапам (timings, мс).
+    """
+    
+    def __init__(self):
+        self.ready = False
+        self.timings: Dict[str, float] = {}
+        self._identity = f"{socket.gethostname()}-{os.getpid()}"
+    
+    def record(self, name: str, started: float):
+        """Учет этапа запуска, начавшегося в started (time.perf_counter)"""
+        seconds = time.perf_counter() - started
+        self.timings[name] = round(seconds * 1000, 1)
+        metrics.STARTUP_PHASE_SECONDS.labels(name).set(seconds)
+    
+    @contextmanager
+    def phase(self, name: str):
+        """Замер этапа запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+    
+    @staticmethod
+    async def gather(*steps: Awaitable):
+        """Независимые шаги запуска: одновременно или по очереди (STARTUP_PARALLEL=false)"""
+        if settings.startup_parallel:
+            await asyncio.gather(*steps)
+            return
+        for step in steps:
+            await step
+    
+    @staticmethod
+    async def check_schema(revision: Optional[str]):
+        """Сверка версии схемы БД с головной ревизией миграций вместо create_all"""
+        heads = await asyncio.to_thread(alembic_heads)
+        if revision not in heads:
+            raise RuntimeError(
+                f"Database schema revision {revision} does not match migrations head "
+                f"{', '.join(heads)}, run alembic upgrade head"
+            )
+        logger.info(f"Database schema is at head revision {revision}")
+    
+    @staticmethod
+    def fingerprint(*parts: str) -> str:
+        """Отпечаток конфигурации, при изменении которой настройку нужно повторить"""
+        source = "|".join([settings.app_version, *parts])
+        return hashlib.sha256(source.encode()).hexdigest()[:16]
+    
+    async def run(self, setup: Callable[[], Awaitable[None]], fingerprint: str) -> bool:
+        """
+        Выполнение setup одним процессом на все развертывание.
+        Возвращает True, если настройку выполнил текущий процесс.
+        """
+        ready_key = f"{STARTUP_READY_KEY}:{fingerprint}"
+        deadline = time.monotonic() + settings.startup_wait_timeout
+        
+        while True:
+            if await redis_service.redis.exists(ready_key):
+                logger.info("Shared startup already completed, skipping")
+                return False
+            
+            lock = redis_service.redis.lock(STARTUP_LOCK_KEY, timeout=settings.startup_lock_timeout)
+            if await lock.acquire(blocking=False):
+                try:
+                    # Настройку могли завершить, пока мы ждали блокировку
+                    if await redis_service.redis.exists(ready_key):
+                        return False
+                    
+                    logger.info(f"Running shared startup as leader ({self._identity})")
+                    await setup()
+                    await redis_service.redis.set(
+                        ready_key,
+                        json.dumps({'leader': self._identity, 'at': datetime.now().isoformat()}),
+                        ex=settings.startup_ready_ttl
+                    )
+                    return True
+                finally:
+                    try:
+                        await lock.release()
+                    except LockError:
+                        logger.warning("Startup lock expired before setup completed")
+            
+            if time.monotonic() > deadline:
+                raise RuntimeError("Timed out waiting for shared startup to complete")
+            await asyncio.sleep(settings.startup_poll_interval)
+
+
+# Глобальный экземпляр
+startup_coordinator = StartupCoordinator()
@@ -0,0 +1,429 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit
+
+import aiohttp
+from loguru import logger
+from redis.exceptions import ResponseError
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.database.database import async_session
+from app.database.models import Webhook
+from app.services.auth_service import auth_service
+from app.services.redis_service import redis_service, WEBHOOK_OUTBOX_KEY
+
+
+# Группа потребителей исходящих событий для доставки webhook'ов
+WEBHOOK_GROUP = "webhooks"
+
+# Очередь доставок (ZSET задание -> время следующей попытки)
+WEBHOOK_QUEUE_KEY = "webhook_deliveries"
+
+# Доставки, исчерпавшие все попытки
+WEBHOOK_DEAD_KEY = "webhook_dead"
+
+# Статусы, о которых уведомляются интеграторы
+DECISION_STATUSES = {'approved', 'rejected', 'expired'}
+
+
+# Захват пачки готовых к отправке заданий с арендой до ARGV[3].
+# Если обработчик упадет, задание вернется в очередь по истечении аренды.
+CLAIM_DUE_SCRIPT = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(jobs) do
+    redis.call('ZADD', KEYS[1], ARGV[3], job)
+end
+return jobs
+"""
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 подпись тела запроса: hex(hmac(secret, "{timestamp}." + body))"""
+    return hmac.new(
+        secret.encode(),
+        timestamp.encode() + b"." + body,
+        hashlib.sha256
+    ).hexdigest()
+
+
+class WebhookService:
+    """
+    Сервис доставки уведомлений о решениях на URL интеграторов.
+
+    События о решениях берутся из потока исходящих webhook_outbox (он пишется
+    атомарно со сменой статуса и, в отличие от журнала auth_events_log, не
+    обрезается, поэтому отставший обработчик событий не теряет),
+    превращаются в задания очереди доставок и отправляются фоновым
+    обработчиком с повторными попытками. Путь обработки нажатия в Telegram
+    доставку не ждет. В Redis Cluster у каждого шарда свои исходящие,
+    очередь доставок в том же слоте и свои обработчики.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+        self._deliveries: set = set()
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._host_limits: Dict[str, list] = {}
+        self._webhooks: Dict[int, Dict[str, Any]] = {}
+        self._webhooks_loaded_at = 0.0
+        self._webhooks_lock = asyncio.Lock()
+        self._claim_script = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def start(self):
+        """Запуск фоновых обработчиков доставки"""
+        if self._tasks:
+            return
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.webhook_max_inflight),
+            timeout=aiohttp.ClientTimeout(total=settings.webhook_timeout)
+        )
+        self._inflight = asyncio.Semaphore(settings.webhook_max_inflight)
+        self._claim_script = redis_service.redis.register_script(CLAIM_DUE_SCRIPT)
+
+        await self._create_groups()
+        self._tasks = []
+        for shard in redis_service.shards:
+            self._tasks.append(asyncio.create_task(self._outbox_loop(shard)))
+            self._tasks.append(asyncio.create_task(self._delivery_loop(shard)))
+        logger.info("Webhook delivery worker started")
+
+    async def _create_groups(self):
+        """Группы потребителей исходящих событий всех шардов"""
+        for shard in redis_service.shards:
+            try:
+                # С начала потока: события, записанные до создания группы, тоже доставляются
+                await redis_service.redis.xgroup_create(
+                    redis_service.shard_key(WEBHOOK_OUTBOX_KEY, shard), WEBHOOK_GROUP, id="0", mkstream=True
+                )
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def stop(self):
+        """Остановка фоновых обработчиков доставки"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._deliveries, return_exceptions=True)
+        self._tasks = []
+
+        if self._session:
+            await self._session.close()
+            self._session = None
+        logger.info("Webhook delivery worker stopped")
+
+    async def register_webhook(
+        self,
+        url: str,
+        client_id: Optional[str] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Регистрация URL для уведомлений. Секрет подписи возвращается только здесь.
+        tenant - владелец подписки: без client_id приходят события только его клиентов
+        """
+        async with async_session() as db:
+            webhook = Webhook(
+                url=url,
+                client_id=client_id,
+                tenant=tenant,
+                secret=secrets.token_hex(32),
+                is_active=True
+            )
+            db.add(webhook)
+            await db.commit()
+
+            # Сбрасываем кеш подписок этого процесса
+            self._webhooks_loaded_at = 0.0
+
+            logger.info(f"Webhook {webhook.id} registered for {url}")
+            return {
+                'id': webhook.id,
+                'url': webhook.url,
+                'client_id': webhook.client_id,
+                'secret': webhook.secret
+            }
+
+    async def list_webhooks(self, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Список активных подписок (без секретов), tenant - только подписки владельца"""
+        query = select(Webhook).where(Webhook.is_active.is_(True)).order_by(Webhook.id)
+        if tenant:
+            query = query.where(Webhook.tenant == tenant)
+        async with async_session() as db:
+            result = await db.execute(query)
+            return [
+                {
+                    'id': webhook.id,
+                    'url': webhook.url,
+                    'client_id': webhook.client_id,
+                    'created_at': webhook.created_at.isoformat() if webhook.created_at else None
+                }
+                for webhook in result.scalars()
+            ]
+
+    async def delete_webhook(self, webhook_id: int, tenant: Optional[str] = None) -> bool:
+        """Отключение подписки, tenant - только подписки владельца"""
+        query = update(Webhook).where(Webhook.id == webhook_id, Webhook.is_active.is_(True))
+        if tenant:
+            query = query.where(Webhook.tenant == tenant)
+        async with async_session() as db:
+            result = await db.execute(query.values(is_active=False))
+            await db.commit()
+
+        self._webhooks_loaded_at = 0.0
+        return result.rowcount > 0
+
+    async def _load_webhooks(self, force: bool = False):
+        """
+        Обновление кеша активных подписок не чаще раза в webhook_cache_ttl секунд.
+        force - перечитать сразу, если кеш не обновлялся после вызова;
+        одновременные обновления выполняют одно чтение из БД.
+        """
+        requested_at = time.monotonic()
+        async with self._webhooks_lock:
+            if self._webhooks_loaded_at >= requested_at:
+                return
+            if not force and requested_at - self._webhooks_loaded_at < settings.webhook_cache_ttl:
+                return
+            self._webhooks = await self._fetch_webhooks()
+            self._webhooks_loaded_at = time.monotonic()
+
+    async def _fetch_webhooks(self) -> Dict[int, Dict[str, Any]]:
+        """Активные подписки из БД"""
+        async with async_session() as db:
+            result = await db.execute(select(Webhook).where(Webhook.is_active.is_(True)))
+            return {
+                webhook.id: {
+                    'id': webhook.id,
+                    'url': webhook.url,
+                    'client_id': webhook.client_id,
+                    'tenant': webhook.tenant,
+                    'secret': webhook.secret
+                }
+                for webhook in result.scalars()
+            }
+
+    async def _destinations(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Подписки, которым нужно доставить событие: на клиента события или
+        на всех клиентов (у подписки владельца - только на его клиентов)
+        """
+        destinations = []
+        tenants = {}
+        for webhook in self._webhooks.values():
+            if webhook['client_id'] is not None:
+                if webhook['client_id'] == event.get('client_id'):
+                    destinations.append(webhook)
+                continue
+            if webhook['tenant'] is not None:
+                # Владелец клиента читается один раз на событие и только при необходимости
+                if 'tenant' not in tenants:
+                    tenants['tenant'] = await auth_service.get_client_tenant(event.get('client_id'))
+                if webhook['tenant'] != tenants['tenant']:
+                    continue
+            destinations.append(webhook)
+        return destinations
+
+    async def _outbox_loop(self, shard: int):
+        """Чтение исходящих событий шарда и постановка заданий в очередь доставок"""
+        outbox = redis_service.shard_key(WEBHOOK_OUTBOX_KEY, shard)
+        while True:
+            try:
+                # Забираем записи, зависшие у упавших обработчиков
+                _, entries, *_ = await redis_service.redis.xautoclaim(
+                    outbox,
+                    WEBHOOK_GROUP,
+                    self._consumer,
+                    min_idle_time=settings.webhook_lease_seconds * 1000,
+                    count=settings.webhook_batch_size
+                )
+                if not entries:
+                    response = await redis_service.redis.xreadgroup(
+                        WEBHOOK_GROUP,
+                        self._consumer,
+                        {outbox: ">"},
+                        count=settings.webhook_batch_size,
+                        block=5000
+                    )
+                    entries = response[0][1] if response else []
+
+                if entries:
+                    await self._enqueue(shard, entries)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook outbox error: {e}")
+                await asyncio.sleep(1)
+
+    async def _enqueue(self, shard: int, entries: List[tuple]):
+        """
+        Атомарная постановка заданий, подтверждение и удаление записей
+        исходящих: после постановки в очередь доставок они не нужны
+        """
+        await self._load_webhooks()
+        now = time.time()
+        queue = redis_service.shard_key(WEBHOOK_QUEUE_KEY, shard)
+        outbox = redis_service.shard_key(WEBHOOK_OUTBOX_KEY, shard)
+        event_ids = [event_id for event_id, _ in entries]
+
+        # Получатели определяются до pipeline: для подписок владельца читается владелец клиента
+        jobs = []
+        for event_id, fields in entries:
+            if not fields:
+                continue
+            event = json.loads(fields['data'])
+            if event.get('status') not in DECISION_STATUSES:
+                continue
+            # id события - id записи журнала событий, как в SSE
+            event.setdefault('id', event_id)
+            for webhook in await self._destinations(event):
+                jobs.append(json.dumps({
+                    'webhook_id': webhook['id'],
+                    'event': event,
+                    'attempt': 0
+                }))
+
+        async with redis_service.pipeline() as pipe:
+            if jobs:
+                pipe.zadd(queue, {job: now for job in jobs})
+            pipe.xack(outbox, WEBHOOK_GROUP, *event_ids)
+            pipe.xdel(outbox, *event_ids)
+            await pipe.execute()
+
+    async def _delivery_loop(self, shard: int):
+        """Захват готовых заданий шарда и их параллельная отправка"""
+        queue = redis_service.shard_key(WEBHOOK_QUEUE_KEY, shard)
+        while True:
+            try:
+                now = time.time()
+                jobs = await self._claim_script(
+                    keys=[queue],
+                    args=[now, settings.webhook_batch_size, now + settings.webhook_lease_seconds]
+                )
+                if not jobs:
+                    await asyncio.sleep(settings.webhook_poll_interval)
+                    continue
+
+                await self._load_webhooks()
+                for raw_job in jobs:
+                    await self._inflight.acquire()
+                    task = asyncio.create_task(self._deliver(shard, raw_job))
+                    self._deliveries.add(task)
+                    task.add_done_callback(self._delivery_done)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook delivery loop error: {e}")
+                await asyncio.sleep(1)
+
+    def _delivery_done(self, task: asyncio.Task):
+        self._deliveries.discard(task)
+        self._inflight.release()
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """
+        Ограничение числа параллельных запросов на один хост. Семафор хоста
+        хранится, пока к хосту есть запросы или ожидающие (счетчик рядом
+        с семафором), поэтому словарь не растет с числом хостов.
+        """
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = [asyncio.Semaphore(settings.webhook_concurrency_per_host), 0]
+        limit[1] += 1
+        try:
+            async with limit[0]:
+                yield
+        finally:
+            limit[1] -= 1
+            if not limit[1]:
+                del self._host_limits[host]
+
+    async def _deliver(self, shard: int, raw_job: str):
+        """Отправка одного задания"""
+        job = json.loads(raw_job)
+        webhook = self._webhooks.get(job['webhook_id'])
+        if webhook is None:
+            # Подписку могли добавить после загрузки кеша (например, через
+            # другой процесс) - проверяем по БД
+            try:
+                await self._load_webhooks(force=True)
+            except Exception as e:
+                # Задание останется под арендой и будет повторено
+                logger.error(f"Error loading webhooks: {e}")
+                return
+            webhook = self._webhooks.get(job['webhook_id'])
+        if webhook is None:
+            # Подписка отключена: задание сохраняется среди недоставленных
+            async with redis_service.pipeline() as pipe:
+                pipe.zrem(redis_service.shard_key(WEBHOOK_QUEUE_KEY, shard), raw_job)
+                pipe.rpush(
+                    redis_service.shard_key(WEBHOOK_DEAD_KEY, shard),
+                    json.dumps(dict(job, error="webhook not found"))
+                )
+                await pipe.execute()
+            logger.warning(f"Webhook {job['webhook_id']} not found, event {job['event']['id']} dead-lettered")
+            return
+
+        body = json.dumps(job['event'], default=str).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Webhook-Id': str(webhook['id']),
+            'X-Webhook-Event-Id': job['event']['id'],
+            'X-Webhook-Timestamp': timestamp,
+            'X-Webhook-Signature': f"sha256={sign_payload(webhook['secret'], timestamp, body)}"
+        }
+
+        delivered = False
+        try:
+            async with self._host_slot(webhook['url']):
+                async with self._session.post(webhook['url'], data=body, headers=headers) as response:
+                    delivered = 200 <= response.status < 300
+                    if not delivered:
+                        logger.warning(f"Webhook {webhook['id']} responded with {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Webhook {webhook['id']} delivery failed: {e!r}")
+
+        await self._complete(shard, raw_job, job, delivered)
+
+    async def _complete(self, shard: int, raw_job: str, job: Dict[str, Any], delivered: bool):
+        """Удаление доставленного задания или планирование повторной попытки"""
+        queue = redis_service.shard_key(WEBHOOK_QUEUE_KEY, shard)
+        async with redis_service.pipeline() as pipe:
+            pipe.zrem(queue, raw_job)
+            if not delivered:
+                job['attempt'] += 1
+                if job['attempt'] >= settings.webhook_max_attempts:
+                    pipe.rpush(redis_service.shard_key(WEBHOOK_DEAD_KEY, shard), json.dumps(job))
+                    logger.error(
+                        f"Webhook {job['webhook_id']} gave up on event {job['event']['id']} "
+                        f"after {job['attempt']} attempts"
+                    )
+                else:
+                    delay = min(
+                        settings.webhook_backoff_base * 2 ** (job['attempt'] - 1),
+                        settings.webhook_backoff_max
+                    )
+                    delay *= random.uniform(0.8, 1.2)
+                    pipe.zadd(queue, {json.dumps(job): time.time() + delay})
+            await pipe.execute()
+
+
+# Глобальный экземпляр
+webhook_service = WebhookService()
@@ -0,0 +1,167 @@
+"""
+Бенчмарк контроля допуска под перегрузкой.
+
+Моделирует POST /api/v1/auth/request с ограниченным пулом соединений:
+обработчик занимает одно из --pool соединений на --service-ms мс, поэтому
+пропускная способность - pool / service. Запросы приходят открытым
+потоком (не дожидаясь ответов) с интенсивностью --overload x емкость в
+течение --duration секунд. Прогон выполняется дважды - без контроля
+допуска и с AdmissionMiddleware - и сравнивает p50/p99 времени ответа
+успешных запросов и долю отказов 503. Без контроля допуска очередь к
+пулу растет все время теста, с ним p99 остается в пределах целевой
+задержки, а лишние запросы получают быстрый отказ.
+
+Запросы передаются ASGI-приложению напрямую, сеть, PostgreSQL и Redis
+не нужны.
+
+Запуск:
+    python -m benchmarks.bench_admission --pool 10 --service-ms 50 --overload 5 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any, List, Optional
+
+from fastapi import FastAPI
+
+from app.config import settings
+from app.api.admission import AdmissionMiddleware
+from app.services.admission_service import AdmissionController
+
+
+BENCH_PATH = "/api/v1/auth/request"
+
+
+class SimulatedPool:
+    """Пул соединений: pool мест, каждое занято на время обработки"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(size)
+    
+    def saturated(self) -> bool:
+        return self.in_use >= self.size
+    
+    async def handle(self, service: float):
+        async with self._semaphore:
+            self.in_use += 1
+            try:
+                await asyncio.sleep(service)
+            finally:
+                self.in_use -= 1
+
+
+def build_app(pool: SimulatedPool, service: float) -> FastAPI:
+    bench_app = FastAPI()
+    
+    @bench_app.post(BENCH_PATH)
+    async def create_auth_request():
+        await pool.handle(service)
+        return {"status": "pending"}
+    
+    return bench_app
+
+
+async def call(app, path: str) -> int:
+    """Один запрос к ASGI-приложению, возвращает код ответа"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [],
+        'client': ('127.0.0.1', 0),
+        'server': ('bench', 80)
+    }
+    status_code = 500
+    
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    
+    async def send(message):
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+    
+    await app(scope, receive, send)
+    return status_code
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1)
+
+
+async def run(args, admission: bool) -> Dict[str, Any]:
+    pool = SimulatedPool(args.pool)
+    service = args.service_ms / 1000
+    app = build_app(pool, service)
+    if admission:
+        app = AdmissionMiddleware(app, AdmissionController(saturated=pool.saturated))
+    
+    capacity = args.pool / service
+    rate = capacity * args.overload
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    
+    async def one():
+        started = time.perf_counter()
+        status_code = await call(app, BENCH_PATH)
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+        if status_code == 200:
+            latencies.append(time.perf_counter() - started)
+    
+    # Открытый поток: запросы отправляются по расписанию, не дожидаясь ответов
+    tasks = []
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= args.duration:
+            break
+        due = int(elapsed * rate)
+        for _ in range(due - sent):
+            tasks.append(asyncio.create_task(one()))
+        sent = max(sent, due)
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "admission": admission,
+        "capacity_rps": round(capacity, 1),
+        "offered_rps": round(rate, 1),
+        "sent": sent,
+        "ok": statuses.get(200, 0),
+        "rejected_503": statuses.get(503, 0),
+        "ok_rps": round(statuses.get(200, 0) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else None
+    }
+
+
+async def main(args):
+    if args.latency_target is not None:
+        settings.admission_latency_target = args.latency_target
+    results = [await run(args, admission=False), await run(args, admission=True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool", type=int, default=10, help="соединений в пуле")
+    parser.add_argument("--service-ms", type=float, default=50, help="время обработки запроса, мс")
+    parser.add_argument("--overload", type=float, default=5, help="нагрузка относительно емкости")
+    parser.add_argument("--duration", type=float, default=10, help="секунд подачи нагрузки")
+    parser.add_argument("--latency-target", type=float, default=None, help="ADMISSION_LATENCY_TARGET, секунд")
+    asyncio.run(main(parser.parse_args()))
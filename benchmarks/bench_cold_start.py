@@ -0,0 +1,136 @@
+"""
+Бенчмарк холодного запуска: время от старта процесса до ответа 200 на /ready.
+
+Запускает приложение (uvicorn) --runs раз в каждом режиме:
+  legacy - DB_SCHEMA_MODE=create_all, STARTUP_PARALLEL=false (прежний порядок)
+  fast   - DB_SCHEMA_MODE=check, STARTUP_PARALLEL=true
+Перед каждым запуском удаляются ключи startup:ready:*, чтобы общая
+настройка (схема, секции, webhook) выполнялась заново, как при первом
+развертывании. Схема заранее приводится к последней миграции
+(alembic upgrade head). Печатает p50/max времени до готовности и
+разбивку запуска по этапам из /health последнего прогона.
+
+Telegram заменяется benchmarks.fake_bot_api, --ephemeral поднимает
+временные Redis и PostgreSQL (нужны redis-server, initdb, pg_ctl в PATH).
+
+Запуск:
+    python -m benchmarks.bench_cold_start --ephemeral --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Any
+
+import aiohttp
+from redis.asyncio import Redis
+
+from app.config import settings
+from app.services.startup_service import PROJECT_ROOT, STARTUP_READY_KEY
+from benchmarks.e2e_load import EphemeralServices, free_port, BENCH_BOT_TOKEN
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+MODES = {
+    "legacy": {"DB_SCHEMA_MODE": "create_all", "STARTUP_PARALLEL": "false"},
+    "fast": {"DB_SCHEMA_MODE": "check", "STARTUP_PARALLEL": "true"}
+}
+
+
+async def reset_ready(env: Dict[str, str]):
+    """Удаление отметок выполненной общей настройки"""
+    redis = Redis(
+        host=env.get("REDIS_HOST", settings.redis_host),
+        port=int(env.get("REDIS_PORT", settings.redis_port)),
+        password=env.get("REDIS_PASSWORD", settings.redis_password) or None,
+        db=int(env.get("REDIS_DB", settings.redis_db))
+    )
+    try:
+        keys = [key async for key in redis.scan_iter(match=f"{STARTUP_READY_KEY}:*")]
+        if keys:
+            await redis.delete(*keys)
+    finally:
+        await redis.aclose()
+
+
+async def cold_start(env: Dict[str, str], timeout: float) -> Dict[str, Any]:
+    """Один запуск приложения: время до готовности и этапы запуска"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"
+        ],
+        env={**os.environ, **env, "WEBHOOK_URL": f"http://127.0.0.1:{port}"}
+    )
+    try:
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Application exited with code {process.returncode}")
+                try:
+                    async with session.get(f"http://127.0.0.1:{port}/ready") as response:
+                        if response.status == 200:
+                            ready_ms = (time.perf_counter() - started) * 1000
+                            async with session.get(f"http://127.0.0.1:{port}/health") as health:
+                                startup_ms = (await health.json()).get("startup_ms")
+                            return {"ready_ms": round(ready_ms, 1), "startup_ms": startup_ms}
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.02)
+        raise RuntimeError("Application did not become ready")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main(args):
+    fake_api = FakeBotAPI(0, 0)
+    await fake_api.start(port=args.bot_api_port)
+    
+    services = EphemeralServices() if args.ephemeral else None
+    try:
+        env = {
+            "BOT_TOKEN": BENCH_BOT_TOKEN,
+            "TELEGRAM_API_SERVER": f"http://127.0.0.1:{args.bot_api_port}",
+            "WEBHOOKS_ENABLED": "false"
+        }
+        if services:
+            env.update(services.start())
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            cwd=PROJECT_ROOT, env={**os.environ, **env}, check=True
+        )
+        
+        report = {}
+        for mode, mode_env in MODES.items():
+            runs = []
+            for _ in range(args.runs):
+                await reset_ready(env)
+                runs.append(await cold_start({**env, **mode_env}, args.timeout))
+            ready = sorted(run["ready_ms"] for run in runs)
+            report[mode] = {
+                "runs": len(runs),
+                "p50_ready_ms": ready[len(ready) // 2],
+                "max_ready_ms": ready[-1],
+                "startup_ms": runs[-1]["startup_ms"]
+            }
+    finally:
+        if services:
+            services.stop()
+        await fake_api.stop()
+    
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ephemeral", action="store_true")
+    parser.add_argument("--runs", type=int, default=5, help="запусков в каждом режиме")
+    parser.add_argument("--timeout", type=float, default=60, help="секунд на запуск")
+    parser.add_argument("--bot-api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
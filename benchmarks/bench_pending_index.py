@@ -0,0 +1,158 @@
+"""
+Бенчмарк создания запроса на авторизацию при большом числе активных запросов.
+
+Заполняет Redis фиктивными активными запросами (100 ... 1M) и замеряет
+латентность атомарного резервирования слота (RedisService.reserve_auth_request).
+Латентность не должна зависеть от общего количества активных запросов.
+
+Бенчмарк работает в отдельной базе Redis (--redis-db, по умолчанию 15) и
+не запускается, если она не пуста. Скрипт резервирования пишет не только
+запрос и индекс пользователя, но и журнал событий, сроки и поток истории,
+поэтому при очистке из них удаляются записи пробных запросов всех шардов.
+Событие в канал pub/sub (он общий для всех баз) отменить нельзя, у пробных
+событий нет client_id. В Redis Cluster база одна: --force.
+
+Запуск (нужен доступный Redis из .env):
+    python -m benchmarks.bench_pending_index --sizes 100 10000 1000000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from app.config import settings
+from app.services.redis_backend import is_cluster
+from app.services.redis_service import (
+    redis_service,
+    AUTH_REQUEST_KEY,
+    USER_PENDING_KEY,
+    AUTH_EVENTS_LOG_KEY,
+    AUTH_HISTORY_STREAM_KEY,
+    AUTH_DEADLINES_KEY
+)
+
+
+BENCH_PREFIX = "bench-"
+FILL_BATCH = 10_000
+BENCH_TELEGRAM_BASE = 9_000_000_000
+# Пользователи пробных запросов - после заполняющих, в том же диапазоне 9000??????
+BENCH_PROBE_TELEGRAM_BASE = BENCH_TELEGRAM_BASE + 900_000
+
+
+async def fill_pending(current: int, target: int, ttl: int):
+    """Дозаполнение Redis фиктивными активными запросами до target"""
+    now = int(time.time())
+    while current < target:
+        batch = min(FILL_BATCH, target - current)
+        async with redis_service.redis.pipeline(transaction=False) as pipe:
+            for i in range(current, current + batch):
+                request_id = f"{BENCH_PREFIX}{i}"
+                telegram_id = BENCH_TELEGRAM_BASE + i // 3
+                pipe.set(
+                    redis_service._request_key(request_id),
+                    '{"status": "pending"}',
+                    ex=ttl
+                )
+                pipe.zadd(
+                    redis_service._pending_index_key(telegram_id),
+                    {request_id: now + ttl}
+                )
+            await pipe.execute()
+        current += batch
+
+
+async def measure_create(samples: int) -> list:
+    """Замер латентности резервирования для новых пользователей"""
+    latencies = []
+    for i in range(samples):
+        telegram_id = BENCH_PROBE_TELEGRAM_BASE + i
+        # id оканчивается на id из new_request_id, чтобы шард запроса совпал с шардом пользователя
+        request_id = f"{BENCH_PREFIX}probe-{redis_service.new_request_id(telegram_id)}"
+        payload = {'request_id': request_id, 'telegram_id': telegram_id, 'status': 'pending'}
+        
+        started = time.perf_counter()
+        await redis_service.reserve_auth_request(request_id, telegram_id, payload)
+        latencies.append((time.perf_counter() - started) * 1000)
+        
+        await redis_service.discard_auth_request(request_id, telegram_id)
+    return latencies
+
+
+def is_bench_entry(fields: dict) -> bool:
+    """Запись потока (событие или изменение для БД) относится к запросу бенчмарка"""
+    try:
+        return json.loads(fields.get('data', '{}')).get('request_id', '').startswith(BENCH_PREFIX)
+    except (ValueError, AttributeError):
+        return False
+
+
+async def delete_bench_entries(stream: str):
+    """Удаление записей пробных запросов из потока (чтение порциями)"""
+    start = "-"
+    while True:
+        entries = await redis_service.redis.xrange(stream, min=start, count=FILL_BATCH)
+        ids = [entry_id for entry_id, fields in entries if fields and is_bench_entry(fields)]
+        if ids:
+            await redis_service.redis.xdel(stream, *ids)
+        if len(entries) < FILL_BATCH:
+            return
+        start = f"({entries[-1][0]}"
+
+
+async def cleanup():
+    """Удаление всех ключей бенчмарка и записей пробных запросов во всех шардах"""
+    redis = redis_service.redis
+    for shard in redis_service.shards:
+        patterns = (
+            f"{redis_service.shard_key(AUTH_REQUEST_KEY, shard)}:{BENCH_PREFIX}*",
+            f"{redis_service.shard_key(USER_PENDING_KEY, shard)}:9000??????"
+        )
+        for pattern in patterns:
+            async for key in redis.scan_iter(match=pattern, count=FILL_BATCH):
+                await redis.delete(key)
+        
+        deadlines = redis_service.shard_key(AUTH_DEADLINES_KEY, shard)
+        probes = [member async for member, _ in redis.zscan_iter(deadlines, match=f"{BENCH_PREFIX}*")]
+        if probes:
+            await redis.zrem(deadlines, *probes)
+        
+        for stream in (AUTH_EVENTS_LOG_KEY, AUTH_HISTORY_STREAM_KEY):
+            await delete_bench_entries(redis_service.shard_key(stream, shard))
+
+
+async def main(sizes: list, samples: int, ttl: int, redis_db: int, force: bool):
+    settings.redis_db = redis_db
+    await redis_service.connect()
+    if not force and (is_cluster() or await redis_service.redis.dbsize()):
+        await redis_service.disconnect()
+        raise SystemExit(
+            f"Redis database {redis_db} is not empty or shared (cluster): "
+            f"use an empty --redis-db or --force"
+        )
+    try:
+        current = 0
+        print(f"{'pending':>10} {'p50, ms':>10} {'p99, ms':>10} {'max, ms':>10}")
+        for size in sorted(sizes):
+            await fill_pending(current, size, ttl)
+            current = size
+            latencies = sorted(await measure_create(samples))
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(
+                f"{size:>10} {statistics.median(latencies):>10.3f} "
+                f"{p99:>10.3f} {latencies[-1]:>10.3f}"
+            )
+    finally:
+        await cleanup()
+        await redis_service.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--ttl", type=int, default=600)
+    parser.add_argument("--redis-db", type=int, default=15, help="отдельная пустая база Redis")
+    parser.add_argument("--force", action="store_true", help="запуск в непустой базе")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.samples, args.ttl, args.redis_db, args.force))
@@ -0,0 +1,67 @@
+"""
+Бенчмарк накладных расходов ограничения частоты запросов.
+
+Выполняет проверку лимитов в том виде, как ее делает POST /api/v1/auth/request
+(API ключ, client_id, telegram_id - один вызов Lua-скрипта, в Redis Cluster -
+по вызову на субъект), с заданным
+числом параллельных задач и печатает p50/p99 времени проверки и число
+проверок в секунду. Лимиты на время теста поднимаются, чтобы отказов не было.
+
+Запуск (нужен доступный Redis из .env):
+    python -m benchmarks.bench_rate_limit --checks 20000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services.rate_limit_service import rate_limiter
+
+
+async def main(args):
+    settings.rate_limit_api_key = "1000000/1:1000000"
+    settings.rate_limit_client = "1000000/1:1000000"
+    settings.rate_limit_telegram = "1000000/1:1000000"
+    await redis_service.connect()
+    
+    latencies = []
+    
+    async def worker(offset: int):
+        for i in range(offset, args.checks, args.concurrency):
+            started = time.perf_counter()
+            await rate_limiter.check([
+                ('api_key', 'bench', 1),
+                ('client', f"bench-{i % args.clients}", 1),
+                ('telegram', str(i % args.clients), 1)
+            ])
+            latencies.append(time.perf_counter() - started)
+    
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(offset) for offset in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+        
+        latencies.sort()
+        print(json.dumps({
+            "checks": len(latencies),
+            "concurrency": args.concurrency,
+            "checks_per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3)
+        }, indent=2))
+    finally:
+        keys = [key async for key in redis_service.redis.scan_iter(match="ratelimit:*bench*")]
+        keys += [rate_limiter._key('telegram', i) for i in range(args.clients)]
+        for start in range(0, len(keys), 1000):
+            await redis_service.redis.delete(*keys[start:start + 1000])
+        await redis_service.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checks", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,144 @@
+"""
+Бенчмарк формата записи запроса в Redis.
+
+Сравнивает прежний формат (одна JSON-строка, stdlib json) с HASH-раскладкой
+(отдельные поля + metadata в orjson, app.services.record_codec):
+  - CPU: кодирование, декодирование и смена статуса одной записи;
+  - память Redis: INFO used_memory до и после записи N ключей каждого формата,
+    байт на запрос.
+msgpack участвует в замере CPU, если установлен.
+
+Запуск (нужен доступный Redis из .env, лучше отдельная база):
+    python -m benchmarks.bench_record_codec --keys 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+
+import orjson
+
+from app.services.record_codec import encode_record, decode_record
+from app.services.redis_service import redis_service
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+BENCH_PREFIX = "bench-codec-"
+FILL_BATCH = 10_000
+
+
+def sample_record(i: int = 0) -> dict:
+    """Типичная запись запроса на авторизацию"""
+    return {
+        'request_id': str(uuid.uuid4()),
+        'client_id': f"client-{i}",
+        'telegram_id': 100_000_000 + i,
+        'operation': "Вход в личный кабинет",
+        'amount': "1500.00",
+        'status': 'pending',
+        'delivery_status': 'sent',
+        'message_id': 1000 + i,
+        'created_at': datetime.now().isoformat(),
+        'metadata': {'ip': '10.0.0.1', 'device': 'web', 'session': uuid.uuid4().hex}
+    }
+
+
+def measure(func, iterations: int) -> float:
+    """Среднее время вызова, мкс"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def bench_cpu(iterations: int):
+    record = sample_record()
+    now = datetime.now().isoformat()
+    
+    codecs = {
+        'json (прежний)': (lambda value: json.dumps(value, default=str), json.loads),
+        'orjson (blob)': (lambda value: orjson.dumps(value, default=str), orjson.loads),
+        'hash + orjson': (encode_record, decode_record),
+    }
+    if msgpack is not None:
+        codecs['msgpack (blob)'] = (lambda value: msgpack.packb(value, default=str), msgpack.unpackb)
+    
+    print(f"{'format':>16} {'encode, us':>11} {'decode, us':>11} {'status, us':>11} {'size, B':>8}")
+    for name, (encode, decode) in codecs.items():
+        encoded = encode(record)
+        if isinstance(encoded, dict):
+            # Смена статуса - запись двух полей, без разбора записи
+            change = lambda: encode({'status': 'approved', 'approved_at': now})
+            size = sum(len(field) + len(value) for field, value in encoded.items())
+        else:
+            # Смена статуса - разбор и сериализация всей записи
+            change = lambda: encode(decode(encoded) | {'status': 'approved', 'approved_at': now})
+            size = len(encoded)
+        print(
+            f"{name:>16} {measure(lambda: encode(record), iterations):>11.2f} "
+            f"{measure(lambda: decode(encoded), iterations):>11.2f} "
+            f"{measure(change, iterations):>11.2f} {size:>8}"
+        )
+
+
+async def used_memory() -> int:
+    info = await redis_service.redis.info('memory')
+    return info['used_memory']
+
+
+async def fill(layout: str, keys: int, ttl: int):
+    for start in range(0, keys, FILL_BATCH):
+        async with redis_service.redis.pipeline(transaction=False) as pipe:
+            for i in range(start, min(start + FILL_BATCH, keys)):
+                key = redis_service._request_key(f"{BENCH_PREFIX}{layout}-{i}")
+                record = sample_record(i)
+                if layout == 'json':
+                    pipe.set(key, json.dumps(record, default=str), ex=ttl)
+                else:
+                    pipe.hset(key, mapping=encode_record(record))
+                    pipe.expire(key, ttl)
+            await pipe.execute()
+
+
+async def cleanup():
+    """Удаление всех ключей бенчмарка"""
+    pattern = redis_service._request_key(f"{BENCH_PREFIX}*")
+    async for key in redis_service.redis.scan_iter(match=pattern, count=FILL_BATCH):
+        await redis_service.redis.delete(key)
+
+
+async def bench_memory(keys: int, ttl: int):
+    await redis_service.connect()
+    try:
+        await cleanup()
+        print(f"\n{'format':>16} {'keys':>10} {'used, MB':>10} {'B/request':>10}")
+        for layout in ('json', 'hash'):
+            before = await used_memory()
+            await fill(layout, keys, ttl)
+            used = await used_memory() - before
+            print(f"{layout:>16} {keys:>10} {used / 1024 / 1024:>10.1f} {used / keys:>10.1f}")
+        
+        report = await redis_service.get_memory_report(sample_size=1000)
+        print(f"\nMEMORY USAGE по выборке: {report['formats']}")
+    finally:
+        await cleanup()
+        await redis_service.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--ttl", type=int, default=3600)
+    parser.add_argument("--cpu-only", action="store_true", help="без замера памяти Redis")
+    args = parser.parse_args()
+    
+    bench_cpu(args.iterations)
+    if not args.cpu_only:
+        asyncio.run(bench_memory(args.keys, args.ttl))
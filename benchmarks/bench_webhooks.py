@@ -0,0 +1,78 @@
+"""
+Бенчмарк пропускной способности доставки webhook'ов.
+
+Поднимает локальный приемник, ставит N заданий в очередь доставок и
+замеряет время, за которое WebhookService доставит их все. Подписка
+подставляется в кеш сервиса напрямую, PostgreSQL не нужен.
+
+Запуск (нужен доступный Redis из .env):
+    python -m benchmarks.bench_webhooks --events 10000 --latency-ms 20 --fail-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.services.redis_service import redis_service
+from app.services.webhook_service import webhook_service, WEBHOOK_QUEUE_KEY, WEBHOOK_DEAD_KEY
+from benchmarks.webhook_receiver import WebhookReceiver
+
+
+BENCH_SECRET = "bench-secret"
+
+
+async def main(args):
+    await redis_service.connect()
+    receiver = WebhookReceiver(BENCH_SECRET, args.latency_ms, args.fail_rate)
+    await receiver.start(port=args.port)
+    
+    try:
+        await redis_service.redis.delete(WEBHOOK_QUEUE_KEY, WEBHOOK_DEAD_KEY)
+        now = time.time()
+        async with redis_service.redis.pipeline(transaction=False) as pipe:
+            for i in range(args.events):
+                job = json.dumps({
+                    'webhook_id': 1,
+                    'event': {'id': f"{int(now * 1000)}-{i}", 'request_id': str(i), 'status': 'approved'},
+                    'attempt': 0
+                })
+                pipe.zadd(WEBHOOK_QUEUE_KEY, {job: now})
+            await pipe.execute()
+        
+        # Подписка без обращения к базе данных
+        webhook_service._webhooks = {
+            1: {'id': 1, 'url': f"http://127.0.0.1:{args.port}/webhook", 'client_id': None, 'secret': BENCH_SECRET}
+        }
+        webhook_service._webhooks_loaded_at = float('inf')
+        
+        started = time.perf_counter()
+        await webhook_service.start()
+        while receiver.delivered < args.events:
+            await asyncio.sleep(0.05)
+            if time.perf_counter() - started > args.max_seconds:
+                break
+        elapsed = time.perf_counter() - started
+        
+        print(json.dumps({
+            "events": args.events,
+            "delivered": receiver.delivered,
+            "failed_attempts": receiver.failed,
+            "bad_signatures": receiver.bad_signatures,
+            "seconds": round(elapsed, 3),
+            "deliveries_per_second": round(receiver.delivered / elapsed, 1)
+        }, indent=2))
+    finally:
+        await webhook_service.stop()
+        await redis_service.redis.delete(WEBHOOK_QUEUE_KEY, WEBHOOK_DEAD_KEY)
+        await receiver.stop()
+        await redis_service.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--max-seconds", type=float, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,348 @@
+"""
+Сквозной нагрузочный тест: создание запроса -> нажатие "Да" -> статус.
+
+Гоняет настоящее FastAPI-приложение. Telegram заменяется локальным
+benchmarks.fake_bot_api (задержка и ответы 429 настраиваются), нажатия
+кнопок синтезируются как обновления callback_query на settings.webhook_path.
+Каждый виртуальный пользователь в цикле:
+  create   - POST /api/v1/auth/request
+  delivery - ожидание sendMessage с кнопками в fake Bot API
+  callback - POST webhook с нажатием "Да"
+  status   - GET /api/v1/auth/status/{id}?wait=..., ожидается approved
+Результат - JSON с пропускной способностью и p50/p95/p99 по каждому этапу.
+
+Режимы:
+  --spawn-app  запустить приложение (uvicorn) с нужными переменными окружения
+  --ephemeral  дополнительно поднять временные Redis и PostgreSQL
+               (нужны redis-server, initdb, pg_ctl в PATH)
+Без --spawn-app приложение должно уже работать на --base-url с
+TELEGRAM_API_SERVER, указывающим на fake Bot API (--bot-api-port).
+
+Запуск:
+    python -m benchmarks.e2e_load --spawn-app --ephemeral --users 50 --duration 60 --output e2e.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+from app.config import settings
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+STAGES = ("create", "delivery", "callback", "status")
+BENCH_TELEGRAM_BASE = 9_100_000_000
+BENCH_BOT_TOKEN = "123456:LOADTEST-fake-token-for-local-bot-api"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StageStats:
+    """Латентности и ошибки одного этапа"""
+    
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+    
+    def record(self, started: float, ok: bool):
+        if ok:
+            self.latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            self.errors += 1
+    
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+        
+        return {
+            "count": len(latencies),
+            "errors": self.errors,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1], 3) if latencies else None
+        }
+
+
+class EphemeralServices:
+    """Временные Redis и PostgreSQL во временном каталоге"""
+    
+    def __init__(self):
+        self.workdir = tempfile.mkdtemp(prefix="e2e-load-")
+        self.redis_port = free_port()
+        self.postgres_port = free_port()
+        self._redis: Optional[subprocess.Popen] = None
+        self._pgdata = os.path.join(self.workdir, "pgdata")
+    
+    def start(self) -> Dict[str, str]:
+        self._redis = subprocess.Popen(
+            ["redis-server", "--port", str(self.redis_port), "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            ["initdb", "-D", self._pgdata, "-U", "bench", "--auth=trust"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [
+                "pg_ctl", "-D", self._pgdata, "-w", "-l", os.path.join(self.workdir, "postgres.log"),
+                "-o", f"-p {self.postgres_port} -k {self.workdir} -c listen_addresses=127.0.0.1",
+                "start"
+            ],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            ["createdb", "-h", "127.0.0.1", "-p", str(self.postgres_port), "-U", "bench", "bench"],
+            check=True
+        )
+        return {
+            "REDIS_HOST": "127.0.0.1",
+            "REDIS_PORT": str(self.redis_port),
+            "REDIS_PASSWORD": "",
+            "REDIS_DB": "0",
+            "POSTGRES_HOST": "127.0.0.1",
+            "POSTGRES_PORT": str(self.postgres_port),
+            "POSTGRES_DB": "bench",
+            "POSTGRES_USER": "bench",
+            "POSTGRES_PASSWORD": "bench"
+        }
+    
+    def stop(self):
+        subprocess.run(["pg_ctl", "-D", self._pgdata, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+        if self._redis:
+            self._redis.terminate()
+            self._redis.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def spawn_app(port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    """Запуск приложения и ожидание готовности /health"""
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"
+        ],
+        env={**os.environ, **env}
+    )
+    async with aiohttp.ClientSession() as session:
+        for _ in range(120):
+            if process.poll() is not None:
+                raise RuntimeError(f"Application exited with code {process.returncode}")
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                    if (await response.json()).get("status") == "healthy":
+                        return process
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Application did not become healthy")
+
+
+def callback_update(update_id: int, telegram_id: int, message: Dict[str, Any], request_id: str) -> Dict[str, Any]:
+    """Обновление Telegram с нажатием кнопки "Да" в сообщении"""
+    user = {"id": telegram_id, "is_bot": False, "first_name": "Load", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(telegram_id),
+            "data": f"auth_approve:{request_id}",
+            "message": {
+                "message_id": message["message_id"],
+                "date": message["date"],
+                "chat": {"id": telegram_id, "type": "private", "first_name": "Load"},
+                "text": message["text"]
+            }
+        }
+    }
+
+
+class LoadTest:
+    def __init__(self, args, fake_api: FakeBotAPI):
+        self.args = args
+        self.fake_api = fake_api
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.completed = 0
+        self.not_approved = 0
+        self._update_id = int(time.time()) * 1000
+        self._headers = {"X-API-Key": args.api_key}
+    
+    def next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+    
+    async def register_clients(self, session: aiohttp.ClientSession):
+        for user in range(self.args.users):
+            telegram_id = BENCH_TELEGRAM_BASE + user
+            async with session.post(
+                f"{self.args.base_url}/api/v1/client/register",
+                json={"client_id": f"load-{telegram_id}", "telegram_id": telegram_id, "first_name": "Load"},
+                headers=self._headers
+            ) as response:
+                if response.status not in (201, 409):
+                    raise RuntimeError(f"Client registration failed: {response.status} {await response.text()}")
+    
+    async def user_loop(self, session: aiohttp.ClientSession, user: int, deadline: float):
+        telegram_id = BENCH_TELEGRAM_BASE + user
+        base_url = self.args.base_url
+        
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            async with session.post(
+                f"{base_url}/api/v1/auth/request",
+                json={
+                    "client_id": f"load-{telegram_id}",
+                    "telegram_id": telegram_id,
+                    "operation": "Нагрузочный тест",
+                    "amount": "1.00"
+                },
+                headers=self._headers
+            ) as response:
+                ok = response.status == 200
+                body = await response.json()
+            self.stats["create"].record(started, ok)
+            if not ok:
+                await asyncio.sleep(0.1)
+                continue
+            request_id = body["request_id"]
+            
+            started = time.perf_counter()
+            message = await self.fake_api.wait_for_message(request_id, self.args.stage_timeout)
+            self.stats["delivery"].record(started, message is not None)
+            if message is None:
+                continue
+            
+            started = time.perf_counter()
+            async with session.post(
+                f"{base_url}{settings.webhook_path}",
+                json=callback_update(self.next_update_id(), telegram_id, message, request_id)
+            ) as response:
+                await response.read()
+                self.stats["callback"].record(started, response.status == 200)
+            
+            started = time.perf_counter()
+            async with session.get(
+                f"{base_url}/api/v1/auth/status/{request_id}",
+                params={"wait": int(self.args.stage_timeout)},
+                headers=self._headers
+            ) as response:
+                ok = response.status == 200
+                status = (await response.json()).get("status") if ok else None
+            self.stats["status"].record(started, ok)
+            if status == "approved":
+                self.completed += 1
+            else:
+                self.not_approved += 1
+    
+    async def run(self) -> Dict[str, Any]:
+        connector = aiohttp.TCPConnector(limit=self.args.users * 2)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await self.register_clients(session)
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            await asyncio.gather(*(
+                self.user_loop(session, user, deadline) for user in range(self.args.users)
+            ))
+            elapsed = time.monotonic() - started
+        
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "app_version": settings.app_version,
+            "config": {
+                "users": self.args.users,
+                "duration": self.args.duration,
+                "workers": self.args.workers,
+                "bot_api_latency_ms": self.args.bot_api_latency_ms,
+                "bot_api_rate_limit_rate": self.args.bot_api_rate_limit_rate
+            },
+            "elapsed_seconds": round(elapsed, 3),
+            "flows_completed": self.completed,
+            "flows_not_approved": self.not_approved,
+            "flows_per_second": round(self.completed / elapsed, 2) if elapsed else None,
+            "stages": {stage: self.stats[stage].summary(elapsed) for stage in STAGES},
+            "fake_bot_api": {"calls": self.fake_api.calls, "rate_limited": self.fake_api.rate_limited}
+        }
+
+
+async def main(args):
+    fake_api = FakeBotAPI(args.bot_api_latency_ms, args.bot_api_rate_limit_rate)
+    await fake_api.start(port=args.bot_api_port)
+    
+    services = EphemeralServices() if args.ephemeral else None
+    app_process = None
+    try:
+        if args.spawn_app:
+            port = free_port()
+            env = {
+                "BOT_TOKEN": BENCH_BOT_TOKEN,
+                "TELEGRAM_API_SERVER": f"http://127.0.0.1:{args.bot_api_port}",
+                "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+                "API_SECRET_KEY": args.api_key,
+                "TELEGRAM_RATE_LIMIT": str(args.telegram_rate_limit),
+                "TELEGRAM_RATE_BURST": str(args.telegram_rate_limit),
+                "TELEGRAM_CHAT_INTERVAL": str(args.telegram_chat_interval),
+                "WEBHOOKS_ENABLED": "false"
+            }
+            if services:
+                env.update(services.start())
+            app_process = await spawn_app(port, args.workers, env)
+            args.base_url = f"http://127.0.0.1:{port}"
+        
+        report = await LoadTest(args, fake_api).run()
+    finally:
+        if app_process:
+            app_process.terminate()
+            app_process.wait()
+        if services:
+            services.stop()
+        await fake_api.stop()
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default=f"http://127.0.0.1:{settings.app_port}")
+    parser.add_argument("--api-key", default=os.environ.get("API_SECRET_KEY", "load-test-key"))
+    parser.add_argument("--spawn-app", action="store_true")
+    parser.add_argument("--ephemeral", action="store_true")
+    parser.add_argument("--workers", type=int, default=1, help="процессов uvicorn при --spawn-app")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="секунд")
+    parser.add_argument("--stage-timeout", type=float, default=10, help="секунд на этап")
+    parser.add_argument("--bot-api-port", type=int, default=8081)
+    parser.add_argument("--bot-api-latency-ms", type=float, default=0)
+    parser.add_argument("--bot-api-rate-limit-rate", type=float, default=0, help="доля ответов 429")
+    parser.add_argument("--telegram-rate-limit", type=float, default=1000, help="лимит отправки приложения")
+    parser.add_argument("--telegram-chat-interval", type=float, default=0, help="пауза между сообщениями в чат")
+    parser.add_argument("--output", help="файл для JSON-отчета")
+    args = parser.parse_args()
+    if args.ephemeral:
+        args.spawn_app = True
+    asyncio.run(main(args))
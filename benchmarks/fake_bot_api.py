@@ -0,0 +1,152 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Принимает вызовы вида POST /bot<token>/<method> (sendMessage,
+editMessageText, editMessageReplyMarkup, answerCallbackQuery, setWebhook,
+deleteWebhook и др.), отвечает в формате Bot API, умеет имитировать задержку
+и ответы 429 с retry_after. Отправленные запросы на авторизацию
+запоминаются, чтобы тест мог нажать кнопку в "сообщении".
+
+Приложение направляется сюда настройкой TELEGRAM_API_SERVER.
+
+Запуск:
+    python -m benchmarks.fake_bot_api --port 8081 --latency-ms 30 --rate-limit-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Any, Optional
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """Имитация Bot API с задержкой и ответами 429"""
+    
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        rate_limit_rate: float = 0,
+        retry_after: int = 1
+    ):
+        self.latency_ms = latency_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._next_message_id = 1
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/stats", self.stats)
+        self._runner = None
+    
+    def _message(self, chat_id: int, text: str = "", reply_markup: Any = None) -> Dict[str, Any]:
+        message = {
+            "message_id": self._next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        self._next_message_id += 1
+        return message
+    
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = dict(await request.post())
+        for key in ("reply_markup", "allowed_updates"):
+            if isinstance(params.get(key), str):
+                params[key] = json.loads(params[key])
+        return params
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        
+        if method in ("sendMessage", "editMessageText") and random.random() < self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, status=429)
+        
+        if method == "sendMessage":
+            result = self._message(params["chat_id"], params.get("text", ""), params.get("reply_markup"))
+            self._remember(result)
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._message(params["chat_id"], params.get("text", ""))
+            result["message_id"] = int(params["message_id"])
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+        else:
+            # answerCallbackQuery, setWebhook, deleteWebhook, ...
+            result = True
+        
+        return web.json_response({"ok": True, "result": result})
+    
+    def _remember(self, message: Dict[str, Any]):
+        """Запоминаем сообщение с кнопками запроса на авторизацию"""
+        for row in (message.get("reply_markup") or {}).get("inline_keyboard", []):
+            for button in row:
+                data = button.get("callback_data", "")
+                if data.startswith("auth_approve:"):
+                    request_id = data.split(":", 1)[1]
+                    self.messages[request_id] = message
+                    waiter = self._waiters.pop(request_id, None)
+                    if waiter and not waiter.done():
+                        waiter.set_result(message)
+    
+    async def wait_for_message(self, request_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Ожидание сообщения с запросом на авторизацию request_id"""
+        if request_id in self.messages:
+            return self.messages.pop(request_id)
+        future = self._waiters.setdefault(request_id, asyncio.get_running_loop().create_future())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(request_id, None)
+            self.messages.pop(request_id, None)
+    
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "rate_limited": self.rate_limited})
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main(args):
+    api = FakeBotAPI(args.latency_ms, args.rate_limit_rate, args.retry_after)
+    await api.start(args.host, args.port)
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""
+Локальный приемник webhook'ов для тестов и бенчмарков.
+
+Проверяет HMAC-подпись, считает доставки и умеет имитировать задержку
+и ошибки получателя. Статистика доступна по GET /stats.
+
+Запуск:
+    python -m benchmarks.webhook_receiver --port 9000 --secret <secret> --latency-ms 20 --fail-rate 0.1
+"""
+import argparse
+import asyncio
+import hmac
+import random
+import time
+
+from aiohttp import web
+
+from app.services.webhook_service import sign_payload
+
+
+class WebhookReceiver:
+    """Приемник webhook'ов с имитацией задержки и ошибок"""
+    
+    def __init__(self, secret: str, latency_ms: float = 0, fail_rate: float = 0):
+        self.secret = secret
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.delivered = 0
+        self.failed = 0
+        self.bad_signatures = 0
+        self.event_ids = set()
+        self.started_at = time.monotonic()
+        self.app = web.Application()
+        self.app.router.add_post("/webhook", self.handle)
+        self.app.router.add_get("/stats", self.stats)
+        self._runner = None
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        timestamp = request.headers.get("X-Webhook-Timestamp", "")
+        signature = request.headers.get("X-Webhook-Signature", "")
+        expected = f"sha256={sign_payload(self.secret, timestamp, body)}"
+        if not hmac.compare_digest(signature, expected):
+            self.bad_signatures += 1
+            return web.Response(status=401)
+        
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        
+        if random.random() < self.fail_rate:
+            self.failed += 1
+            return web.Response(status=503)
+        
+        self.delivered += 1
+        self.event_ids.add(request.headers.get("X-Webhook-Event-Id"))
+        return web.Response(status=204)
+    
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "delivered": self.delivered,
+            "unique_events": len(self.event_ids),
+            "failed": self.failed,
+            "bad_signatures": self.bad_signatures,
+            "uptime": time.monotonic() - self.started_at
+        })
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 9000):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main(args):
+    receiver = WebhookReceiver(args.secret, args.latency_ms, args.fail_rate)
+    await receiver.start(args.host, args.port)
+    print(f"Webhook receiver listening on http://{args.host}:{args.port}/webhook")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    asyncio.run(main(parser.parse_args()))
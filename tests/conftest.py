@@ -0,0 +1,47 @@
+"""
+Общие фикстуры тестов.
+
+Redis заменяется fakeredis (Lua-скрипты выполняются через lupa), PostgreSQL
+и Telegram в тестах не используются. Настройки читаются при импорте
+app.config, поэтому обязательные переменные окружения задаются до импорта
+приложения.
+"""
+import os
+
+os.environ.setdefault("BOT_TOKEN", "123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi")
+os.environ.setdefault("WEBHOOK_URL", "https://example.com")
+os.environ.setdefault("POSTGRES_HOST", "localhost")
+os.environ.setdefault("POSTGRES_DB", "telegram_auth_test")
+os.environ.setdefault("POSTGRES_USER", "postgres")
+os.environ.setdefault("POSTGRES_PASSWORD", "postgres")
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("API_SECRET_KEY", "test_secret_api_key_minimum_32_characters_long")
+
+import fakeredis
+import pytest
+
+import app.services.redis_service as redis_service_module
+from app.services.redis_service import redis_service
+from app.services.rate_limit_service import rate_limiter
+from app.services.idempotency_service import idempotency_service
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis(monkeypatch):
+    """
+    redis_service, подключенный к пустому fakeredis. Соединения привязаны
+    к циклу событий теста, поэтому клиент и Lua-скрипты создаются заново.
+    """
+    client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_service_module, "create_client", lambda **options: client)
+    monkeypatch.setattr(redis_service, "redis", None)
+    monkeypatch.setattr(rate_limiter, "_script", None)
+    monkeypatch.setattr(idempotency_service, "_release_script", None)
+    await redis_service.connect()
+    yield client
+    await client.aclose()
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from app.bot.sender import telegram_sender
+from app.config import settings
+from app.services.auth_service import auth_service
+from app.services.redis_service import redis_service, AUTH_DEADLINES_KEY, AUTH_HISTORY_STREAM_KEY
+from app.services.rollup_service import rollup_service
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def failing_sender(monkeypatch):
+    """Очередь отправки недоступна, история пишется через поток (без БД)"""
+    monkeypatch.setattr(settings, "db_write_behind", True)
+    monkeypatch.setattr(rollup_service, "_counters", {})
+
+    async def enqueue(**job):
+        raise ConnectionError("send queue is down")
+
+    async def enqueue_many(jobs):
+        raise ConnectionError("send queue is down")
+
+    monkeypatch.setattr(telegram_sender, "enqueue", enqueue)
+    monkeypatch.setattr(telegram_sender, "enqueue_many", enqueue_many)
+
+
+async def assert_nothing_left(redis):
+    assert await redis.keys(f"{redis_service._request_key('')}*") == []
+    assert await redis.zcard(redis_service._pending_index_key(42)) == 0
+    assert await redis.zcard(AUTH_DEADLINES_KEY) == 0
+    assert rollup_service._counters == {}
+    # Каждой записи в историю соответствует ее удаление
+    ops = [fields['op'] for _, fields in await redis.xrange(AUTH_HISTORY_STREAM_KEY)]
+    assert ops.count('insert') == ops.count('delete')
+
+
+async def test_failed_enqueue_discards_reserved_request(redis, failing_sender):
+    with pytest.raises(ConnectionError):
+        await auth_service.create_auth_request("acme", 42, "Вход")
+
+    await assert_nothing_left(redis)
+    (_, insert), (_, discard) = await redis.xrange(AUTH_HISTORY_STREAM_KEY)
+    assert json.loads(discard['data'])['request_id'] == json.loads(insert['data'])['request_id']
+
+
+async def test_failed_batch_enqueue_discards_reserved_requests(redis, failing_sender, monkeypatch):
+    class Rows:
+        def __init__(self, rows):
+            self._rows = rows
+
+        def all(self):
+            return self._rows
+
+    class Session:
+        """Клиенты "в БД": все принадлежат пользователю 42"""
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+        async def execute(self, query):
+            return Rows([("acme", 42)])
+
+    monkeypatch.setattr("app.services.auth_service.async_session", Session)
+    items = [{'client_id': "acme", 'telegram_id': 42, 'operation': "Вход"} for _ in range(3)]
+    with pytest.raises(ConnectionError):
+        await auth_service.create_auth_requests_batch(items)
+
+    await assert_nothing_left(redis)
+    assert len(await redis.xrange(AUTH_HISTORY_STREAM_KEY)) == 6
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from app.config import settings
+from app.services.expiry_service import (
+    ExpiryService,
+    EXPIRE_REQUEST_SCRIPT,
+    AUTH_EXPIRED_STREAM_KEY,
+    EXPIRY_GROUP
+)
+from app.services.redis_service import redis_service, AUTH_DEADLINES_KEY
+from app.services.rollup_service import rollup_service
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def expiry(redis, monkeypatch):
+    """Обработчик истечений без БД; правка сообщений в Telegram недоступна"""
+    monkeypatch.setattr(settings, "db_write_behind", True)
+    monkeypatch.setattr(rollup_service, "_counters", {})
+    service = ExpiryService()
+
+    async def remove_buttons(chat_id, message_id):
+        raise ConnectionError("Redis send limiter is down")
+
+    monkeypatch.setattr(service, "_remove_buttons", remove_buttons)
+    return service
+
+
+async def test_edit_failure_does_not_redeliver_batch(expiry, redis):
+    await redis.xgroup_create(AUTH_EXPIRED_STREAM_KEY, EXPIRY_GROUP, id="0", mkstream=True)
+    await redis.xadd(AUTH_EXPIRED_STREAM_KEY, {'data': json.dumps({
+        'request_id': "request-1",
+        'telegram_id': 42,
+        'message_id': 7,
+        'client_id': "acme",
+        'created_at': "2026-10-16T10:00:00+00:00",
+        'expired_at': "2026-10-16T10:05:00+00:00"
+    })})
+    (_, entries), = await redis.xreadgroup(EXPIRY_GROUP, "test", {AUTH_EXPIRED_STREAM_KEY: ">"})
+
+    await expiry._finalize(AUTH_EXPIRED_STREAM_KEY, entries)
+
+    assert await redis.xlen(AUTH_EXPIRED_STREAM_KEY) == 0
+    assert (await redis.xpending(AUTH_EXPIRED_STREAM_KEY, EXPIRY_GROUP))['pending'] == 0
+    assert [counter['expired'] for counter in rollup_service._counters.values()] == [1]
+
+
+@pytest.fixture
+def engine(redis):
+    service = ExpiryService()
+    service._expire_script = redis.register_script(EXPIRE_REQUEST_SCRIPT)
+    return service
+
+
+async def reserve_expired(request_id: str, telegram_id: int = 42):
+    info = {'request_id': request_id, 'telegram_id': telegram_id, 'client_id': "acme", 'status': 'pending'}
+    await redis_service.reserve_auth_request(request_id, telegram_id, info, expire_seconds=-1)
+
+
+async def test_due_requests_expire_once(engine, redis):
+    await reserve_expired("request-1")
+    await reserve_expired("request-2", telegram_id=43)
+
+    assert await engine.expire_due() == 2
+    assert (await redis_service.get_auth_request("request-1"))['status'] == 'expired'
+    assert await redis.zcard(redis_service._pending_index_key(42)) == 0
+    assert await redis.zcard(AUTH_DEADLINES_KEY) == 0
+    assert await redis.xlen(AUTH_EXPIRED_STREAM_KEY) == 2
+    assert await engine.expire_due() == 0
+
+
+async def test_decided_and_missing_requests_only_drop_deadline(engine, redis):
+    await reserve_expired("request-1")
+    await redis_service.transition_auth_request_status("request-1", 42, 'approved')
+    await redis.zadd(AUTH_DEADLINES_KEY, {"request-1": 1, "gone": 1})
+
+    assert await engine.expire_due() == 0
+    assert (await redis_service.get_auth_request("request-1"))['status'] == 'approved'
+    assert await redis.zcard(AUTH_DEADLINES_KEY) == 0
+
+
+async def test_legacy_json_record_expires(engine, redis):
+    info = {'request_id': "request-1", 'telegram_id': 42, 'client_id': "acme", 'status': 'pending'}
+    await redis.set(redis_service._request_key("request-1"), json.dumps(info))
+    await redis.zadd(AUTH_DEADLINES_KEY, {"request-1": 1})
+
+    assert await engine.expire_due() == 1
+    assert (await redis_service.get_auth_request("request-1"))['status'] == 'expired'
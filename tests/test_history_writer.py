@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.services.history_writer import (
+    HistoryWriter,
+    HISTORY_GROUP,
+    RENEW_LEASE_SCRIPT,
+    RELEASE_LEASE_SCRIPT
+)
+from app.services.redis_service import AUTH_HISTORY_STREAM_KEY
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def writers(redis, monkeypatch):
+    """Два процесса записи истории, пачки запоминаются вместо записи в БД"""
+    monkeypatch.setattr(settings, "history_flush_interval", 0.01)
+    applied = []
+
+    def make(consumer: str) -> HistoryWriter:
+        writer = HistoryWriter()
+        writer._consumer = consumer
+        writer._renew_script = redis.register_script(RENEW_LEASE_SCRIPT)
+        writer._release_script = redis.register_script(RELEASE_LEASE_SCRIPT)
+
+        async def apply(stream, entries):
+            applied.append([json.loads(fields['data'])['status'] for _, fields in entries])
+            await redis.xack(stream, HISTORY_GROUP, *[entry_id for entry_id, _ in entries])
+
+        writer._apply = apply
+        return writer
+
+    return make("writer-a"), make("writer-b"), applied
+
+
+async def add_change(redis, op: str, status: str):
+    data = json.dumps({'request_id': "request-1", 'status': status})
+    await redis.xadd(AUTH_HISTORY_STREAM_KEY, {'op': op, 'data': data})
+
+
+async def test_stream_has_single_owner(writers):
+    writer_a, writer_b, _ = writers
+    assert await writer_a._acquire(AUTH_HISTORY_STREAM_KEY)
+    assert not await writer_b._acquire(AUTH_HISTORY_STREAM_KEY)
+    # Владелец продлевает свою аренду
+    assert await writer_a._acquire(AUTH_HISTORY_STREAM_KEY)
+
+
+async def test_new_owner_applies_unacked_entries_first(writers, redis):
+    writer_a, writer_b, applied = writers
+    await redis.xgroup_create(AUTH_HISTORY_STREAM_KEY, HISTORY_GROUP, id="0", mkstream=True)
+
+    # Прежний владелец прочитал INSERT и упал, не записав его
+    await add_change(redis, 'insert', 'pending')
+    await redis.xreadgroup(HISTORY_GROUP, "writer-a", {AUTH_HISTORY_STREAM_KEY: ">"})
+    await add_change(redis, 'update', 'approved')
+
+    assert await writer_b._acquire(AUTH_HISTORY_STREAM_KEY)
+    task = asyncio.create_task(writer_b._consume(AUTH_HISTORY_STREAM_KEY))
+    while len(applied) < 2:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert applied == [['pending'], ['approved']]
@@ -0,0 +1,66 @@
+import pytest
+from fastapi import Response
+
+import app.api.auth as auth_api
+from app.api.auth import AuthRequestCreate, AuthRequestResponse, create_auth_request
+from app.services.api_key_service import LEGACY_KEY
+from app.services.idempotency_service import idempotency_service, request_fingerprint
+from app.services.rate_limit_service import rate_limiter, RatePolicy
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_same_key_of_other_tenants_does_not_collide(redis):
+    await idempotency_service.begin("tenant-a", "order-1", "body-a")
+    await idempotency_service.complete("tenant-a", "order-1", "body-a", 200, {'request_id': "a"})
+
+    # Другой владелец с тем же ключом и другим телом выполняет свой запрос
+    assert await idempotency_service.begin("tenant-b", "order-1", "body-b") is None
+    await idempotency_service.abandon("tenant-b", "order-1")
+    assert (await idempotency_service.begin("tenant-a", "order-1", "body-a"))['body'] == {'request_id': "a"}
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """Созданные запросы вместо обращений к БД и Telegram"""
+    requests = []
+
+    async def create(request):
+        requests.append(request)
+        return AuthRequestResponse(request_id=f"request-{len(requests)}", status="pending", created_at="now")
+
+    monkeypatch.setattr(auth_api, "_create_auth_request", create)
+    return requests
+
+
+async def post(request: AuthRequestCreate, response: Response):
+    return await create_auth_request(request, response, None, LEGACY_KEY, idempotency_key="order-1")
+
+
+async def test_replay_is_not_charged_and_keeps_rate_limit_headers(redis, created):
+    request = AuthRequestCreate(client_id="acme", telegram_id=42, operation="Вход")
+    first = Response()
+    result = await post(request, first)
+    assert first.headers["RateLimit-Remaining"] == "9"
+
+    for _ in range(3):
+        replay = await post(request, Response())
+        assert replay.headers["Idempotent-Replayed"] == "true"
+        assert replay.headers["RateLimit-Remaining"] == "9"
+    assert len(created) == 1
+    assert result.request_id == "request-1"
+
+
+async def test_rate_limited_request_is_not_stored(redis, created, monkeypatch):
+    rate_limiter.policy('client', "acme")
+    monkeypatch.setattr(rate_limiter, "_overrides", {"client:acme": RatePolicy.parse("1/60")})
+    request = AuthRequestCreate(client_id="acme", telegram_id=42, operation="Вход")
+    await create_auth_request(request, Response(), None, LEGACY_KEY)
+
+    with pytest.raises(auth_api.HTTPException) as exc:
+        await post(request, Response())
+    assert exc.value.status_code == 429
+    # Отметка "выполняется" снята, ответ 429 не сохранен
+    fingerprint = request_fingerprint(request.model_dump())
+    assert await idempotency_service.begin(LEGACY_KEY.tenant, "order-1", fingerprint) is None
@@ -0,0 +1,108 @@
+import pytest
+from fastapi import HTTPException, Response
+
+from app.api.auth import AuthRequestCreate
+from app.api.dependencies import enforce_rate_limit, request_subjects
+from app.config import Settings, settings
+from app.services.api_key_service import LEGACY_KEY
+from app.services.rate_limit_service import (
+    rate_limiter,
+    RateLimitExceeded,
+    RateLimitCostExceeded
+)
+
+
+pytestmark = pytest.mark.anyio
+
+
+def make_requests(count: int, client_id: str = None, telegram_id: int = None):
+    return [
+        AuthRequestCreate(
+            client_id=client_id or f"client-{i}",
+            telegram_id=telegram_id or 1000 + i,
+            operation="Вход"
+        )
+        for i in range(count)
+    ]
+
+
+async def test_burst_then_limited(redis):
+    subjects = [('api_key', 'tenant-a', 1, "1/60:3")]
+    for remaining in (2, 1, 0):
+        assert (await rate_limiter.check(subjects))['remaining'] == remaining
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        await rate_limiter.check(subjects)
+    assert exc.value.result['dimension'] == 'api_key'
+    assert exc.value.result['retry_after'] > 0
+
+
+async def test_cost_is_charged_at_once(redis):
+    subjects = [('api_key', 'tenant-a', 2, "1/60:3")]
+    await rate_limiter.check(subjects)
+
+    with pytest.raises(RateLimitExceeded):
+        await rate_limiter.check(subjects)
+    # Отклоненный запрос не списывается
+    assert (await rate_limiter.check([('api_key', 'tenant-a', 1, "1/60:3")]))['remaining'] == 0
+
+
+async def test_rejected_subject_does_not_charge_others(redis):
+    await rate_limiter.check([('client', 'acme', 10)])
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        await rate_limiter.check([('telegram', 42, 1), ('client', 'acme', 1)])
+    assert exc.value.result['dimension'] == 'client'
+    assert (await rate_limiter.check([('telegram', 42, 1)]))['remaining'] == 9
+
+
+async def test_full_size_batch_allowed(redis):
+    requests = make_requests(settings.batch_max_size)
+    result = await rate_limiter.check(request_subjects(LEGACY_KEY, requests))
+    assert result['allowed']
+
+
+async def test_batch_over_client_burst_rejected(redis):
+    response = Response()
+    with pytest.raises(HTTPException) as exc:
+        await enforce_rate_limit(response, request_subjects(LEGACY_KEY, make_requests(11, telegram_id=42)))
+    assert exc.value.status_code == 422
+    assert "telegram rate limit burst 10" in exc.value.detail
+
+    with pytest.raises(RateLimitCostExceeded):
+        await rate_limiter.check([('api_key', 'tenant-a', 4, "1/60:3")])
+
+
+def test_settings_reject_batch_over_api_key_burst():
+    with pytest.raises(ValueError, match="BATCH_MAX_SIZE"):
+        Settings(batch_max_size=600, rate_limit_api_key="200/1:500")
+
+
+@pytest.fixture
+def cluster_layout(monkeypatch):
+    """Раскладка ключей Redis Cluster (fakeredis выполняет ее как один узел)"""
+    monkeypatch.setattr(settings, "redis_mode", "cluster")
+
+
+async def test_cluster_shared_subjects_limited_across_tenants(redis, cluster_layout):
+    for i in range(10):
+        tenant = f"tenant-{i % 2}"
+        await rate_limiter.check([('api_key', tenant, 1, "100/1"), ('telegram', 42, 1)])
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        await rate_limiter.check([('api_key', 'tenant-2', 1, "100/1"), ('telegram', 42, 1)])
+    assert exc.value.result['dimension'] == 'telegram'
+
+
+async def test_cluster_rejection_refunds_other_subjects(redis, cluster_layout):
+    await rate_limiter.check([('client', 'acme', 10)])
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        await rate_limiter.check([('api_key', 'tenant-a', 1, "1/60:3"), ('client', 'acme', 1)])
+    assert exc.value.result['dimension'] == 'client'
+    assert (await rate_limiter.check([('api_key', 'tenant-a', 1, "1/60:3")]))['remaining'] == 2
+
+
+async def test_cluster_keys_are_tagged_per_subject(redis, cluster_layout):
+    await rate_limiter.check([('api_key', 'tenant-a', 1, "100/1"), ('telegram', 42, 1)])
+    assert sorted(await redis.keys("ratelimit:*")) == ["ratelimit:{api_key:tenant-a}", "ratelimit:{telegram:42}"]
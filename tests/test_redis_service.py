@@ -0,0 +1,113 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from redis.asyncio.cluster import RedisCluster, ClusterNode
+
+from app.config import settings
+from app.services.redis_backend import create_pubsub
+from app.services.redis_service import redis_service, AUTH_DEADLINES_KEY
+
+
+pytestmark = pytest.mark.anyio
+
+
+def request_info(request_id: str, telegram_id: int = 42):
+    return {'request_id': request_id, 'telegram_id': telegram_id, 'client_id': "acme", 'status': 'pending'}
+
+
+async def reserve(request_id: str, telegram_id: int = 42, **options) -> bool:
+    return await redis_service.reserve_auth_request(
+        request_id, telegram_id, request_info(request_id, telegram_id), **options
+    )
+
+
+async def test_deadline_written_when_expiry_enabled(redis):
+    await reserve("request-1")
+    deadline = await redis.zscore(AUTH_DEADLINES_KEY, "request-1")
+    assert deadline == pytest.approx(time.time() + settings.auth_request_timeout, abs=2)
+
+
+async def test_no_deadlines_when_expiry_disabled(redis, monkeypatch):
+    monkeypatch.setattr(settings, "expiry_enabled", False)
+    await reserve("request-1")
+    assert await redis.exists(AUTH_DEADLINES_KEY) == 0
+
+
+async def test_deadlines_of_forgotten_requests_are_trimmed(redis):
+    # Срок прошел больше чем на время хранения записи: запроса в Redis уже нет
+    stale = time.time() - settings.expiry_grace_seconds - 10
+    await redis.zadd(AUTH_DEADLINES_KEY, {"stale": stale, "due": time.time() - 1})
+
+    await reserve("request-1")
+    assert await redis.zrange(AUTH_DEADLINES_KEY, 0, -1) == ["due", "request-1"]
+
+
+async def test_reserve_stops_at_pending_limit(redis):
+    assert await reserve("request-1", limit=2)
+    assert await reserve("request-2", limit=2)
+    assert not await reserve("request-3", limit=2)
+    assert await redis_service.get_auth_request("request-3") is None
+    # Лимит считается по пользователю
+    assert await reserve("request-4", telegram_id=43, limit=2)
+
+
+async def test_batch_reserve_respects_limit_within_batch(redis):
+    requests = [request_info(f"request-{i}") for i in range(3)] + [request_info("request-other", 43)]
+    assert await redis_service.reserve_auth_requests_batch(requests, limit=2) == [True, True, False, True]
+
+
+async def test_finished_request_frees_pending_slot(redis):
+    await reserve("request-1", limit=1)
+    assert not await reserve("request-2", limit=1)
+
+    await redis_service.transition_auth_request_status("request-1", 42, 'approved')
+    assert await reserve("request-2", limit=1)
+
+
+async def test_transition_applies_once(redis):
+    await reserve("request-1")
+
+    result = await redis_service.transition_auth_request_status("request-1", 42, 'approved')
+    assert (result['result'], result['old_status'], result['new_status']) == ('ok', 'pending', 'approved')
+    assert result['client_id'] == "acme"
+
+    # Повторное решение (второе нажатие, истечение срока) не меняет статус
+    result = await redis_service.transition_auth_request_status("request-1", 42, 'rejected')
+    assert (result['result'], result['old_status']) == ('conflict', 'approved')
+    assert (await redis_service.get_auth_request("request-1"))['status'] == 'approved'
+
+
+async def test_transition_by_other_user_is_forbidden(redis):
+    await reserve("request-1")
+
+    result = await redis_service.transition_auth_request_status("request-1", 43, 'approved')
+    assert result['result'] == 'forbidden'
+    assert (await redis_service.get_auth_request("request-1"))['status'] == 'pending'
+
+
+async def test_transition_of_unknown_request(redis):
+    result = await redis_service.transition_auth_request_status("missing", 42, 'approved')
+    assert result['result'] == 'not_found'
+
+
+async def test_cluster_pubsub_closes_its_node_pool(monkeypatch):
+    class Cluster(RedisCluster):
+        def __init__(self):
+            pass
+
+        def get_random_node(self):
+            return ClusterNode("redis-node", 7000)
+
+        def get_encoder(self):
+            return SimpleNamespace(decode_responses=True)
+
+    pubsub = create_pubsub(Cluster(), ignore_subscribe_messages=True)
+    disconnects = []
+
+    async def disconnect():
+        disconnects.append(True)
+
+    monkeypatch.setattr(pubsub.connection_pool, "disconnect", disconnect)
+    await pubsub.aclose()
+    assert disconnects == [True]
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+import pytest
+
+from app.services.rollup_service import parse_amount
+
+
+@pytest.mark.parametrize("amount, expected", [
+    ("1500.00", Decimal("1500.00")),
+    ("1.500,00", Decimal("1500.00")),
+    ("1.500,00 ₽", Decimal("1500.00")),
+    ("1 500,00 ₽", Decimal("1500.00")),
+    ("$1,500.00", Decimal("1500.00")),
+    ("1,234,567.89", Decimal("1234567.89")),
+    ("1.234.567,89", Decimal("1234567.89")),
+    ("12,5", Decimal("12.5")),
+    ("1,500", Decimal("1500")),
+    ("1,500,000", Decimal("1500000")),
+    ("1.500.000", Decimal("1500000")),
+])
+def test_parse_amount(amount, expected):
+    assert parse_amount(amount) == expected
+
+
+@pytest.mark.parametrize("amount", [None, "", "бесплатно"])
+def test_parse_amount_without_number(amount):
+    assert parse_amount(amount) is None
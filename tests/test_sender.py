@@ -0,0 +1,105 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app.bot.handlers as handlers
+import app.bot.sender as sender_module
+from app.bot.sender import (
+    TelegramSender,
+    CLAIM_SEND_SCRIPT,
+    ACQUIRE_SEND_SCRIPT,
+    PAUSE_SEND_SCRIPT,
+    SEND_QUEUE_NORMAL_KEY
+)
+from app.config import settings
+from app.services.redis_service import redis_service
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Отправленные сообщения вместо вызовов Bot API"""
+    messages = []
+
+    async def send_auth_request_to_user(**message):
+        messages.append(message)
+        return SimpleNamespace(message_id=len(messages))
+
+    monkeypatch.setattr(handlers, "send_auth_request_to_user", send_auth_request_to_user)
+    return messages
+
+
+@pytest.fixture
+def sender(redis):
+    sender = TelegramSender()
+    sender._claim_script = redis.register_script(CLAIM_SEND_SCRIPT)
+    sender._acquire_script = redis.register_script(ACQUIRE_SEND_SCRIPT)
+    sender._pause_script = redis.register_script(PAUSE_SEND_SCRIPT)
+    return sender
+
+
+async def enqueue(sender: TelegramSender, request_id: str = "request-1", telegram_id: int = 42):
+    """Активный запрос и его задание в очереди отправки"""
+    await redis_service.reserve_auth_request(
+        request_id, telegram_id, {'request_id': request_id, 'telegram_id': telegram_id, 'status': 'pending'}
+    )
+    await sender.enqueue(request_id=request_id, telegram_id=telegram_id, operation="Вход")
+
+
+async def test_expired_lease_is_claimed_again(sender, monkeypatch):
+    await enqueue(sender)
+    claimed = await sender._claim()
+    assert claimed is not None
+    assert await sender._claim() is None
+
+    later = time.time() + settings.telegram_send_lease_seconds + 1
+    monkeypatch.setattr(sender_module, "time", SimpleNamespace(time=lambda: later))
+    assert await sender._claim() == claimed
+
+
+async def test_sent_job_leaves_queue(sender, sent, redis):
+    await enqueue(sender)
+    assert await sender._send(*await sender._claim()) == 0
+    assert [message['request_id'] for message in sent] == ["request-1"]
+    assert await redis.zcard(SEND_QUEUE_NORMAL_KEY) == 0
+
+
+async def test_global_wait_does_not_hold_lease(sender, sent, redis):
+    await sender.pause(settings.telegram_send_lease_seconds * 2)
+    await enqueue(sender)
+    key, raw_job = await sender._claim()
+
+    backoff = await sender._send(key, raw_job)
+    assert backoff > settings.telegram_send_lease_seconds
+    assert sent == []
+    # Задание вернулось в очередь до конца паузы, а не осталось под арендой
+    jobs = await redis.zrange(key, 0, -1, withscores=True)
+    assert [json.loads(job)['request_id'] for job, _ in jobs] == ["request-1"]
+    assert jobs[0][1] > time.time() + settings.telegram_send_lease_seconds
+    assert await sender._claim() is None
+
+
+async def test_chat_wait_reschedules_job(sender, sent, redis):
+    await enqueue(sender, "request-1")
+    await enqueue(sender, "request-2")
+    assert await sender._send(*await sender._claim()) == 0
+
+    # Второе сообщение в тот же чат откладывается, обработчик не ждет
+    assert await sender._send(*await sender._claim()) == 0
+    assert [message['request_id'] for message in sent] == ["request-1"]
+    assert await redis.zcard(SEND_QUEUE_NORMAL_KEY) == 1
+
+
+async def test_finished_request_is_skipped(sender, sent, redis):
+    await enqueue(sender)
+    await redis_service.transition_auth_request_status("request-1", 42, 'expired')
+
+    assert await sender._send(*await sender._claim()) == 0
+    assert sent == []
+    assert await redis.zcard(SEND_QUEUE_NORMAL_KEY) == 0
+    record = await redis_service.get_auth_request("request-1")
+    assert record['delivery_status'] == 'skipped'
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.dependencies import require_client_access
+from app.api.stats import get_decision_stats
+from app.services.api_key_service import ApiKeyInfo
+from app.services.auth_service import auth_service
+from app.services.client_cache import client_cache
+from app.services.rollup_service import rollup_service
+from app.services.webhook_service import WebhookService
+
+
+pytestmark = pytest.mark.anyio
+
+
+TENANT_A = ApiKeyInfo(key_id="key-a", tenant="tenant-a", scopes=frozenset({"auth", "events", "stats"}))
+ADMIN = ApiKeyInfo(key_id="key-admin", tenant="ops", scopes=frozenset({"admin"}))
+
+
+@pytest.fixture
+def clients(redis, monkeypatch):
+    """Клиенты "в БД" по client_id, кеш клиентов пустой"""
+    rows = {
+        "acme": {'client_id': "acme", 'telegram_id': 42, 'tenant': "tenant-a"},
+        "globex": {'client_id': "globex", 'telegram_id': 43, 'tenant': "tenant-b"}
+    }
+
+    async def load_client(client_id):
+        return rows.get(client_id)
+
+    monkeypatch.setattr(auth_service, "_load_client", load_client)
+    monkeypatch.setattr(client_cache, "_entries", OrderedDict())
+    return rows
+
+
+async def test_own_clients_allowed(clients):
+    await require_client_access(TENANT_A, ["acme", "acme"])
+
+
+@pytest.mark.parametrize("client_id", ["globex", "unknown"])
+async def test_foreign_or_unknown_client_forbidden(clients, client_id):
+    with pytest.raises(HTTPException) as exc:
+        await require_client_access(TENANT_A, ["acme", client_id])
+    assert exc.value.status_code == 403
+    assert client_id in exc.value.detail
+
+
+async def test_admin_key_sees_all_tenants(clients):
+    await require_client_access(ADMIN, ["acme", "globex", "unknown"])
+
+
+async def test_lookup_error_is_not_access(clients, monkeypatch):
+    async def load_client(client_id):
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(auth_service, "_load_client", load_client)
+    with pytest.raises(HTTPException) as exc:
+        await require_client_access(TENANT_A, ["acme"])
+    assert exc.value.status_code == 500
+
+
+async def test_tenant_webhook_gets_only_own_clients(clients):
+    service = WebhookService()
+    service._webhooks = {
+        1: {'id': 1, 'client_id': None, 'tenant': None},
+        2: {'id': 2, 'client_id': None, 'tenant': "tenant-a"},
+        3: {'id': 3, 'client_id': "globex", 'tenant': "tenant-b"},
+        4: {'id': 4, 'client_id': None, 'tenant': "tenant-b"}
+    }
+
+    destinations = await service._destinations({'client_id': "acme", 'status': 'approved'})
+    assert [webhook['id'] for webhook in destinations] == [1, 2]
+    destinations = await service._destinations({'client_id': "globex", 'status': 'approved'})
+    assert [webhook['id'] for webhook in destinations] == [1, 3, 4]
+
+
+@pytest.fixture
+def stats_queries(monkeypatch):
+    """Аргументы запросов итогов вместо чтения из БД"""
+    queries = []
+
+    async def get_stats(since, until, client_ids=None, granularity='day', tenant=None):
+        queries.append({'client_ids': client_ids, 'tenant': tenant})
+        return []
+
+    monkeypatch.setattr(rollup_service, "get_stats", get_stats)
+    return queries
+
+
+async def test_stats_of_foreign_client_forbidden(clients, stats_queries):
+    with pytest.raises(HTTPException) as exc:
+        await get_decision_stats(TENANT_A, client_id=["globex"], since=None, until=None, granularity='day')
+    assert exc.value.status_code == 403
+    assert stats_queries == []
+
+
+async def test_stats_without_clients_scoped_to_tenant(clients, stats_queries):
+    await get_decision_stats(TENANT_A, client_id=None, since=None, until=None, granularity='day')
+    await get_decision_stats(TENANT_A, client_id=["acme"], since=None, until=None, granularity='day')
+    await get_decision_stats(ADMIN, client_id=None, since=None, until=None, granularity='day')
+    assert stats_queries == [
+        {'client_ids': None, 'tenant': "tenant-a"},
+        {'client_ids': ["acme"], 'tenant': None},
+        {'client_ids': None, 'tenant': None}
+    ]
@@ -0,0 +1,186 @@
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.services.auth_service import auth_service
+from app.services.expiry_service import ExpiryService, EXPIRE_REQUEST_SCRIPT
+from app.services.redis_service import redis_service, AUTH_EVENTS_LOG_KEY, WEBHOOK_OUTBOX_KEY
+from app.services.webhook_service import (
+    WebhookService,
+    WEBHOOK_GROUP,
+    WEBHOOK_QUEUE_KEY,
+    WEBHOOK_DEAD_KEY
+)
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    """HTTP клиент, запоминающий отправленные уведомления"""
+
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data, headers):
+        self.posts.append((url, json.loads(data)))
+        return FakeResponse(200)
+
+
+@pytest.fixture
+def webhooks():
+    """Активные подписки "в БД" по id"""
+    return {}
+
+
+@pytest.fixture
+def service(redis, webhooks, monkeypatch):
+    service = WebhookService()
+    service._session = FakeSession()
+    service.fetches = 0
+
+    async def fetch_webhooks():
+        service.fetches += 1
+        await asyncio.sleep(0)
+        return dict(webhooks)
+
+    monkeypatch.setattr(service, "_fetch_webhooks", fetch_webhooks)
+    return service
+
+
+def webhook(webhook_id: int, client_id: str = None, tenant: str = None):
+    return {
+        'id': webhook_id,
+        'url': f"https://hooks.example/{webhook_id}",
+        'client_id': client_id,
+        'tenant': tenant,
+        'secret': "s"
+    }
+
+
+async def queue_job(webhook_id: int, event_id: str = "1-0") -> str:
+    raw_job = json.dumps({
+        'webhook_id': webhook_id,
+        'event': {'id': event_id, 'request_id': "request-1", 'status': 'approved'},
+        'attempt': 0
+    })
+    await redis_service.redis.zadd(redis_service.shard_key(WEBHOOK_QUEUE_KEY, 0), {raw_job: 0})
+    return raw_job
+
+
+async def test_cache_miss_reloads_webhooks(service, webhooks, redis):
+    await service._load_webhooks()
+    # Подписка добавлена после загрузки кеша (например, другим процессом)
+    webhooks[7] = webhook(7)
+
+    await service._deliver(0, await queue_job(7))
+    assert [url for url, _ in service._session.posts] == ["https://hooks.example/7"]
+    assert await redis.zcard(WEBHOOK_QUEUE_KEY) == 0
+    assert await redis.llen(WEBHOOK_DEAD_KEY) == 0
+
+
+async def test_missing_webhook_is_dead_lettered(service, redis):
+    await service._deliver(0, await queue_job(7))
+
+    assert service._session.posts == []
+    assert await redis.zcard(WEBHOOK_QUEUE_KEY) == 0
+    dead = [json.loads(job) for job in await redis.lrange(WEBHOOK_DEAD_KEY, 0, -1)]
+    assert [(job['webhook_id'], job['error']) for job in dead] == [(7, "webhook not found")]
+
+
+async def test_concurrent_misses_share_one_reload(service, webhooks):
+    await service._load_webhooks()
+    webhooks[7] = webhook(7)
+    service.fetches = 0
+
+    jobs = [await queue_job(7, f"{i}-0") for i in range(5)]
+    await asyncio.gather(*[service._deliver(0, raw_job) for raw_job in jobs])
+    assert service.fetches == 1
+    assert len(service._session.posts) == 5
+
+
+async def decide(request_id: str, status: str = 'approved'):
+    info = {'request_id': request_id, 'telegram_id': 42, 'client_id': "acme", 'status': 'pending'}
+    await redis_service.reserve_auth_request(request_id, 42, info)
+    await redis_service.transition_auth_request_status(request_id, 42, status)
+
+
+async def test_outbox_delivers_events_written_before_group(service, webhooks, redis):
+    webhooks[7] = webhook(7)
+    await decide("request-1")
+
+    await service._create_groups()
+    response = await redis.xreadgroup(WEBHOOK_GROUP, "test", {WEBHOOK_OUTBOX_KEY: ">"})
+    await service._enqueue(0, response[0][1])
+
+    jobs = [json.loads(job) for job in await redis.zrange(WEBHOOK_QUEUE_KEY, 0, -1)]
+    assert [(job['webhook_id'], job['event']['status']) for job in jobs] == [(7, 'approved')]
+    # id события совпадает с id в журнале событий (SSE)
+    (log_id, _), = await redis.xrevrange(AUTH_EVENTS_LOG_KEY, count=1)
+    assert jobs[0]['event']['id'] == log_id
+    # Поставленные в очередь записи удаляются из исходящих
+    assert await redis.xlen(WEBHOOK_OUTBOX_KEY) == 0
+
+
+async def test_outbox_is_not_trimmed_with_events_log(redis, monkeypatch):
+    monkeypatch.setattr(settings, "events_log_maxlen", 1)
+    for i in range(5):
+        await decide(f"request-{i}")
+    assert await redis.xlen(WEBHOOK_OUTBOX_KEY) == 5
+
+
+async def test_outbox_not_written_when_webhooks_disabled(redis, monkeypatch):
+    monkeypatch.setattr(settings, "webhooks_enabled", False)
+    await decide("request-1")
+    assert await redis.exists(WEBHOOK_OUTBOX_KEY) == 0
+
+
+async def test_expired_requests_reach_outbox(redis):
+    expiry = ExpiryService()
+    expiry._expire_script = redis.register_script(EXPIRE_REQUEST_SCRIPT)
+    info = {'request_id': "request-1", 'telegram_id': 42, 'client_id': "acme", 'status': 'pending'}
+    await redis_service.reserve_auth_request("request-1", 42, info, expire_seconds=-1)
+
+    assert await expiry.expire_due() == 1
+    (_, fields), = await redis.xrange(WEBHOOK_OUTBOX_KEY)
+    assert json.loads(fields['data'])['status'] == 'expired'
+
+
+async def test_host_limits_dropped_after_delivery(service, webhooks):
+    webhooks[7] = webhook(7)
+    await service._load_webhooks()
+
+    jobs = [await queue_job(7, f"{i}-0") for i in range(3)]
+    await asyncio.gather(*[service._deliver(0, raw_job) for raw_job in jobs])
+    assert len(service._session.posts) == 3
+    assert service._host_limits == {}
+
+
+async def test_failed_destination_lookup_keeps_outbox_entries(service, webhooks, redis, monkeypatch):
+    webhooks[7] = webhook(7, tenant="tenant-a")
+    await decide("request-1")
+    await service._create_groups()
+    response = await redis.xreadgroup(WEBHOOK_GROUP, "test", {WEBHOOK_OUTBOX_KEY: ">"})
+
+    async def get_client_tenant(client_id):
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(auth_service, "get_client_tenant", get_client_tenant)
+    with pytest.raises(ConnectionError):
+        await service._enqueue(0, response[0][1])
+    # Ничего не поставлено и не подтверждено: записи заберет XAUTOCLAIM
+    assert await redis.zcard(WEBHOOK_QUEUE_KEY) == 0
+    assert await redis.xlen(WEBHOOK_OUTBOX_KEY) == 1